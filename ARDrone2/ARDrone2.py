@@ -1,11 +1,24 @@
 # -*- coding: utf-8 -*-
+import collections
 import threading
 import time
 
 from ATCommand import ATCommand
+from ATEncoder import ATEncoder
+from CommandQueue import CommandQueue
+from DroneConfig import DroneConfig
 from NavData import NavData
+from NavDataOptions import NavDataOptions
 from Control import Control
-from Video import Video
+from UDPTransport import UDPTransport
+
+try:
+    from NavDataHistory import NavDataHistory
+except ImportError:
+    NavDataHistory = None
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
 
 class ARDrone2:
     """API for the Parrot ARDRone2
@@ -18,72 +31,197 @@ class ARDrone2:
         drone.Stop()
     """
     COMMAND_DELAY = 0.01    # Critical for timing... adjust if necessary
-
-    def __init__(self, address, debug, navdataCallback=None, videoCallback=None):
+    HISTORY_SIZE = 4096     # navdata samples to keep (~4.5 min in demo mode)
+    AT_FLUSH_WINDOW = 0.005 # AT commands within this window share a datagram
+    PCMD_PERIOD = 0.03      # movement commands every 30 ms (Developer Guide)
+    ACK_TIMEOUT = 5.0       # max seconds for a config command round trip
+    ACK_RETRY = 0.05        # resend ClearCommandAck if not cleared in this time
+    NAVDATA_TIMEOUT = 4.0   # max seconds waiting for the first navdata
+
+    # flags that wake up the threads waiting for a drone state
+    _WAKE_MASK = NavData.COMMAND_MASK | NavData.FLY_MASK | NavData.EMERGENCY_MASK
+
+    # Alerts printed when the flag is set and there is no navdataCallback
+    ALERTS = {
+        NavData.COMMAND_MASK: "ACK Received",
+        NavData.MOTORS_MASK: "Motors Problems!!!",
+        NavData.COM_LOST_MASK: "Communication Lost!!!",
+        NavData.SOFTWARE_FAULT: "Software Lost!!!",
+        NavData.VBAT_LOW: "Battery Low!!!",
+        NavData.MAGNETO_NEEDS_CALIB: "Needs Calibration!!!",
+        NavData.ANGLES_OUT_OF_RANGE: "Angles Out of Range!!!",
+        NavData.WIND_MASK: "Too Much Wind!!!",
+        NavData.ULTRASOUND_MASK: "Ultrasound Detector Deaf!!!",
+        NavData.EMERGENCY_MASK: "EMERGENCY!!!",
+    }
+
+    def __init__(self, address, debug, navdataCallback=None, videoCallback=None,
+                 historySize=HISTORY_SIZE, drainNavData=False, recorder=None,
+                 pcmdPeriod=PCMD_PERIOD, videoDecoder=None, videoSinks=None,
+                 videoTransform=None):
         """Constructor
 
         Args:
             adress: Drone's address/hostname
             debug: Debug object
+            navdataCallback: Method to call with the navdata
+                      def navdataCallback(droneState, options):
+                         ... options is a NavDataOptions object
+                      It runs in the TCallbacks thread with the latest
+                      navdata (the packets received while it runs are
+                      skipped), as the subscriptions (see Subscribe). It
+                      may call the drone commands (TakeOff, GetConfig...),
+                      but the callbacks are delayed until they return
+            videoCallback: Method to call with every video frame
+            historySize: navdata samples to keep in the history (0 to
+                      disable it). Requires numpy
+            drainNavData: If true, NavData reads all the pending packets at
+                      once and keeps only the newest one (see NavData)
+            recorder: FlightRecorder to log the navdata and AT commands
+            pcmdPeriod: seconds between the movement commands sent while
+                      flying (see Move). 0 sends them only when Move or
+                      Hover are called
+            videoDecoder: decoder of the PaVE frames (see VideoDecoder) or
+                      None to read the video with cv2.VideoCapture
+            videoSinks: list of VideoSink objects for the processed frames
+                      (see Video). None shows them in a window, [] runs
+                      without GUI
+            videoTransform: VideoTransform applied to the frames before
+                      videoCallback (see Video). None mirrors them
         """
-        self._lock = threading.Lock()
-        self._address = address
+        start = _Now()
+        self._startup = {}
+        # resolved once, shared by all the channels
+        self._address = UDPTransport.Resolve(address)
+        t = self._Phase("resolve", start)
         self._debug = debug
         self._navdataCallback = navdataCallback
         self._videoCallback = videoCallback
+        self._videoDecoder = videoDecoder
+        self._videoSinks = videoSinks
+        self._videoTransform = videoTransform
         self._droneState = None
+        self._stateCond = threading.Condition()
+        self._lastRoundTrip = None
+        self._config = DroneConfig()
+        self._history = None
+        if(historySize > 0 and NavDataHistory != None):
+            self._history = NavDataHistory(historySize)
+        self._pcmdPeriod = pcmdPeriod
+        self._setpoint = ATEncoder.HOVER
+        self._pcmdCount = 0
+        self._pcmdMissed = 0
+        self._pcmdJitterSum = 0.0
+        self._pcmdJitterMax = 0.0
+        self._subscriptionsLock = threading.Lock()
+        self._subscriptions = {}
+        self._subscriptionId = 0
+        if(navdataCallback == None):
+            for mask in ARDrone2.ALERTS:
+                self.Subscribe(mask, self._Alert)
+
+        # the video (OpenCV import and first frame) is the slowest channel:
+        # it starts first and in its own thread, the commands don't wait for it
+        self._video = None
+        self._tvideoInit = None
+        if(self._videoCallback!=None or videoSinks):
+            debug.Print("[ARDrone2]: Init Video Object")
+            self._tvideoInit = threading.Thread(target=self._TVideoInit, args=(), name="TVideoInit")
+            self._tvideoInit.start()
+        else:
+            debug.Print("[ARDrone2]: No Video Object")
+
+        # the callbacks run off the navdata thread: they can call the
+        # commands, which wait for the state updated by that thread
+        self._events = collections.deque()
+        self._latest = None
+        self._eventsCond = threading.Condition()
+        self._lastWatchDog = None
+        self._tcallbacks = threading.Thread(target=self._TCallbacks, args=(), name="TCallbacks")
+        self._dispatching = True
+        self._tcallbacks.start()
+
+        self._atCommand = None
+        self._control = None
+        self._navData = None
+        try:
+            debug.Print("[ARDrone2]: Init ATCommand Object")
+            self._atCommand = ATCommand(self._address, self._debug, recorder,
+                                        ARDrone2.AT_FLUSH_WINDOW, config=self._config)
+            t = self._Phase("atcommand", t)
 
-        debug.Print("[ARDrone2]: Init ATCommand Object")
-        self._atCommand = ATCommand(self._address, self._debug)
-        debug.Print("[ARDrone2]: ATCommand Object OK")
-
-        debug.Print("[ARDrone2]: Init Control Object")
-        self._control = Control(self._address, self._debug)
-        debug.Print("[ARDrone2]: Control Object OK")
+            # connects in its own thread
+            debug.Print("[ARDrone2]: Init Control Object")
+            self._control = Control(self._address, self._debug)
+            t = self._Phase("control", t)
 
-        try:
             debug.Print("[ARDrone2]: Init NavData Object")
-            self._navData = NavData(self._address, self._DoNavData, self._debug)
-            debug.Print("[ARDrone2]: NavData Object OK")
+            self._navData = NavData(self._address, self._DoNavData, self._debug, drainNavData, recorder)
+            t = self._Phase("navdata", t)
+            if(not self._WaitState(0, False, ARDrone2.NAVDATA_TIMEOUT)):
+                raise Exception("No navdata from the drone")
+            t = self._Phase("first_navdata", t)
+            debug.Print("[ARDrone2]: Channels OK")
         except Exception as e:
-            self._control.Stop()
             debug.Print("[ARDrone2]: %s" % e)
+            self._StopChannels()
             raise
-        t = time.time()
-        while(self._droneState == None):
-            if((time.time()-t) > 4):
-                self._control.Stop()
-                self._navData.Stop()
-                msg = "No navdata from the drone"
-                debug.Print("[ARDrone2]: %s" % msg)
-                raise Exception(msg)
-            time.sleep(0.01)
-        try:
-            debug.Print("[ARDrone2]: Init Video Object")
-            self._video = None
-            if(self._videoCallback!=None):
-                self._video = Video(address, self._DoVideo, debug)
-                debug.Print("[ARDrone2]: Video Object OK")
-            else:
-                debug.Print("[ARDrone2]: No Video Object")
-        except Exception as e:
-            # no cleanup code required
-            debug.Print("[ARDrone2]: %s" % e)
+
+        self._commands = CommandQueue(debug, self._stateCond)
         self._running = False
-        self._tmonitor = threading.Thread(target=self._TMonitor, args=(), name="Monitor")
-        self._tmonitor.start()
-        while(not self._running):
-            time.sleep(0.01)
+        self._tpilot = None
+        if(pcmdPeriod > 0):
+            self._tpilot = threading.Thread(target=self._TPilot, args=(), name="TPilot")
+            self._running = True
+            self._tpilot.start()
+        t = self._Phase("threads", t)
+        self._Phase("total", start)
+
+    def _Phase(self, name, since):
+        """Account the time of a startup phase
+
+        Returns:
+            The current time (start of the next phase)
+        """
+        now = _Now()
+        self._startup[name] = now - since
+        return now
 
-    def _Lock(self):
-        """Acquire the lock
+    def _TVideoInit(self, *args):
+        """Thread to open the video while the other channels start
         """
-        self._lock.acquire()
+        start = _Now()
+        try:
+            from Video import Video
+            self._video = Video(self._address, self._DoVideo, self._debug, self._videoDecoder,
+                                sinks=self._videoSinks, transform=self._videoTransform)
+            self._debug.Print("[ARDrone2]: Video Object OK")
+        except Exception as e:
+            # no cleanup code required
+            self._debug.Print("[ARDrone2]: %s" % e)
+        self._Phase("video", start)
 
-    def _Unlock(self):
-        """Release the lock
+    def _StopChannels(self):
+        """Stop the channels opened by the constructor
         """
-        self._lock.release()
+        if(self._tvideoInit != None):
+            self._tvideoInit.join()
+        if(self._navData != None):
+            self._navData.Stop()
+        self._eventsCond.acquire()
+        try:
+            self._dispatching = False
+            self._eventsCond.notify_all()
+        finally:
+            self._eventsCond.release()
+        if(threading.current_thread() is not self._tcallbacks):
+            self._tcallbacks.join()
+        if(self._control != None):
+            self._control.Stop()
+        if(self._video != None):
+            self._video.Stop()
+        if(self._atCommand != None):
+            self._atCommand.Stop()
 
     def _IsSet(self, mask):
         """Bitwise test of the command mask
@@ -93,74 +231,244 @@ class ARDrone2:
         """
         return (self._droneState & mask)!=0
 
-    def _ClearACK(self):
-        """Clear the command mask
+    def _WaitState(self, mask, isSet, timeout):
+        """Wait for the flags in mask (one of _WAKE_MASK) to be set/clear
+
+        The navdata thread notifies every change of those flags. With
+        mask 0 it waits only for the first navdata
+
+        Args:
+            mask: flags to test
+            isSet: True to wait for any of them set, False for all clear
+            timeout: max seconds to wait
+
+        Returns:
+            False on timeout
         """
+        deadline = _Now() + timeout
+        try:
+            self._stateCond.acquire()
+            while(self._droneState == None or ((self._droneState & mask) != 0) != isSet):
+                remaining = deadline - _Now()
+                if(remaining <= 0):
+                    return False
+                # notify() wakes us at once on every change of the flags
+                self._stateCond.wait(remaining)
+            return True
+        finally:
+            self._stateCond.release()
+
+    def _GClearACK(self):
+        """Steps to clear the command mask (resent every ACK_RETRY seconds)
+
+        Throws:
+            Exception if the drone doesn't clear it within ACK_TIMEOUT seconds
+        """
+        deadline = _Now() + ARDrone2.ACK_TIMEOUT
         while(self._IsSet(NavData.COMMAND_MASK)):
+            if(_Now() >= deadline):
+                raise Exception("Timeout clearing the command ACK")
             self._atCommand.ClearCommandAck()
-            time.sleep(ARDrone2.COMMAND_DELAY)
+            yield ARDrone2.ACK_RETRY
+
+    def _GConfig(self, send, keys=()):
+        """Steps of a config command: clear the ACK, send the command, wait
+        for its ACK and clear it again
 
-    def _WaitACK(self):
-        """Wait for the command mask to be true
+        Args:
+            send: method that sends the command
+            keys: "section:key" written, invalidated in the config cache
+                 if the command is not acknowledged
+
+        Throws:
+            Exception if an ACK step doesn't finish within ACK_TIMEOUT seconds
         """
-        while(not self._IsSet(NavData.COMMAND_MASK)):
-            time.sleep(ARDrone2.COMMAND_DELAY)
+        acked = False
+        try:
+            for delay in self._GClearACK():
+                yield delay
+            sent = _Now()
+            send()
+            while(not self._IsSet(NavData.COMMAND_MASK)):
+                remaining = sent + ARDrone2.ACK_TIMEOUT - _Now()
+                if(remaining <= 0):
+                    raise Exception("Timeout waiting for the command ACK")
+                yield remaining
+            acked = True
+            self._lastRoundTrip = _Now() - sent
+            for delay in self._GClearACK():
+                yield delay
+        finally:
+            if(not acked):
+                for key in keys:
+                    self._config.Invalidate(key)
 
     # from NavData
     def _DoNavData(self, droneState, options):
         """Method to receive the navdata
+
+        Args:
+            droneState: drone state mask
+            options: NavDataOptions object with the options blocks
         """
+        previous = self._droneState
         self._droneState = droneState
         self._options = options
+        if(previous == None or ((droneState ^ previous) & ARDrone2._WAKE_MASK)):
+            self._stateCond.acquire()
+            self._stateCond.notify_all()
+            self._stateCond.release()
+        if(self._history != None):
+            demo = options.Get(NavDataOptions.DEMO)
+            if(demo != None and not demo.IsComplete()):
+                # a truncated demo block must not skip the watchdog and
+                # callbacks: only the state is kept
+                self._debug.Print("[ARDrone2]: Truncated demo block")
+                demo = None
+            self._history.Append(_Now(), droneState, demo)
+
+        # the flags already set in the first navdata are rising edges
+        if(previous == None):
+            previous = 0
+        changed = droneState ^ previous
+
+        # prevents disconnection: at once on the rising edge, then at most
+        # every COMMAND_DELAY while the flag stays set
+        if(droneState & NavData.COM_WATCHDOG_MASK):
+            now = _Now()
+            if(self._lastWatchDog == None or (changed & NavData.COM_WATCHDOG_MASK) or
+               now - self._lastWatchDog >= ARDrone2.COMMAND_DELAY):
+                self._lastWatchDog = now
+                try:
+                    self._atCommand.WatchDog()
+                except Exception as e:
+                    # no cleanup code required
+                    self._debug.Print("[ARDrone2]: WatchDog - %s" % e)
+
+        # the callbacks run in the TCallbacks thread
+        if(changed or self._navdataCallback != None):
+            self._eventsCond.acquire()
+            try:
+                if(changed):
+                    self._events.append((changed, droneState))
+                if(self._navdataCallback != None):
+                    self._latest = (droneState, options)
+                self._eventsCond.notify()
+            finally:
+                self._eventsCond.release()
+
+    def _TCallbacks(self, *args):
+        """Thread to run the subscriptions (every edge, in order) and the
+        navdataCallback (latest navdata)
+        """
+        while(True):
+            self._eventsCond.acquire()
+            try:
+                while(self._dispatching and not self._events and self._latest == None):
+                    self._eventsCond.wait(1.0)
+                if(not self._dispatching):
+                    break
+                events = list(self._events)
+                self._events.clear()
+                latest = self._latest
+                self._latest = None
+            finally:
+                self._eventsCond.release()
+            for changed, droneState in events:
+                self._Dispatch(changed, droneState)
+            if(latest != None):
+                try:
+                    self._navdataCallback(latest[0], latest[1])
+                except Exception as e:
+                    self._debug.Print("[TCallbacks]: %s" % e)
+        self._debug.Print("[TCallbacks]: Aborting the thread")
 
-    def _TMonitor(self):
-        """Thread to monitor the watchdog mask and process alerts
+    def _Dispatch(self, changed, droneState):
+        """Call the subscriptions matching the changed flags
         """
-        self._running = True
+        for mask, callback, rising, falling in self._subscriptions.values():
+            edge = changed & mask
+            if(not edge):
+                continue
+            isSet = (droneState & edge) != 0
+            if((isSet and rising) or (not isSet and falling)):
+                try:
+                    callback(mask, isSet, droneState)
+                except Exception as e:
+                    self._debug.Print("[ARDrone2]: Subscription - %s" % e)
+
+    def _Alert(self, mask, isSet, droneState):
+        """Default subscription: print the alerts
+        """
+        self._debug.Print("[ARDrone2]: NavData Flag - %s" % ARDrone2.ALERTS[mask])
+
+    def _TPilot(self):
+        """Thread to send the current setpoint at a fixed rate while flying
+
+        The ticks are scheduled from the start time (no drift); if the
+        thread falls behind more than a period the missed ticks are skipped
+        """
+        period = self._pcmdPeriod
+        tick = _Now()
         while(self._running):
-            # prevents disconnection
-            if(self._IsSet(NavData.COM_WATCHDOG_MASK)):
+            delay = tick - _Now()
+            if(delay > 0):
+                time.sleep(delay)
+            now = _Now()
+            late = now - tick
+            self._pcmdCount = self._pcmdCount + 1
+            self._pcmdJitterSum = self._pcmdJitterSum + late
+            if(late > self._pcmdJitterMax):
+                self._pcmdJitterMax = late
+            if(self._IsSet(NavData.FLY_MASK)):
                 try:
-                    self._atCommand.WatchDog()
-                    #self._debug.Print("[TMonitor]: NavData Flag - WATCHDOG Received")
+                    self._atCommand.Send(self._setpoint)
                 except Exception as e:
                     # no cleanup code required
-                    self._debug.Print("[TMonitor]: %s" % e)
-
-            # Alerts
-            if(self._navdataCallback != None):
-                self._navdataCallback(self._droneState, self._options)
-            else:
-                if(self._IsSet(NavData.COMMAND_MASK)):
-                    self._debug.Print("[TMonitor]: NavData Flag - ACK Received")
-                if(self._IsSet(NavData.MOTORS_MASK)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Motors Problems!!!")
-                if(self._IsSet(NavData.COM_LOST_MASK)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Communication Lost!!!")
-                if(self._IsSet(NavData.SOFTWARE_FAULT)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Software Lost!!!")
-                if(self._IsSet(NavData.VBAT_LOW)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Battery Low!!!")
-                if(self._IsSet(NavData.MAGNETO_NEEDS_CALIB)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Needs Calibration!!!")
-                if(self._IsSet(NavData.ANGLES_OUT_OF_RANGE)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Angles Out of Range!!!")
-                if(self._IsSet(NavData.WIND_MASK)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Too Much Wind!!!")
-                if(self._IsSet(NavData.ULTRASOUND_MASK)):
-                    self._debug.Print("[TMonitor]: NavData Flag - Ultrasound Detector Deaf!!!")
-                if(self._IsSet(NavData.EMERGENCY_MASK)):
-                    self._debug.Print("[TMonitor]: NavData Flag - EMERGENCY!!!")
-
-            time.sleep(ARDrone2.COMMAND_DELAY)
-        self._debug.Print("[TMonitor]: Aborting the thread")
+                    self._debug.Print("[TPilot]: %s" % e)
+            tick = tick + period
+            if(now - tick > period):
+                missed = int((now - tick) / period)
+                self._pcmdMissed = self._pcmdMissed + missed
+                tick = tick + missed * period
+        self._debug.Print("[TPilot]: Aborting the thread")
 
     # from Video
     def _DoVideo(self, frame):
         """Method to receive the frame
         """
+        if(self._videoCallback == None):
+            return frame
         return self._videoCallback(frame)
 
+    def GetVideoFrame(self, after=0, timeout=1.0):
+        """Get the latest decoded video frame (see Video.GetFrame)
+
+        Args:
+            after: number of the last frame obtained; waits for a newer one
+            timeout: max seconds to wait
+
+        Returns:
+            VideoFrame object (image, number, captured, decoded and header)
+            or None if there is no video or no new frame
+        """
+        if(self._video == None):
+            return None
+        return self._video.GetFrame(after, timeout)
+
+    def GetVideoLatency(self):
+        """Get the latency of every stage of the video
+
+        Returns:
+            dict with frames and receive, decode, queue, callback, sink and
+            total, each one a dict with count, mean, max, p50, p95, p99
+            (seconds) and histogram (see VideoLatency), or None if there
+            is no video
+        """
+        if(self._video == None):
+            return None
+        return self._video.GetLatency()
+
     def GetDroneState(self):
         """Get the drone state
 
@@ -169,176 +477,355 @@ class ARDrone2:
         """
         return self._droneState
 
-    def SetNavData(self):
-        """Set navdata mode
+    def Subscribe(self, mask, callback, rising=True, falling=False):
+        """Subscribe to the changes of drone state flags
+
+        The callback runs in the TCallbacks thread (not the navdata one, so
+        it can call the drone commands), only when a packet changes one of
+        the flags in mask
+
+            def callback(mask, isSet, droneState):
+                ...
+
+        Args:
+            mask: one or more NavData.*_MASK flags
+            callback: method to call
+            rising: call it when a flag changes to 1
+            falling: call it when a flag changes to 0
+
+        Returns:
+            The subscription id (see Unsubscribe)
         """
         try:
-            self._Lock()
-            self._ClearACK()
-            self._atCommand.SetNavData()
-            self._WaitACK()
-            self._ClearACK()
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: SetNavData - %s" % e)
-            raise
+            self._subscriptionsLock.acquire()
+            self._subscriptionId = self._subscriptionId + 1
+            # copy on write: _Dispatch iterates without locking
+            subscriptions = dict(self._subscriptions)
+            subscriptions[self._subscriptionId] = (mask, callback, rising, falling)
+            self._subscriptions = subscriptions
+            return self._subscriptionId
         finally:
-            self._Unlock()
+            self._subscriptionsLock.release()
 
-    def SetARDroneName(name):
-        """Set drone name
+    def Unsubscribe(self, subscriptionId):
+        """Remove a subscription
 
         Args:
-            name: drone name
+            subscriptionId: value returned by Subscribe
         """
         try:
-            self._Lock()
-            self._atCommand.SetARDroneName(name)
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: SetARDroneName - %s" % e)
-            raise
+            self._subscriptionsLock.acquire()
+            subscriptions = dict(self._subscriptions)
+            subscriptions.pop(subscriptionId, None)
+            self._subscriptions = subscriptions
         finally:
-            self._Unlock()
+            self._subscriptionsLock.release()
 
-    def FlatTrim(self):
+    def GetHistory(self):
+        """Get the navdata history
+
+        Returns:
+            NavDataHistory object or None if numpy is not available
+        """
+        return self._history
+
+    def GetLastRoundTrip(self):
+        """Get the seconds between the last config command and its ACK
+
+        Returns:
+            The round trip time or None if no config command was sent
+        """
+        return self._lastRoundTrip
+
+    def GetNavDataStats(self):
+        """Get the quality statistics of the navdata stream
+
+        Returns:
+            dict with received, bytes, bytes_per_second, checksum_errors,
+            timeouts, gaps, lost, reorders, errors and histogram. See
+            NavDataStats
+        """
+        return self._navData.GetStats()
+
+    def GetStartupTimes(self):
+        """Get the seconds spent in each phase of the constructor
+
+        Returns:
+            dict with resolve, atcommand, control, navdata, first_navdata,
+            threads and total; and video (measured in its own thread, in
+            parallel) once the video is open
+        """
+        return dict(self._startup)
+
+    def GetCommandStats(self):
+        """Get the times of the commands run by the command queue
+
+        Returns:
+            dict command name -> dict with count, wait_mean, wait_max
+            (seconds waiting in the queue), run_mean, run_max, preempted
+            and failed. See CommandQueue
+        """
+        return self._commands.GetStats()
+
+    def _Submit(self, kind, steps, priority=CommandQueue.NORMAL):
+        """Run a command through the command queue and wait for it
+
+        Throws:
+            The exception of the command, also if it was preempted
+        """
         try:
-            self._Lock()
-            if(not self._IsSet(NavData.FLY_MASK)):
-                self._atCommand.FlatTrim()
-                time.sleep(ARDrone2.COMMAND_DELAY)
+            return self._commands.Submit(kind, priority, steps)
         except Exception as e:
             # no cleanup code required
-            self._debug.Print("[ARDrone2]: FlatTrim: %s" % e)
+            self._debug.Print("[ARDrone2]: %s - %s" % (kind, e))
             raise
-        finally:
-            self._Unlock()
+
+    def SetNavData(self):
+        """Set navdata mode
+        """
+        self._Submit("SetNavData",
+                     lambda command: self._GConfig(self._atCommand.SetNavData, ("general:navdata_demo",)))
+
+    def SetARDroneName(self, name):
+        """Set drone name
+
+        Args:
+            name: drone name
+        """
+        self._Submit("SetARDroneName",
+                     lambda command: self._GConfig(lambda: self._atCommand.SetARDroneName(name),
+                                                   ("general:ardrone_name",)))
+
+    def _GSetConfig(self, command, items, ids, verify):
+        start = _Now()
+        # booleans as TRUE/FALSE, as in the dump
+        items = [(key, DroneConfig.Text(value)) for key, value in items]
+        keys = [key for key, value in items]
+
+        def send():
+            for key, value in items:
+                if(ids != None):
+                    self._atCommand.SetConfigIds(ids[0], ids[1], ids[2])
+                self._atCommand.SetConfig(key, value)
+
+        for delay in self._GConfig(send, keys):
+            yield delay
+        results = dict((key, True) for key in keys)
+        if(verify):
+            # the drone runs the commands in order: the dump requested
+            # after the burst has all of them applied
+            for delay in self._GGetConfig(command):
+                yield delay
+            for key, value in items:
+                results[key] = self._config.GetText(key) == value
+        command.result = {
+            "results": results,
+            "ok": all(results.values()),
+            "round_trip": self._lastRoundTrip,
+            "time": _Now() - start,
+        }
+
+    def SetConfig(self, items, ids=None, verify=False):
+        """Write several configuration options with one ACK cycle
+
+        All the AT*CONFIG commands (each one preceded by AT*CONFIG_IDS if
+        ids is given) are sent in a burst, sharing datagrams, and only the
+        ACK after the burst is awaited; the written values update the
+        cached configuration (see GetConfig)
+
+        Args:
+            items: dict or list of ("section:key", value)
+            ids: (session, user, application) ids for multiconfiguration
+                 or None
+            verify: One ACK doesn't tell which commands were applied: if
+                 true, every key is checked reading back the whole
+                 configuration dump (the drone has no read of a single
+                 key), which costs a full GetConfig round trip. If false,
+                 all of them are reported as applied once the ACK arrives
+
+        Returns:
+            dict with results ("section:key" -> True if applied), ok (all
+            of them applied), round_trip (seconds to the ACK) and time
+            (seconds to apply and verify the whole batch)
+
+        Throws:
+            Exception if the ACK doesn't arrive within ACK_TIMEOUT seconds
+        """
+        if(isinstance(items, dict)):
+            items = list(items.items())
+        else:
+            items = list(items)
+        return self._Submit("SetConfig",
+                            lambda command: self._GSetConfig(command, items, ids, verify))
+
+    def _GFlatTrim(self, command):
+        if(not self._IsSet(NavData.FLY_MASK)):
+            self._atCommand.FlatTrim()
+            yield ARDrone2.COMMAND_DELAY
+
+    def FlatTrim(self):
+        self._Submit("FlatTrim", self._GFlatTrim)
+
+    def _GCalibrate(self, command):
+        if(self._IsSet(NavData.FLY_MASK)):
+            self._atCommand.Calibrate()
+            yield ARDrone2.COMMAND_DELAY
 
     def Calibrate(self):
-        try:
-            self._Lock()
-            if(self._IsSet(NavData.FLY_MASK)):
-                self._atCommand.Calibrate()
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: Calibrate: %s" % e)
-            raise
-        finally:
-            self._Unlock()
+        self._Submit("Calibrate", self._GCalibrate)
+
+    def _GTakeOff(self, command):
+        self._setpoint = ATEncoder.HOVER
+        while(not self._IsSet(NavData.FLY_MASK)):
+            self._atCommand.TakeOff()
+            yield ARDrone2.COMMAND_DELAY
 
     def TakeOff(self):
-        try:
-            self._Lock()
-            while(not self._IsSet(NavData.FLY_MASK)):
-                self._atCommand.TakeOff()
-                time.sleep(ARDrone2.COMMAND_DELAY)
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: TakeOff: %s" % e)
-            raise
-        finally:
-            self._Unlock()
+        """Take off, returns when the drone is flying
+        """
+        self._Submit("TakeOff", self._GTakeOff)
+
+    def _GLand(self, command):
+        self._setpoint = ATEncoder.HOVER
+        while(self._IsSet(NavData.FLY_MASK)):
+            self._atCommand.Land()
+            yield ARDrone2.COMMAND_DELAY
 
     def Land(self):
-        try:
-            self._Lock()
-            while(self._IsSet(NavData.FLY_MASK)):
-                self._atCommand.Land()
-                time.sleep(ARDrone2.COMMAND_DELAY)
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: Land: %s" % e)
-            raise
-        finally:
-            self._Unlock()
+        """Land, returns when the drone is landed
+
+        Preempts any other command
+        """
+        self._Submit("Land", self._GLand, CommandQueue.URGENT)
 
     def Emergency(self):
+        """Emergency stop
+
+        Sent at once from the caller's thread, without waiting for the
+        command queue; the running and queued commands are cancelled
+        """
+        start = _Now()
         try:
-            self._Lock()
+            self._setpoint = ATEncoder.HOVER
             if(not self._IsSet(NavData.EMERGENCY_MASK)):
                 self._atCommand.Emergency()
-                time.sleep(ARDrone2.COMMAND_DELAY)
+            self._commands.Cancel("Cancelled by Emergency")
+            self._commands.Record("Emergency", 0.0, _Now() - start)
+            time.sleep(ARDrone2.COMMAND_DELAY)
         except Exception as e:
             # no cleanup code required
             self._debug.Print("[ARDrone2]: Emergency: %s" % e)
             raise
-        finally:
-            self._Unlock()
+
+    def _GEmergencyReset(self, command):
+        if(self._IsSet(NavData.EMERGENCY_MASK)):
+            self._atCommand.Emergency()
+            yield ARDrone2.COMMAND_DELAY
+            self._atCommand.Land()
+            yield ARDrone2.COMMAND_DELAY
 
     def EmergencyReset(self):
-        try:
-            self._Lock()
-            if(self._IsSet(NavData.EMERGENCY_MASK)):
-                self._atCommand.Emergency()
-                time.sleep(ARDrone2.COMMAND_DELAY)
-                self._atCommand.Land()
-                time.sleep(ARDrone2.COMMAND_DELAY)
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: EmergencyReset: %s" % e)
-            raise
-        finally:
-            self._Unlock()
+        self._Submit("EmergencyReset", self._GEmergencyReset)
+
+    def _GLedsAnim(self, command, anim, frecuency, duration):
+        self._atCommand.LedsAnim(anim, frecuency, duration)
+        yield ARDrone2.COMMAND_DELAY
 
     def LedsAnim(self, anim, frecuency, duration):
-        try:
-            self._Lock()
-            self._atCommand.LedsAnim(anim, frecuency, duration)
-            time.sleep(ARDrone2.COMMAND_DELAY)
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: LedsAnim: %s" % e)
-            raise
-        finally:
-            self._Unlock()
+        self._Submit("LedsAnim", lambda command: self._GLedsAnim(command, anim, frecuency, duration))
 
-    def GetConfig(self):
-        try:
-            self._Lock()
-            self._ClearACK()
-            self._atCommand.GetConfig()
-            self._WaitACK()
-            self._ClearACK()
-            return self._control.GetAnswer()
-        except Exception as e:
-            # no cleanup code required
-            self._debug.Print("[ARDrone2]: GetConfig: %s" % e)
-            raise
-        finally:
-            self._Unlock()
+    def _GGetConfig(self, command):
+        # the answer must be the one to this request
+        self._control.Clear()
+        for delay in self._GConfig(self._atCommand.GetConfig):
+            yield delay
+        if(not self._config.Load(self._control.GetAnswer())):
+            self._debug.Print("[ARDrone2]: GetConfig: empty configuration")
+
+    def GetConfig(self, refresh=False):
+        """Get the drone configuration
+
+        The dump is fetched from the drone only the first time and after
+        InvalidateConfig(); the values written meanwhile update the cache
+
+        Args:
+            refresh: If true, fetch the dump even if the cache is valid
+
+        Returns:
+            DroneConfig object (str() gives the dump)
+        """
+        if(refresh or not self._config.IsValid()):
+            self._Submit("GetConfig", self._GGetConfig)
+        return self._config
+
+    def InvalidateConfig(self):
+        """Fetch the configuration dump again in the next GetConfig()
+        """
+        self._config.Invalidate()
 
     def Move(self, roll, pitch, gaz, yaw):
+        """Set the movement of the drone
+
+        With the scheduler (pcmdPeriod > 0) this only updates the setpoint,
+        sent every pcmdPeriod seconds while flying, and returns at once.
+        Ignored if the drone is not flying. The movement doesn't go through
+        the command queue: the last one wins
+
+        Args:
+            roll, pitch, gaz, yaw: values between -1.0 and 1.0
+        """
+        if(not self._IsSet(NavData.FLY_MASK)):
+            return
+        if(self._tpilot != None):
+            self._setpoint = ATEncoder.Move(roll, pitch, gaz, yaw)
+            return
         try:
-            self._Lock()
-            if(self._IsSet(NavData.FLY_MASK)):
-                self._atCommand.Move(roll, pitch, gaz, yaw)
+            self._atCommand.Move(roll, pitch, gaz, yaw)
         except Exception as e:
             # no cleanup code required
             self._debug.Print("[ARDrone2]: Move: %s" % e)
             raise
-        finally:
-            self._Unlock()
 
     def Hover(self):
+        """Stay in the air in a fixed position (see Move)
+        """
+        if(not self._IsSet(NavData.FLY_MASK)):
+            return
+        if(self._tpilot != None):
+            self._setpoint = ATEncoder.HOVER
+            return
         try:
-            self._Lock()
-            if(self._IsSet(NavData.FLY_MASK)):
-                self._atCommand.Hover()
+            self._atCommand.Hover()
         except Exception as e:
             # no cleanup code required
             self._debug.Print("[ARDrone2]: Hover: %s" % e)
             raise
-        finally:
-            self._Unlock()
+
+    def GetPCMDStats(self):
+        """Get the timing of the movement commands scheduler
+
+        Returns:
+            dict with ticks, missed (ticks skipped for falling behind), and
+            the mean and max lateness of the ticks in seconds
+        """
+        count = self._pcmdCount
+        mean = 0.0
+        if(count > 0):
+            mean = self._pcmdJitterSum / count
+        return {
+            "ticks": count,
+            "missed": self._pcmdMissed,
+            "jitter_mean": mean,
+            "jitter_max": self._pcmdJitterMax,
+        }
 
     def Stop(self):
         """Stop all the threads
         """
         self._debug.Print("[ARDrone2]: Stopping...")
-        self._navData.Stop()
-        self._control.Stop()
-        if(self._video != None):
-            self._video.Stop()
+        self._commands.Stop()
         self._running = False
-        self._tmonitor.join()
+        if(self._tpilot != None):
+            self._tpilot.join()
+        self._StopChannels()
 
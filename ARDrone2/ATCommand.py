@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
-import socket
 import threading
-import struct
+import time
+
+from ATEncoder import ATEncoder
+from UDPTransport import UDPTransport
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
 
 class ATCommand:
     """Class to send AT commands to the ARDrone2 through port 5556
@@ -9,6 +14,10 @@ class ATCommand:
     To prevent the drone from considering the WIFI connection lost,
     two consecutive commands must be send within less than 2 seconds.
 
+    With a flush window the commands issued within the window are sent
+    together in one datagram (the drone accepts several CR terminated
+    commands per datagram, up to MAX_DATAGRAM bytes).
+
     Usage:
         import time
 
@@ -20,22 +29,51 @@ class ATCommand:
             drone.WatchDog()
             time.sleep(1)
         drone.Land()
+        drone.Stop()
     """
     AT_PORT = 5556
+    MAX_DATAGRAM = 1024
 
-    def __init__(self, address, debug):
+    def __init__(self, address, debug, recorder=None, flushWindow=0.0, blocking=True,
+                 config=None):
         """Constructor
 
         Args:
             address: Drone's address/hostname
             debug: Debug object
+            recorder: FlightRecorder to log every command sent
+            flushWindow: seconds to hold a command waiting for others to
+                      send them in the same datagram. 0 sends every
+                      command right away
+            blocking: If false, a datagram that can't be sent at once is
+                      dropped and counted (see GetStats) instead of
+                      blocking the caller
+            config: DroneConfig updated with every config command sent
+
+        Throws:
+            Any exception throws resolving the address
         """
         self._lock = threading.Lock()
+        self._flushCond = threading.Condition(self._lock)
         self._address = address
         self._debug = debug
+        self._recorder = recorder
+        self._config = config
+        self._flushWindow = flushWindow
         self._sequence = 1
-        self._socket = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        self._socket.settimeout(1.0)
+        self._buffer = bytearray(ATCommand.MAX_DATAGRAM)
+        self._bufferView = memoryview(self._buffer)
+        self._pending = 0
+        self._deadline = 0.0
+        self._commands = 0
+        self._datagrams = 0
+        self._transport = UDPTransport(address, ATCommand.AT_PORT, blocking=blocking)
+        self._running = False
+        self._tflush = None
+        if(flushWindow > 0):
+            self._tflush = threading.Thread(target=self._TFlush, args=(), name="TATCommand")
+            self._running = True
+            self._tflush.start()
 
     def _Lock(self):
         """Acquire the lock
@@ -51,17 +89,51 @@ class ATCommand:
         """Send an AT Command to the drone
 
         Args:
-            cmd: String with the AT Command to send. any ocurrence of the
-                 {SEQ} pattern is replaced with the sequence number
+            cmd: String with the AT Command to send. The {SEQ} pattern is
+                 replaced with the sequence number
+
+        Throws:
+            Any exception throws by UDPTransport.Send()
+        """
+        self._Send(ATEncoder.Parse(cmd))
+
+    def Send(self, template):
+        """Send a precompiled AT Command (see ATEncoder)
+
+        Args:
+            template: (prefix, suffix) from ATEncoder
+        """
+        self._Send(template)
+
+    def _Send(self, template):
+        """Send a precompiled AT Command to the drone
+
+        Args:
+            template: (prefix, suffix) from ATEncoder
 
         Throws:
-            Any exception throws by socket.socket.sendto()
+            Any exception throws by UDPTransport.Send()
         """
         try:
             self._Lock()
-            cmd = cmd.replace("{SEQ}", str(self._sequence)) + chr(13)
+            cmd = ATEncoder.Encode(template, self._sequence)
+            size = len(cmd)
+            if(self._tflush == None or size > ATCommand.MAX_DATAGRAM):
+                self._Flush()
+                if(self._transport.Send(cmd)):
+                    self._datagrams = self._datagrams + 1
+            else:
+                if(self._pending + size > ATCommand.MAX_DATAGRAM):
+                    self._Flush()
+                if(self._pending == 0):
+                    self._deadline = _Now() + self._flushWindow
+                    self._flushCond.notify()
+                self._buffer[self._pending:self._pending+size] = cmd
+                self._pending = self._pending + size
+            if(self._recorder != None):
+                self._recorder.RecordATCommand(self._sequence, cmd)
             self._sequence = self._sequence + 1
-            self._socket.sendto(cmd, (self._address, ATCommand.AT_PORT))
+            self._commands = self._commands + 1
             #self._debug.Print("[ATCommand]: %s" % cmd)
         except Exception as e:
             # no cleanup code required
@@ -70,6 +142,75 @@ class ATCommand:
         finally:
             self._Unlock()
 
+    def _Flush(self):
+        """Send the pending commands in one datagram (lock must be held)
+        """
+        if(self._pending):
+            try:
+                if(self._transport.Send(self._bufferView[:self._pending])):
+                    self._datagrams = self._datagrams + 1
+            finally:
+                self._pending = 0
+
+    def _TFlush(self, *args):
+        """Thread to send the pending commands when the flush window expires
+        """
+        try:
+            self._Lock()
+            while(self._running):
+                if(self._pending == 0):
+                    self._flushCond.wait(1.0)
+                    continue
+                delay = self._deadline - _Now()
+                if(delay > 0):
+                    self._flushCond.wait(delay)
+                    continue
+                try:
+                    self._Flush()
+                except Exception as e:
+                    self._debug.Print("[TATCommand]: %s" % e)
+        finally:
+            self._Unlock()
+        self._debug.Print("[TATCommand]: Aborting the thread")
+
+    def Flush(self):
+        """Send now the commands waiting for the flush window
+        """
+        try:
+            self._Lock()
+            self._Flush()
+        except Exception as e:
+            self._debug.Print("[ATCommand]: %s" % e)
+            raise
+        finally:
+            self._Unlock()
+
+    def GetStats(self):
+        """Get the number of commands and datagrams sent
+
+        Returns:
+            (commands, datagrams, dropped); dropped are the datagrams not
+            sent because the socket would block (non blocking mode)
+        """
+        return (self._commands, self._datagrams, self._transport.GetStats()[1])
+
+    def Stop(self):
+        """Send the pending commands and stop the flush thread
+        """
+        try:
+            self._Lock()
+            self._running = False
+            self._flushCond.notify()
+            self._Flush()
+        except Exception as e:
+            # no cleanup code required
+            self._debug.Print("[ATCommand]: %s" % e)
+        finally:
+            self._Unlock()
+        if(self._tflush != None):
+            self._tflush.join()
+        self._transport.Close()
+
     def _FloatToInt(self, f):
         """Converts a float to its internal 32 bit integer representation
 
@@ -81,14 +222,13 @@ class ATCommand:
         Args:
             f: float to convert
         """
-        return struct.unpack(">i", struct.pack(">f",f))[0]
+        return ATEncoder.FloatToInt(f)
 
     # AT*CTRL=%d,%d,%d\r
     def DoNothing(self):
         """Doing nothing ¿?
         """
-        cmd = "AT*CTRL={SEQ},0,0"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.CTRL_NOTHING)
 
     def GetConfig(self):
         """Request for the active configuration.
@@ -96,22 +236,19 @@ class ATCommand:
         The caller wil receive the configuration through the 'control' socket
         TCP 5559
         """
-        cmd = "AT*CTRL={SEQ},4,0"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.CTRL_GET_CONFIG)
 
     def ClearCommandAck(self):
         """Reset command mask in navdata
 
         Some commands must wait for this bit in navdata and then clear it
         """
-        cmd = "AT*CTRL={SEQ},5,0"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.CTRL_ACK)
 
     def GetConfigIds(self):
         """Requests the list of custom configuration IDs
         """
-        cmd = "AT*CTRL={SEQ},6,0"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.CTRL_GET_CONFIG_IDS)
 
     # AT*COMWDG=%d\r
     def WatchDog(self):
@@ -120,8 +257,7 @@ class ATCommand:
         To prevent the drone from considering the WIFI connection lost,
         two consecutive commands must be send within less than 2 seconds.
         """
-        cmd = "AT*COMWDG={SEQ}"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.COMWDG)
 
     # AT*REF=%d,%d\r
     def TakeOff(self):
@@ -129,9 +265,7 @@ class ATCommand:
 
         Send this command until navdata (FLY_MASK) shows it.
         """
-        ctrl = 0b10001010101000000000000000000 | 0b1000000000
-        cmd = "AT*REF={SEQ},%d" % ctrl
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.REF_TAKEOFF)
 
     def Land(self):
         """ Land
@@ -139,18 +273,14 @@ class ATCommand:
         Send this command until navdata (FLY_MASK) shows it.
         Send as a safety whenever an abnormal situation is detected
         """
-        ctrl = 0b10001010101000000000000000000 | 0b0000000000
-        cmd = "AT*REF={SEQ},%d" % ctrl
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.REF_LAND)
 
     def Emergency(self):
         """ Emergency order
 
         Engines are cut-off no matter the drone state. EMERGENCY_MASK is set
         """
-        ctrl = 0b10001010101000000000000000000 | 0b100000000
-        cmd = "AT*REF={SEQ},%d" % ctrl
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.REF_EMERGENCY)
 
     def EmergencyReset(self):
         """ Reset emergency state
@@ -174,8 +304,7 @@ class ATCommand:
     def Hover(self):
         """Stay in the air in a fixed position
         """
-        cmd = "AT*PCMD={SEQ},0,0,0,0,0"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.HOVER)
 
     def Move(self, roll, pitch, gaz, yaw):
         """Move the drone
@@ -189,27 +318,13 @@ class ATCommand:
             All the values are betwee -1.0 to 1.0 according to the max values
             in the drone configuration
         """
-        roll = self._FloatToInt(float(min(max(roll,-1.),1.)))
-        pitch = self._FloatToInt(float(min(max(pitch,-1.),1.)))
-        gaz = self._FloatToInt(float(min(max(gaz,-1.),1.)))
-        yaw = self._FloatToInt(float(min(max(yaw,-1.),1.)))
-        flag = 0b001
-        cmd = "AT*PCMD={SEQ},%d,%d,%d,%d,%d" % (flag, roll, pitch, gaz, yaw)
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.Move(roll, pitch, gaz, yaw))
 
     # AT*PCMD_MAG=%d,%d,%d,%d,%d,%d,%d,%d\r
     def MoveMag(self, roll, pitch, gaz, yaw, psi, accuracy):
         """Move the drone
         """
-        roll = self._FloatToInt(float(min(max(roll,-1.),1.)))
-        pitch = self._FloatToInt(float(min(max(pitch,-1.),1.)))
-        gaz = self._FloatToInt(float(min(max(gaz,-1.),1.)))
-        yaw = self._FloatToInt(float(min(max(yaw,-1.),1.)))
-        psi = self._FloatToInt(float(min(max(psi,-1.),1.)))
-        accuracy = self._FloatToInt(float(min(max(accuracy,-1.),1.)))
-        flag = 0b001
-        cmd = "AT*PCMD_MAG={SEQ},%d,%d,%d,%d,%d,%d,%d" % (flag, roll, pitch, gaz, yaw, psi, accuracy)
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.MoveMag(roll, pitch, gaz, yaw, psi, accuracy))
 
     # AT*FTRIM=%d\r
     def FlatTrim(self):
@@ -218,8 +333,7 @@ class ATCommand:
         This command must not be sent when the ARDrone is flying
         See FLY_MASK in navdata
         """
-        cmd = "AT*FTRIM={SEQ}"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.FTRIM)
 
     # AT*CALIB=%d,%d\r
     def Calibrate(self):
@@ -228,8 +342,7 @@ class ATCommand:
         This command must be sent when the ARDrone is flying
         See FLY_MASK in navdata
         """
-        cmd = "AT*CALIB={SEQ},0"
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.CALIB)
 
     # AT*CONFIG=%d,\"%s\",\"%s\"\r
     def _Config(self, option, value):
@@ -244,8 +357,30 @@ class ATCommand:
             option: string with the option to set
             value: string with the value t assign
         """
-        cmd = "AT*CONFIG={SEQ},\"%s\",\"%s\"" % (option, value)
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.Config(option, value))
+        if(self._config != None):
+            self._config.Set(option, value)
+
+    def SetConfig(self, option, value):
+        """Set a configuration option (see _Config)
+
+        Args:
+            option: "section:key"
+            value: the value to assign
+        """
+        self._Config(option, value)
+
+    # AT*CONFIG_IDS=%d,\"%s\",\"%s\",\"%s\"\r
+    def SetConfigIds(self, session, user, application):
+        """Select the configuration written by the next AT*CONFIG
+
+        With multiconfiguration, each AT*CONFIG must be preceded by this
+        command with the current ids
+
+        Args:
+            session, user, application: ids (hexadecimal strings)
+        """
+        self._Send(ATEncoder.ConfigIds(session, user, application))
 
     def SetNavData(self, full=False):
         """Set mode for the data to send in the NavData port (5554)
@@ -276,8 +411,7 @@ class ATCommand:
             frecuency: speed of the animation
             duration: integer with the seconds for the animation
         """
-        cmd = "AT*LED={SEQ},%d,%d,%d" % (anim, self._FloatToInt(frecuency + 0.0), duration)
-        self._SendCommand(cmd)
+        self._Send(ATEncoder.LedsAnim(anim, frecuency, duration))
 
     """
     TODO:
@@ -293,7 +427,6 @@ class ATCommand:
         AT*CAD=%d,%d,%d\r
         AT*MTRIM=%d,%d,%d,%d\r
         AT*POL=%d,%d,%d,%d,%d,%d\r
-        AT*CONFIG_IDS=%d,\"%s\",\"%s\",\"%s\"\r
         AT*PWM=%d,%d,%d,%d,%d\r
         AT*AFLIGHT=%d,%d\r
         AT*VICON=%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d\r
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import struct
+
+def _Bytes(value):
+    """Convert a value to bytes (utf-8 for text)
+    """
+    if(isinstance(value, bytes)):
+        return value
+    try:
+        return value.encode("utf-8")
+    except AttributeError:
+        return _Bytes(str(value))
+
+def _Clamp(value):
+    """Limit a value to [-1.0, 1.0]
+    """
+    return float(min(max(value, -1.), 1.))
+
+
+class ATEncoder:
+    """Precompiled AT commands
+
+    A template is the tuple (prefix, suffix) with the bytes before and
+    after the sequence number, so encoding a command is just two
+    concatenations. The commands with fixed arguments are built once.
+
+    Usage:
+        cmd = ATEncoder.Encode(ATEncoder.REF_TAKEOFF, seq)
+        cmd = ATEncoder.Encode(ATEncoder.Move(0.1, 0, 0, 0), seq)
+    """
+    # float <-> int32 reinterpretation of the PCMD arguments, all at once
+    _PCMD_FLOATS = struct.Struct("<4f")
+    _PCMD_INTS = struct.Struct("<4i")
+    _MAG_FLOATS = struct.Struct("<6f")
+    _MAG_INTS = struct.Struct("<6i")
+    _FLOAT = struct.Struct("<f")
+    _INT = struct.Struct("<i")
+
+    _REF_BASE = 0b10001010101000000000000000000
+
+    @staticmethod
+    def Template(name, args=None):
+        """Precompile a command
+
+        Args:
+            name: command name without "AT*" (e.g. "REF")
+            args: arguments after the sequence number, without the
+                  leading comma, or None
+
+        Returns:
+            (prefix, suffix)
+        """
+        suffix = b"\r"
+        if(args is not None):
+            suffix = b"," + _Bytes(args) + suffix
+        return (b"AT*" + _Bytes(name) + b"=", suffix)
+
+    @staticmethod
+    def Parse(cmd):
+        """Precompile a command given as "AT*NAME={SEQ},args"
+
+        Returns:
+            (prefix, suffix)
+        """
+        prefix, suffix = _Bytes(cmd).split(b"{SEQ}", 1)
+        return (prefix, suffix + b"\r")
+
+    @staticmethod
+    def Encode(template, sequence):
+        """Build the command to send
+
+        Args:
+            template: (prefix, suffix)
+            sequence: sequence number
+
+        Returns:
+            The command bytes, including the final CR
+        """
+        return template[0] + (b"%d" % sequence) + template[1]
+
+    @staticmethod
+    def FloatToInt(f):
+        """Converts a float to its internal 32 bit integer representation
+        """
+        return ATEncoder._INT.unpack(ATEncoder._FLOAT.pack(f))[0]
+
+    @staticmethod
+    def Move(roll, pitch, gaz, yaw):
+        """AT*PCMD template for a movement (values between -1.0 and 1.0)
+        """
+        ints = ATEncoder._PCMD_INTS.unpack(ATEncoder._PCMD_FLOATS.pack(
+            _Clamp(roll), _Clamp(pitch), _Clamp(gaz), _Clamp(yaw)))
+        return (ATEncoder._PCMD, b",1,%d,%d,%d,%d\r" % ints)
+
+    @staticmethod
+    def MoveMag(roll, pitch, gaz, yaw, psi, accuracy):
+        """AT*PCMD_MAG template for a movement (values between -1.0 and 1.0)
+        """
+        ints = ATEncoder._MAG_INTS.unpack(ATEncoder._MAG_FLOATS.pack(
+            _Clamp(roll), _Clamp(pitch), _Clamp(gaz), _Clamp(yaw),
+            _Clamp(psi), _Clamp(accuracy)))
+        return (ATEncoder._PCMD_MAG, b",1,%d,%d,%d,%d,%d,%d\r" % ints)
+
+    @staticmethod
+    def Config(option, value):
+        """AT*CONFIG template
+        """
+        return (ATEncoder._CONFIG, b",\"" + _Bytes(option) + b"\",\"" + _Bytes(value) + b"\"\r")
+
+    @staticmethod
+    def ConfigIds(session, user, application):
+        """AT*CONFIG_IDS template (ids of the configuration to write)
+        """
+        return (ATEncoder._CONFIG_IDS, b",\"" + _Bytes(session) + b"\",\"" + _Bytes(user) +
+                b"\",\"" + _Bytes(application) + b"\"\r")
+
+    @staticmethod
+    def LedsAnim(anim, frecuency, duration):
+        """AT*LED template
+        """
+        return (ATEncoder._LED, b",%d,%d,%d\r" % (anim, ATEncoder.FloatToInt(frecuency + 0.0), duration))
+
+
+# prefixes of the commands with variable arguments
+ATEncoder._PCMD = ATEncoder.Template("PCMD")[0]
+ATEncoder._PCMD_MAG = ATEncoder.Template("PCMD_MAG")[0]
+ATEncoder._CONFIG = ATEncoder.Template("CONFIG")[0]
+ATEncoder._CONFIG_IDS = ATEncoder.Template("CONFIG_IDS")[0]
+ATEncoder._LED = ATEncoder.Template("LED")[0]
+
+# commands with fixed arguments
+ATEncoder.CTRL_NOTHING = ATEncoder.Template("CTRL", "0,0")
+ATEncoder.CTRL_GET_CONFIG = ATEncoder.Template("CTRL", "4,0")
+ATEncoder.CTRL_ACK = ATEncoder.Template("CTRL", "5,0")
+ATEncoder.CTRL_GET_CONFIG_IDS = ATEncoder.Template("CTRL", "6,0")
+ATEncoder.COMWDG = ATEncoder.Template("COMWDG")
+ATEncoder.REF_TAKEOFF = ATEncoder.Template("REF", "%d" % (ATEncoder._REF_BASE | 0b1000000000))
+ATEncoder.REF_LAND = ATEncoder.Template("REF", "%d" % (ATEncoder._REF_BASE | 0b0000000000))
+ATEncoder.REF_EMERGENCY = ATEncoder.Template("REF", "%d" % (ATEncoder._REF_BASE | 0b100000000))
+ATEncoder.HOVER = ATEncoder.Template("PCMD", "0,0,0,0,0")
+ATEncoder.FTRIM = ATEncoder.Template("FTRIM")
+ATEncoder.CALIB = ATEncoder.Template("CALIB", "0")
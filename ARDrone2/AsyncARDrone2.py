@@ -0,0 +1,791 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import socket
+
+from ATEncoder import ATEncoder
+from DroneConfig import DroneConfig
+from NavData import NavData
+from NavDataOptions import NavDataOptions
+from NavDataStats import NavDataStats
+
+try:
+    from NavDataHistory import NavDataHistory
+except ImportError:
+    NavDataHistory = None
+
+class _NavDataProtocol(asyncio.DatagramProtocol):
+    """Navdata datagrams (port 5554) to AsyncARDrone2
+    """
+
+    def __init__(self, drone):
+        self._drone = drone
+
+    def datagram_received(self, data, addr):
+        self._drone._OnNavData(data)
+
+    def error_received(self, exc):
+        self._drone._debug.Print("[AsyncNavData]: %s" % exc)
+
+
+class AsyncARDrone2:
+    """asyncio API for the Parrot ARDRone2 (python 3.7+)
+
+    Same surface as ARDrone2, but everything runs in the event loop: the
+    navdata and AT commands use datagram endpoints and the control port
+    a stream. There are no threads; the only tasks are the control
+    reader and the movement scheduler. Video is not supported.
+
+    The commands that wait for the drone are coroutines, run one at a
+    time. Emergency doesn't wait for them: it is sent at once and the
+    running and waiting commands fail with an exception. The callbacks
+    (navdata and subscriptions) run in the event loop and must not block.
+
+    Usage:
+        debug = Debug()
+        drone = await AsyncARDrone2.Connect("192.168.1.1", debug)
+        await drone.TakeOff()
+        await drone.Move(0, -0.2, 0, 0)
+        ...
+        await drone.Land()
+        await drone.Stop()
+    """
+    AT_PORT = 5556
+    CONTROL_PORT = 5559
+    MAX_DATAGRAM = 1024
+
+    # same timing as ARDrone2
+    COMMAND_DELAY = 0.01
+    HISTORY_SIZE = 4096
+    PCMD_PERIOD = 0.03
+    ACK_TIMEOUT = 5.0
+    ACK_RETRY = 0.05
+    NAVDATA_TIMEOUT = 4.0
+    ANSWER_TIMEOUT = 3.0
+    MANEUVER_TIMEOUT = 10.0 # max seconds for TakeOff/Land
+
+    # flags that wake up the coroutines waiting for a drone state
+    _WAKE_MASK = NavData.COMMAND_MASK | NavData.FLY_MASK | NavData.EMERGENCY_MASK
+
+    def __init__(self, debug, navdataCallback=None, historySize=HISTORY_SIZE,
+                 recorder=None, pcmdPeriod=PCMD_PERIOD):
+        """Constructor, use Connect() instead
+
+        Args:
+            debug: Debug object
+            navdataCallback: Method to call with the navdata
+                      def navdataCallback(droneState, options):
+                         ... options is a NavDataOptions object
+            historySize: navdata samples to keep in the history (0 to
+                      disable it). Requires numpy
+            recorder: FlightRecorder to log the navdata and AT commands
+            pcmdPeriod: seconds between the movement commands sent while
+                      flying (see Move). 0 sends them only when Move or
+                      Hover are called
+        """
+        self._debug = debug
+        self._navdataCallback = navdataCallback
+        self._recorder = recorder
+        self._pcmdPeriod = pcmdPeriod
+        self._loop = None
+        self._address = None
+        self._droneState = None
+        self._sequenceNumber = 0
+        self._stats = NavDataStats()
+        self._stateChanged = None
+        self._lastRoundTrip = None
+        self._config = DroneConfig()
+        self._history = None
+        if(historySize > 0 and NavDataHistory != None):
+            self._history = NavDataHistory(historySize)
+        self._subscriptions = {}
+        self._subscriptionId = 0
+
+        self._at = None
+        self._sequence = 1
+        self._buffer = bytearray()
+        self._commands = 0
+        self._datagrams = 0
+
+        self._navdata = None
+        self._writer = None
+        self._answers = None
+        self._tcontrol = None
+        self._tpilot = None
+        self._lock = None
+        self._sequences = {}
+        self._urgent = set()
+        self._lastWatchDog = None
+        self._setpoint = ATEncoder.HOVER
+        self._pcmdCount = 0
+        self._pcmdMissed = 0
+        self._pcmdJitterSum = 0.0
+        self._pcmdJitterMax = 0.0
+
+    @classmethod
+    async def Connect(cls, address, debug, navdataCallback=None, historySize=HISTORY_SIZE,
+                      recorder=None, pcmdPeriod=PCMD_PERIOD):
+        """Create the drone and open all the channels
+
+        Args:
+            address: Drone's address/hostname
+            others: see the constructor
+
+        Returns:
+            The connected AsyncARDrone2
+
+        Throws:
+            Exception if there is no navdata from the drone, or any
+            exception throws by the sockets
+        """
+        drone = cls(debug, navdataCallback, historySize, recorder, pcmdPeriod)
+        try:
+            await drone._Start(address)
+        except Exception as e:
+            debug.Print("[AsyncARDrone2]: %s" % e)
+            await drone.Stop()
+            raise
+        return drone
+
+    async def _Start(self, address):
+        """Open the AT, control and navdata channels
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._lock = asyncio.Lock()
+        self._stateChanged = asyncio.Event()
+        self._answers = asyncio.Queue()
+
+        # resolved once, shared by all the channels
+        infos = await loop.getaddrinfo(address, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self._address = infos[0][4][0]
+
+        self._debug.Print("[AsyncARDrone2]: Init AT endpoint")
+        self._at, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self._address, AsyncARDrone2.AT_PORT))
+
+        self._debug.Print("[AsyncARDrone2]: Init Control stream")
+        reader, self._writer = await asyncio.open_connection(self._address, AsyncARDrone2.CONTROL_PORT)
+        self._tcontrol = loop.create_task(self._TControl(reader))
+
+        self._debug.Print("[AsyncARDrone2]: Init NavData endpoint")
+        self._navdata, _ = await loop.create_datagram_endpoint(
+            lambda: _NavDataProtocol(self),
+            local_addr=("0.0.0.0", NavData.NAVDATA_PORT),
+            remote_addr=(self._address, NavData.NAVDATA_PORT))
+        self._navdata.sendto(b"\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+        if(not await self._WaitState(0, False, AsyncARDrone2.NAVDATA_TIMEOUT)):
+            raise Exception("No navdata from the drone")
+
+        if(self._pcmdPeriod > 0):
+            self._tpilot = loop.create_task(self._TPilot())
+
+    def _IsSet(self, mask):
+        """Bitwise test of the command mask
+
+        Returns:
+            True if mask is set
+        """
+        return (self._droneState & mask)!=0
+
+    async def _WaitState(self, mask, isSet, timeout):
+        """Wait for the flags in mask (one of _WAKE_MASK) to be set/clear
+
+        With mask 0 it waits only for the first navdata
+
+        Args:
+            mask: flags to test
+            isSet: True to wait for any of them set, False for all clear
+            timeout: max seconds to wait
+
+        Returns:
+            False on timeout
+        """
+        deadline = self._loop.time() + timeout
+        while(self._droneState == None or ((self._droneState & mask) != 0) != isSet):
+            remaining = deadline - self._loop.time()
+            if(remaining <= 0):
+                return False
+            try:
+                await asyncio.wait_for(self._stateChanged.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    async def _ClearACK(self, timeout=ACK_TIMEOUT):
+        """Clear the command mask
+
+        Throws:
+            Exception if the drone doesn't clear it within timeout seconds
+        """
+        deadline = self._loop.time() + timeout
+        while(self._IsSet(NavData.COMMAND_MASK)):
+            remaining = deadline - self._loop.time()
+            if(remaining <= 0):
+                raise Exception("Timeout clearing the command ACK")
+            self._Send(ATEncoder.CTRL_ACK)
+            await self._WaitState(NavData.COMMAND_MASK, False, min(remaining, AsyncARDrone2.ACK_RETRY))
+
+    async def _WaitACK(self, sent, timeout=ACK_TIMEOUT):
+        """Wait for the command mask to be true
+
+        Args:
+            sent: loop time when the command was sent, for the round trip
+            timeout: max seconds to wait
+
+        Throws:
+            Exception if the ACK doesn't arrive within timeout seconds
+        """
+        if(not await self._WaitState(NavData.COMMAND_MASK, True, timeout)):
+            raise Exception("Timeout waiting for the command ACK")
+        self._lastRoundTrip = self._loop.time() - sent
+
+    def _Send(self, template):
+        """Queue a precompiled AT Command
+
+        The commands queued in the same loop iteration share a datagram,
+        sent by _Flush as soon as the running callback returns
+
+        Args:
+            template: (prefix, suffix) from ATEncoder
+        """
+        cmd = ATEncoder.Encode(template, self._sequence)
+        if(len(self._buffer) + len(cmd) > AsyncARDrone2.MAX_DATAGRAM):
+            self._Flush()
+        if(not self._buffer):
+            self._loop.call_soon(self._Flush)
+        self._buffer.extend(cmd)
+        if(self._recorder != None):
+            self._recorder.RecordATCommand(self._sequence, cmd)
+        self._sequence = self._sequence + 1
+        self._commands = self._commands + 1
+
+    def _Flush(self):
+        """Send the queued commands in one datagram
+        """
+        if(self._buffer and self._at != None and not self._at.is_closing()):
+            self._at.sendto(bytes(self._buffer))
+            self._datagrams = self._datagrams + 1
+        del self._buffer[:]
+
+    # from _NavDataProtocol
+    def _OnNavData(self, packet):
+        """Decode a navdata packet
+        """
+        self._stats.Packet(self._loop.time(), packet)
+        if(self._recorder != None):
+            self._recorder.RecordNavData(packet)
+        err, droneState, sequenceNumber, options = NavData.Decode(packet)
+        if(err):
+            self._stats.Error(err)
+            self._debug.Print("[AsyncNavData]: Error - %s" % NavData.ERR_MESSAGE[err])
+            if(err != NavData.ERR_BAD_OPTIONS):
+                return
+        if(sequenceNumber<self._sequenceNumber):
+            self._stats.Error(NavData.ERR_BAD_SEQUENCE)
+            return
+        self._sequenceNumber = sequenceNumber
+        try:
+            self._DoNavData(droneState, options)
+        except Exception as e:
+            self._debug.Print("[AsyncNavData]: %s" % e)
+            self._stats.Error(NavData.ERR_UNEXPECTED_EXCEPTION)
+
+    def _DoNavData(self, droneState, options):
+        """Method to receive the navdata
+
+        Args:
+            droneState: drone state mask
+            options: NavDataOptions object with the options blocks
+        """
+        previous = self._droneState
+        self._droneState = droneState
+        self._options = options
+        if(previous == None or ((droneState ^ previous) & AsyncARDrone2._WAKE_MASK)):
+            # wake up the current waiters, the next ones wait a new change
+            self._stateChanged.set()
+            self._stateChanged = asyncio.Event()
+        if(self._history != None):
+            demo = options.Get(NavDataOptions.DEMO)
+            if(demo != None and not demo.IsComplete()):
+                # a truncated demo block must not skip the watchdog and
+                # callbacks: only the state is kept
+                self._debug.Print("[AsyncARDrone2]: Truncated demo block")
+                demo = None
+            self._history.Append(self._loop.time(), droneState, demo)
+
+        # the flags already set in the first navdata are rising edges
+        if(previous == None):
+            previous = 0
+        changed = droneState ^ previous
+        if(changed):
+            self._Dispatch(changed, droneState)
+
+        # prevents disconnection: at once on the rising edge, then at most
+        # every COMMAND_DELAY while the flag stays set
+        if(droneState & NavData.COM_WATCHDOG_MASK):
+            now = self._loop.time()
+            if(self._lastWatchDog == None or (changed & NavData.COM_WATCHDOG_MASK) or
+               now - self._lastWatchDog >= AsyncARDrone2.COMMAND_DELAY):
+                self._lastWatchDog = now
+                self._Send(ATEncoder.COMWDG)
+
+        if(self._navdataCallback != None):
+            self._navdataCallback(droneState, options)
+
+    def _Dispatch(self, changed, droneState):
+        """Call the subscriptions matching the changed flags
+        """
+        for mask, callback, rising, falling in list(self._subscriptions.values()):
+            edge = changed & mask
+            if(not edge):
+                continue
+            isSet = (droneState & edge) != 0
+            if((isSet and rising) or (not isSet and falling)):
+                try:
+                    callback(mask, isSet, droneState)
+                except Exception as e:
+                    self._debug.Print("[AsyncARDrone2]: Subscription - %s" % e)
+
+    async def _TControl(self, reader):
+        """Task to receive the control data (NUL terminated)
+        """
+        try:
+            while(True):
+                data = await reader.readuntil(b"\x00")
+                self._answers.put_nowait(data[:-1])
+        except asyncio.IncompleteReadError:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # no cleanup code required
+            self._debug.Print("[AsyncControl]: %s" % e)
+        self._debug.Print("[AsyncControl]: Aborting the task")
+
+    async def _TPilot(self):
+        """Task to send the current setpoint at a fixed rate while flying
+
+        The ticks are scheduled from the start time (no drift); if the
+        loop falls behind more than a period the missed ticks are skipped
+        """
+        period = self._pcmdPeriod
+        tick = self._loop.time()
+        while(True):
+            delay = tick - self._loop.time()
+            if(delay > 0):
+                await asyncio.sleep(delay)
+            now = self._loop.time()
+            late = now - tick
+            self._pcmdCount = self._pcmdCount + 1
+            self._pcmdJitterSum = self._pcmdJitterSum + late
+            if(late > self._pcmdJitterMax):
+                self._pcmdJitterMax = late
+            if(self._IsSet(NavData.FLY_MASK)):
+                self._Send(self._setpoint)
+            tick = tick + period
+            if(now - tick > period):
+                missed = int((now - tick) / period)
+                self._pcmdMissed = self._pcmdMissed + missed
+                tick = tick + missed * period
+
+    async def _Sequence(self, coro, urgent=False):
+        """Run a command in its own task, so Emergency can cancel it
+
+        Args:
+            coro: coroutine of the command
+            urgent: If true, only Emergency cancels it (see Land)
+
+        Returns:
+            The result of the command
+
+        Throws:
+            Exception if the command is cancelled by Emergency or preempted
+            by Land, or the exception of the command
+        """
+        task = self._loop.create_task(coro)
+        self._sequences[task] = None
+        if(urgent):
+            self._urgent.add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            reason = self._sequences.get(task)
+            if(reason == None):
+                # the caller was cancelled
+                raise
+            raise Exception(reason)
+        finally:
+            self._sequences.pop(task, None)
+            self._urgent.discard(task)
+
+    def _CancelSequences(self, reason, urgent=True):
+        """Cancel the running and waiting commands
+
+        Args:
+            reason: message of the exception of the cancelled commands
+            urgent: If false, the urgent commands are not cancelled
+        """
+        for task in list(self._sequences.keys()):
+            if(not urgent and task in self._urgent):
+                continue
+            if(not task.done()):
+                self._sequences[task] = reason
+                task.cancel()
+
+    async def _GetAnswer(self, timeout=ANSWER_TIMEOUT):
+        """Get the control data of the last AT command
+
+        Returns:
+            The control data or b'' on timeout
+        """
+        try:
+            return await asyncio.wait_for(self._answers.get(), timeout)
+        except asyncio.TimeoutError:
+            self._debug.Print("[AsyncControl]: No control data from the drone")
+            return b""
+
+    def GetDroneState(self):
+        """Get the drone state
+
+        Returns:
+            The drone state
+        """
+        return self._droneState
+
+    def Subscribe(self, mask, callback, rising=True, falling=False):
+        """Subscribe to the changes of drone state flags (see ARDrone2)
+
+            def callback(mask, isSet, droneState):
+                ...
+
+        Returns:
+            The subscription id (see Unsubscribe)
+        """
+        self._subscriptionId = self._subscriptionId + 1
+        self._subscriptions[self._subscriptionId] = (mask, callback, rising, falling)
+        return self._subscriptionId
+
+    def Unsubscribe(self, subscriptionId):
+        """Remove a subscription
+
+        Args:
+            subscriptionId: value returned by Subscribe
+        """
+        self._subscriptions.pop(subscriptionId, None)
+
+    def GetHistory(self):
+        """Get the navdata history
+
+        Returns:
+            NavDataHistory object or None if numpy is not available
+        """
+        return self._history
+
+    def GetLastRoundTrip(self):
+        """Get the seconds between the last config command and its ACK
+
+        Returns:
+            The round trip time or None if no config command was sent
+        """
+        return self._lastRoundTrip
+
+    def GetNavDataStats(self):
+        """Get the quality statistics of the navdata stream (see NavDataStats)
+        """
+        return self._stats.GetSnapshot((NavData.ERR_CHECKSUM, NavData.ERR_BAD_CKS_TAG),
+                                       NavData.ERR_SOCKET_TIMEOUT, self._loop.time())
+
+    def GetATStats(self):
+        """Get the number of AT commands and datagrams sent
+
+        Returns:
+            (commands, datagrams)
+        """
+        return (self._commands, self._datagrams)
+
+    async def SetNavData(self, full=False):
+        """Set navdata mode
+
+        Args:
+            full: False for the navdata demo mode, True for all the options
+        """
+        flag = "FALSE" if full else "TRUE"
+        await self._Config("general:navdata_demo", flag)
+
+    async def SetARDroneName(self, name):
+        """Set drone name
+
+        Args:
+            name: drone name
+        """
+        await self._Config("general:ardrone_name", name)
+
+    async def _Config(self, option, value):
+        """Send an AT*CONFIG command and wait for its ACK
+        """
+        await self._Sequence(self._SConfig([(option, DroneConfig.Text(value))]))
+
+    async def _SConfig(self, items, ids=None):
+        """Send AT*CONFIG commands in a burst and wait for the ACK after it
+
+        The values update the cached configuration; the keys are
+        invalidated if the ACK doesn't arrive
+        """
+        async with self._lock:
+            acked = False
+            try:
+                await self._ClearACK()
+                sent = self._loop.time()
+                for option, value in items:
+                    if(ids != None):
+                        self._Send(ATEncoder.ConfigIds(ids[0], ids[1], ids[2]))
+                    self._Send(ATEncoder.Config(option, value))
+                    self._config.Set(option, value)
+                await self._WaitACK(sent)
+                acked = True
+                await self._ClearACK()
+            except Exception as e:
+                # no cleanup code required
+                self._debug.Print("[AsyncARDrone2]: Config %s - %s" % (", ".join(option for option, value in items), e))
+                raise
+            finally:
+                if(not acked):
+                    for option, value in items:
+                        self._config.Invalidate(option)
+
+    async def SetConfig(self, items, ids=None, verify=False):
+        """Write several configuration options with one ACK cycle
+
+        Same as ARDrone2.SetConfig: the AT*CONFIG commands are sent in a
+        burst, sharing datagrams, and only the ACK after the burst is
+        awaited; the written values update the cached configuration
+
+        Args:
+            items: dict or list of ("section:key", value)
+            ids: (session, user, application) ids for multiconfiguration
+                 or None
+            verify: If true, every key is checked reading back the whole
+                 configuration dump (a full GetConfig round trip); else all
+                 of them are reported as applied once the ACK arrives
+
+        Returns:
+            dict with results ("section:key" -> True if applied), ok (all
+            of them applied), round_trip (seconds to the ACK) and time
+            (seconds to apply and verify the whole batch)
+
+        Throws:
+            Exception if the ACK doesn't arrive within ACK_TIMEOUT seconds
+        """
+        if(isinstance(items, dict)):
+            items = list(items.items())
+        # booleans as TRUE/FALSE, as in the dump
+        items = [(key, DroneConfig.Text(value)) for key, value in items]
+        start = self._loop.time()
+        await self._Sequence(self._SConfig(items, ids))
+        results = dict((key, True) for key, value in items)
+        if(verify):
+            # the drone runs the commands in order: the dump requested
+            # after the burst has all of them applied
+            await self._Sequence(self._SGetConfig())
+            for key, value in items:
+                results[key] = self._config.GetText(key) == value
+        return {
+            "results": results,
+            "ok": all(results.values()),
+            "round_trip": self._lastRoundTrip,
+            "time": self._loop.time() - start,
+        }
+
+    async def GetConfig(self, refresh=False):
+        """Get the drone configuration
+
+        The dump is fetched from the drone only the first time and after
+        InvalidateConfig(); the values written meanwhile update the cache
+
+        Args:
+            refresh: If true, fetch the dump even if the cache is valid
+
+        Returns:
+            DroneConfig object (str() gives the dump)
+        """
+        if(refresh or not self._config.IsValid()):
+            await self._Sequence(self._SGetConfig())
+        return self._config
+
+    def InvalidateConfig(self):
+        """Fetch the configuration dump again in the next GetConfig()
+        """
+        self._config.Invalidate()
+
+    async def _SGetConfig(self):
+        async with self._lock:
+            try:
+                # drop the answers nobody waited for
+                while(not self._answers.empty()):
+                    self._answers.get_nowait()
+                await self._ClearACK()
+                sent = self._loop.time()
+                self._Send(ATEncoder.CTRL_GET_CONFIG)
+                await self._WaitACK(sent)
+                await self._ClearACK()
+                if(not self._config.Load(await self._GetAnswer())):
+                    self._debug.Print("[AsyncARDrone2]: GetConfig: empty configuration")
+            except Exception as e:
+                # no cleanup code required
+                self._debug.Print("[AsyncARDrone2]: GetConfig: %s" % e)
+                raise
+
+    async def _SFlatTrim(self):
+        async with self._lock:
+            if(not self._IsSet(NavData.FLY_MASK)):
+                self._Send(ATEncoder.FTRIM)
+                await asyncio.sleep(AsyncARDrone2.COMMAND_DELAY)
+
+    async def FlatTrim(self):
+        await self._Sequence(self._SFlatTrim())
+
+    async def _SCalibrate(self):
+        async with self._lock:
+            if(self._IsSet(NavData.FLY_MASK)):
+                self._Send(ATEncoder.CALIB)
+
+    async def Calibrate(self):
+        await self._Sequence(self._SCalibrate())
+
+    async def _SRepeat(self, template, isSet, timeout):
+        """Send a command until the fly flag is set/clear
+
+        Throws:
+            Exception if the drone doesn't reach the state within timeout
+            seconds
+        """
+        async with self._lock:
+            self._setpoint = ATEncoder.HOVER
+            deadline = self._loop.time() + timeout
+            while(self._IsSet(NavData.FLY_MASK) != isSet):
+                if(self._loop.time() >= deadline):
+                    raise Exception("Timeout waiting for the drone to %s" % ("fly" if isSet else "land"))
+                self._Send(template)
+                await self._WaitState(NavData.FLY_MASK, isSet, AsyncARDrone2.COMMAND_DELAY)
+
+    async def TakeOff(self, timeout=MANEUVER_TIMEOUT):
+        """Take off, returns when the drone is flying
+
+        Throws:
+            Exception if the drone isn't flying within timeout seconds or
+            Emergency is called meanwhile
+        """
+        await self._Sequence(self._SRepeat(ATEncoder.REF_TAKEOFF, True, timeout))
+
+    async def Land(self, timeout=MANEUVER_TIMEOUT):
+        """Land, returns when the drone is landed
+
+        Preempts any other command (as the URGENT Land of ARDrone2): the
+        running and waiting commands, except other Land, are cancelled and
+        throw "Preempted by Land"
+
+        Throws:
+            Exception if the drone isn't landed within timeout seconds or
+            Emergency is called meanwhile
+        """
+        self._CancelSequences("Preempted by Land", urgent=False)
+        await self._Sequence(self._SRepeat(ATEncoder.REF_LAND, False, timeout), urgent=True)
+
+    async def Emergency(self):
+        """Emergency stop
+
+        Sent at once, without waiting for the running command; the running
+        and waiting commands are cancelled
+        """
+        self._setpoint = ATEncoder.HOVER
+        if(not self._IsSet(NavData.EMERGENCY_MASK)):
+            self._Send(ATEncoder.REF_EMERGENCY)
+            self._Flush()
+        self._CancelSequences("Cancelled by Emergency")
+        await asyncio.sleep(AsyncARDrone2.COMMAND_DELAY)
+
+    async def EmergencyReset(self):
+        """Leave the emergency mode
+
+        Sent at once, without waiting for the running command
+        """
+        if(self._IsSet(NavData.EMERGENCY_MASK)):
+            self._Send(ATEncoder.REF_EMERGENCY)
+            await asyncio.sleep(AsyncARDrone2.COMMAND_DELAY)
+            self._Send(ATEncoder.REF_LAND)
+            await asyncio.sleep(AsyncARDrone2.COMMAND_DELAY)
+
+    async def _SLedsAnim(self, anim, frecuency, duration):
+        async with self._lock:
+            self._Send(ATEncoder.LedsAnim(anim, frecuency, duration))
+            await asyncio.sleep(AsyncARDrone2.COMMAND_DELAY)
+
+    async def LedsAnim(self, anim, frecuency, duration):
+        await self._Sequence(self._SLedsAnim(anim, frecuency, duration))
+
+    async def Move(self, roll, pitch, gaz, yaw):
+        """Set the movement of the drone
+
+        With the scheduler (pcmdPeriod > 0) this only updates the setpoint,
+        sent every pcmdPeriod seconds while flying. Ignored if the drone is
+        not flying
+
+        Args:
+            roll, pitch, gaz, yaw: values between -1.0 and 1.0
+        """
+        if(not self._IsSet(NavData.FLY_MASK)):
+            return
+        template = ATEncoder.Move(roll, pitch, gaz, yaw)
+        if(self._tpilot != None):
+            self._setpoint = template
+        else:
+            self._Send(template)
+
+    async def Hover(self):
+        """Stay in the air in a fixed position (see Move)
+        """
+        if(not self._IsSet(NavData.FLY_MASK)):
+            return
+        if(self._tpilot != None):
+            self._setpoint = ATEncoder.HOVER
+        else:
+            self._Send(ATEncoder.HOVER)
+
+    def GetPCMDStats(self):
+        """Get the timing of the movement commands scheduler
+
+        Returns:
+            dict with ticks, missed, jitter_mean and jitter_max (see ARDrone2)
+        """
+        count = self._pcmdCount
+        mean = 0.0
+        if(count > 0):
+            mean = self._pcmdJitterSum / count
+        return {
+            "ticks": count,
+            "missed": self._pcmdMissed,
+            "jitter_mean": mean,
+            "jitter_max": self._pcmdJitterMax,
+        }
+
+    async def Stop(self):
+        """Cancel the tasks and close all the channels
+        """
+        self._debug.Print("[AsyncARDrone2]: Stopping...")
+        self._CancelSequences("Drone stopped")
+        for task in (self._tpilot, self._tcontrol):
+            if(task != None):
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._tpilot = None
+        self._tcontrol = None
+        if(self._navdata != None):
+            self._navdata.close()
+        if(self._writer != None):
+            self._writer.close()
+        self._Flush()
+        if(self._at != None):
+            self._at.close()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+import heapq
+import threading
+import time
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
+class Command:
+    """A command waiting in (or run by) a CommandQueue
+    """
+
+    def __init__(self, kind, priority, order, steps):
+        self.kind = kind
+        self.priority = priority
+        self.order = order
+        self.steps = steps
+        self.queued = _Now()
+        self.started = None
+        self.result = None
+        self.error = None
+        self.cancelled = None
+        self.done = threading.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class CommandQueue:
+    """Priority queue of drone commands run by one worker thread
+
+    A command is a generator: every step sends what it needs and yields
+    the maximum seconds to wait before the next step. The worker waits on
+    the given condition, so the drone state changes notified on it and
+    the new commands wake it up early. Between two steps a queued command
+    with a higher priority (lower number) preempts the running one, which
+    fails with an exception.
+
+    Usage:
+        def steps(command):
+            while(not flying()):
+                send()
+                yield 0.01
+            command.result = True
+
+        queue = CommandQueue(debug)
+        queue.Submit("TakeOff", CommandQueue.NORMAL, steps)
+        ...
+        queue.Stop()
+    """
+    URGENT = 0      # landing: preempts the normal commands
+    NORMAL = 1
+
+    def __init__(self, debug, cond=None):
+        """Constructor
+
+        Args:
+            debug: Debug object
+            cond: threading.Condition to wait on between steps, notified
+                  by the owner when the awaited state changes
+        """
+        self._debug = debug
+        self._cond = cond
+        if(self._cond == None):
+            self._cond = threading.Condition()
+        self._queue = []
+        self._order = 0
+        self._current = None
+        self._stats = {}
+        self._tcommands = threading.Thread(target=self._TCommands, args=(), name="TCommands")
+        self._running = True
+        self._tcommands.start()
+
+    def _Finish(self, command, error):
+        """Complete a command and account its times (lock must be held)
+        """
+        now = _Now()
+        started = command.started
+        if(started == None):
+            started = now
+        self._Account(command.kind, started - command.queued, now - started,
+                      error, command.cancelled != None)
+        command.error = error
+        command.done.set()
+
+    def _Account(self, kind, wait, run, error=None, preempted=False):
+        """Add a command to the statistics of its kind
+        """
+        stats = self._stats.get(kind)
+        if(stats == None):
+            stats = {"count": 0, "wait_sum": 0.0, "wait_max": 0.0,
+                     "run_sum": 0.0, "run_max": 0.0, "preempted": 0, "failed": 0}
+            self._stats[kind] = stats
+        stats["count"] = stats["count"] + 1
+        stats["wait_sum"] = stats["wait_sum"] + wait
+        stats["wait_max"] = max(stats["wait_max"], wait)
+        stats["run_sum"] = stats["run_sum"] + run
+        stats["run_max"] = max(stats["run_max"], run)
+        if(preempted):
+            stats["preempted"] = stats["preempted"] + 1
+        elif(error != None):
+            stats["failed"] = stats["failed"] + 1
+
+    def _TCommands(self, *args):
+        """Thread to run the commands by priority, one step at a time
+        """
+        current = None
+        delay = 0
+        while(True):
+            self._cond.acquire()
+            try:
+                if(current == None):
+                    while(not self._queue and self._running):
+                        self._cond.wait(1.0)
+                    if(not self._running):
+                        # nobody will run them: their Submit() must return
+                        self._CancelQueued("Command queue stopped")
+                        break
+                    current = heapq.heappop(self._queue)
+                    current.started = _Now()
+                    self._current = current
+                else:
+                    if(delay > 0 and current.cancelled == None and
+                       not (self._queue and self._queue[0].priority < current.priority)):
+                        self._cond.wait(delay)
+                    if(current.cancelled == None and self._queue and
+                       self._queue[0].priority < current.priority):
+                        current.cancelled = "Preempted by %s" % self._queue[0].kind
+                    if(current.cancelled != None):
+                        current.steps.close()
+                        self._Finish(current, Exception(current.cancelled))
+                        current = None
+                        self._current = None
+                        continue
+            finally:
+                self._cond.release()
+            try:
+                delay = next(current.steps) or 0
+                continue
+            except StopIteration:
+                error = None
+            except Exception as e:
+                error = e
+            self._cond.acquire()
+            try:
+                self._Finish(current, error)
+                current = None
+                self._current = None
+            finally:
+                self._cond.release()
+        self._debug.Print("[TCommands]: Aborting the thread")
+
+    def Submit(self, kind, priority, steps, wait=True):
+        """Queue a command
+
+        Args:
+            kind: name of the command, for the statistics
+            priority: URGENT or NORMAL
+            steps: def steps(command) generator function
+            wait: If true, wait for the command to finish
+
+        Returns:
+            command.result if wait, else the Command object
+
+        Throws:
+            The exception of the command (wait only), also when it is
+            preempted or cancelled
+        """
+        self._cond.acquire()
+        try:
+            if(not self._running):
+                raise Exception("Command queue stopped")
+            self._order = self._order + 1
+            command = Command(kind, priority, self._order, None)
+            command.steps = steps(command)
+            heapq.heappush(self._queue, command)
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+        if(not wait):
+            return command
+        while(not command.done.wait(1.0)):
+            pass
+        if(command.error != None):
+            raise command.error
+        return command.result
+
+    def Cancel(self, reason):
+        """Cancel the running command (at its next step) and the queued ones
+
+        Args:
+            reason: message of the exception of the cancelled commands
+        """
+        self._cond.acquire()
+        try:
+            if(self._current != None):
+                self._current.cancelled = reason
+            self._CancelQueued(reason)
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def _CancelQueued(self, reason):
+        """Finish the queued commands with an exception (lock must be held)
+        """
+        queued = self._queue
+        self._queue = []
+        for command in queued:
+            command.cancelled = reason
+            self._Finish(command, Exception(reason))
+
+    def Record(self, kind, wait, run):
+        """Account a command run outside the queue
+        """
+        self._cond.acquire()
+        try:
+            self._Account(kind, wait, run)
+        finally:
+            self._cond.release()
+
+    def GetStats(self):
+        """Get the statistics per kind of command
+
+        Returns:
+            dict kind -> dict with count, wait_mean, wait_max (seconds in
+            the queue), run_mean, run_max, preempted and failed
+        """
+        self._cond.acquire()
+        try:
+            result = {}
+            for kind, stats in self._stats.items():
+                count = stats["count"]
+                result[kind] = {
+                    "count": count,
+                    "wait_mean": stats["wait_sum"] / count,
+                    "wait_max": stats["wait_max"],
+                    "run_mean": stats["run_sum"] / count,
+                    "run_max": stats["run_max"],
+                    "preempted": stats["preempted"],
+                    "failed": stats["failed"],
+                }
+            return result
+        finally:
+            self._cond.release()
+
+    def Stop(self):
+        """Cancel all the commands and stop the worker thread
+        """
+        self._cond.acquire()
+        try:
+            # in the same lock section: a Submit() can't queue a command
+            # between the cancellation and the stop
+            self._running = False
+            if(self._current != None):
+                self._current.cancelled = "Command queue stopped"
+            self._CancelQueued("Command queue stopped")
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+        self._tcommands.join()
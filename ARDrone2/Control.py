@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 import socket
 import threading
-import time
+
+try:
+    import Queue as queue       # python 2
+except ImportError:
+    import queue
 
 class Control:
     """Clase para recibir data de CONTROL desde la puerta 5559
 
+    Los mensajes del drone terminan en NUL; se leen en bloques sobre un
+    buffer reutilizable y cada mensaje completo se deja en una cola
+
     Uso:
         debug = Debug()
         control = Control("192.168.1.1", debug)
@@ -17,6 +24,8 @@ class Control:
 
     """
     CONTROL_PORT = 5559
+    BUFFER_SIZE = 8192      # tamaño inicial del buffer, crece si un mensaje no cabe
+    MAX_ANSWERS = 16        # mensajes en espera; si se llena se descarta el más antiguo
 
     def __init__(self, address, debug):
         """Constructor
@@ -27,54 +36,98 @@ class Control:
         """
         self._address = address
         self._debug = debug
-        self._data = ''
+        self._answers = queue.Queue(Control.MAX_ANSWERS)
+        self._dropped = 0
         self._socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
         self._socket.settimeout(None)
-        self._running = False
         self._tcontrol = threading.Thread(target=self._TControl, args=(), name="TControl")
+        self._running = True
         self._tcontrol.start()
-        while(not self._running):
-            time.sleep(0.01)
+
+    def _Put(self, data):
+        """Deja un mensaje en la cola, descartando el más antiguo si está llena
+        """
+        while(True):
+            try:
+                self._answers.put_nowait(data)
+                return
+            except queue.Full:
+                try:
+                    self._answers.get_nowait()
+                    self._dropped = self._dropped + 1
+                except queue.Empty:
+                    pass
 
     def _TControl(self, *args):
         """Hilo para recibir la data desde el drone
         """
-        self._running = True
         try:
-            data = ''
+            buf = bytearray(Control.BUFFER_SIZE)
+            view = memoryview(buf)
+            used = 0
             self._socket.connect((self._address, Control.CONTROL_PORT))
             while(True):
-                c = self._socket.recv(1)
-                if(not c):
-                    raise socket.error
-                if(ord(c) == 0):
-                    self._data = data
-                    data = ''
-                else:
-                    data = data + c
+                if(used == len(buf)):
+                    # el mensaje no cabe: duplica el buffer
+                    bigger = bytearray(2 * len(buf))
+                    bigger[:used] = buf
+                    buf = bigger
+                    view = memoryview(buf)
+                n = self._socket.recv_into(view[used:])
+                if(not n):
+                    raise socket.error("Conexión cerrada por el drone")
+                end = used + n
+                start = 0
+                # sólo se busca en lo recién recibido
+                idx = buf.find(b"\x00", used, end)
+                while(idx >= 0):
+                    self._Put(bytes(buf[start:idx]))
+                    start = idx + 1
+                    idx = buf.find(b"\x00", start, end)
+                if(start > 0):
+                    # mueve el mensaje incompleto al inicio
+                    buf[:end-start] = buf[start:end]
+                used = end - start
         except Exception as e:
             # no se requiere código de limpieza
             self._debug.Print("[TControl]: %s" % e)
         self._debug.Print("[TControl]: Abortando el hilo")
 
-    def GetAnswer(self):
-        """Obtiene la data de control del último comando AT
+    def GetAnswer(self, timeout=3.0):
+        """Obtiene el siguiente mensaje de control
+
+        Espera hasta que el hilo de control deje un mensaje en la cola
+
+        Args:
+            timeout: segundos máximos de espera
+
+        Retorna:
+            La data de control (bytes) o b'' en caso de error
+        """
+        try:
+            return self._answers.get(True, timeout)
+        except queue.Empty:
+            self._debug.Print("[TControl]: No hay data de control desde el drone")
+            return b""
+
+    def Clear(self):
+        """Descarta los mensajes que nadie leyó
 
         Retorna:
-            La data de control o '' en caso de error
+            La cantidad de mensajes descartados
+        """
+        count = 0
+        while(True):
+            try:
+                self._answers.get_nowait()
+                count = count + 1
+            except queue.Empty:
+                return count
+
+    def GetDropped(self):
+        """Retorna la cantidad de mensajes descartados por tener la cola llena
         """
-        # espera ocupada
-        t = time.time()
-        while(self._data == ''):
-            if((time.time()-t)>3):
-                self._debug.Print("[TControl]: No hay data de control desde el drone")
-                break
-            time.sleep(0.01)
-
-        # la data
-        data = self._data
-        self._data = ''
-        return data
+        return self._dropped
 
     def Stop(self):
         """Detiene el hilo de control
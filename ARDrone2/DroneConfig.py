@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import threading
+
+class DroneConfig:
+    """Cache of the drone configuration
+
+    The dump sent by the drone on the control port ("section:key = value"
+    lines) is parsed into a dictionary of typed values: TRUE/FALSE as
+    bool, integers, floats and the rest as strings. The values written
+    with ATCommand._Config update the cache; the dump must be fetched
+    again only after Invalidate().
+
+    Usage:
+        config = drone.GetConfig()
+        config["control:altitude_max"]      # 3000
+        config.Get("video:video_codec")     # 129
+        print(config)                       # the dump
+    """
+
+    def __init__(self, dump=None):
+        """Constructor
+
+        Args:
+            dump: configuration dump to load or None (invalid cache)
+        """
+        self._lock = threading.Lock()
+        self._keys = []
+        self._raw = {}
+        self._values = {}
+        self._valid = False
+        if(dump):
+            self.Load(dump)
+
+    def _Lock(self):
+        """Acquire the lock
+        """
+        self._lock.acquire()
+
+    def _Unlock(self):
+        """Release the lock
+        """
+        self._lock.release()
+
+    @staticmethod
+    def Convert(text):
+        """Typed value of a configuration text
+
+        Returns:
+            bool, int, float or the same text
+        """
+        if(text == "TRUE"):
+            return True
+        if(text == "FALSE"):
+            return False
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    @staticmethod
+    def Text(value):
+        """Configuration text of a value (as sent in AT*CONFIG)
+        """
+        if(value is True):
+            return "TRUE"
+        if(value is False):
+            return "FALSE"
+        if(isinstance(value, bytes) and not isinstance(value, str)):
+            return value.decode("utf-8", "replace")
+        return "%s" % value
+
+    @staticmethod
+    def Parse(dump):
+        """Parse a configuration dump
+
+        Args:
+            dump: the dump as received (bytes or text)
+
+        Returns:
+            list of (key, text) in the order of the dump
+        """
+        dump = DroneConfig.Text(dump)
+        items = []
+        for line in dump.splitlines():
+            key, sep, text = line.partition("=")
+            key = key.strip()
+            if(not sep or not key):
+                continue
+            items.append((key, text.strip()))
+        return items
+
+    def Load(self, dump):
+        """Replace the cache with a configuration dump
+
+        Returns:
+            False if the dump has no values (the cache stays invalid)
+        """
+        items = DroneConfig.Parse(dump)
+        try:
+            self._Lock()
+            self._keys = []
+            self._raw = {}
+            self._values = {}
+            for key, text in items:
+                if(key not in self._raw):
+                    self._keys.append(key)
+                self._raw[key] = text
+                self._values[key] = DroneConfig.Convert(text)
+            self._valid = len(items) > 0
+            return self._valid
+        finally:
+            self._Unlock()
+
+    def Set(self, key, value):
+        """Write through: update a value sent to the drone
+
+        Args:
+            key: "section:key"
+            value: value as sent (text, number or bool)
+        """
+        text = DroneConfig.Text(value)
+        try:
+            self._Lock()
+            if(key not in self._raw):
+                self._keys.append(key)
+            self._raw[key] = text
+            self._values[key] = DroneConfig.Convert(text)
+        finally:
+            self._Unlock()
+
+    def Invalidate(self, key=None):
+        """Mark the cache (or only one key) as stale
+
+        Args:
+            key: "section:key" whose value is unknown, None for all. Without
+                 the key the cache is invalid until the next Load()
+        """
+        try:
+            self._Lock()
+            if(key is None):
+                self._valid = False
+            elif(key in self._raw):
+                self._keys.remove(key)
+                del self._raw[key]
+                del self._values[key]
+                self._valid = False
+        finally:
+            self._Unlock()
+
+    def IsValid(self):
+        """True if the cache holds a complete dump
+        """
+        return self._valid
+
+    def Get(self, key, default=None):
+        """Get a typed value
+
+        Args:
+            key: "section:key"
+            default: value returned if the key is not in the cache
+        """
+        return self._values.get(key, default)
+
+    def GetText(self, key, default=None):
+        """Get a value as text, as in the dump
+        """
+        return self._raw.get(key, default)
+
+    def GetSection(self, section):
+        """Get the typed values of a section
+
+        Returns:
+            dict key (without the section) -> value
+        """
+        try:
+            self._Lock()
+            prefix = section + ":"
+            return dict((key[len(prefix):], self._values[key])
+                        for key in self._keys if key.startswith(prefix))
+        finally:
+            self._Unlock()
+
+    def Keys(self):
+        """Get the keys in the order of the dump
+        """
+        try:
+            self._Lock()
+            return list(self._keys)
+        finally:
+            self._Unlock()
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self.Keys())
+
+    def __str__(self):
+        try:
+            self._Lock()
+            return "".join("%s = %s\n" % (key, self._raw[key]) for key in self._keys)
+        finally:
+            self._Unlock()
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+import select
+import threading
+import time
+
+from ATCommand import ATCommand
+from ATEncoder import ATEncoder
+from NavData import NavData
+from UDPTransport import UDPTransport
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
+class FleetDrone:
+    """State of one drone of a Fleet (updated by the reactor thread)
+    """
+
+    def __init__(self, index, address, localPort):
+        self.index = index
+        self.address = address
+        self.localPort = localPort
+        self.navData = None
+        self.atCommand = None
+        self.droneState = None
+        self.options = None
+        self.setpoint = ATEncoder.HOVER
+        self.lastWatchDog = None
+        self.packets = 0
+        self.navdataTime = 0.0
+        self.pcmdTime = 0.0
+
+    def IsSet(self, mask):
+        """Bitwise test of the drone state (False before the first navdata)
+        """
+        return self.droneState != None and (self.droneState & mask) != 0
+
+
+class Fleet:
+    """Several drones driven from one reactor thread
+
+    Every drone gets its own local navdata port (basePort + index) and
+    non blocking sockets; a single thread select()s over all the navdata
+    sockets, runs the callbacks and sends the movement setpoints at a
+    fixed rate. The control port and video are not opened.
+
+    Usage:
+        def callback(index, droneState, options):
+            ...
+
+        debug = Debug()
+        fleet = Fleet(["192.168.1.11", "192.168.1.12"], debug, callback)
+        fleet.TakeOffAll()
+        fleet.Broadcast(0, -0.2, 0, 0)
+        ...
+        fleet.LandAll()
+        print(fleet.GetStats())
+        fleet.Stop()
+    """
+    COMMAND_DELAY = 0.01    # resend period of TakeOffAll/LandAll
+    PCMD_PERIOD = 0.03      # movement commands every 30 ms (Developer Guide)
+    NAVDATA_TIMEOUT = 4.0   # max seconds waiting for the first navdata
+    MANEUVER_TIMEOUT = 10.0 # max seconds for TakeOffAll/LandAll
+
+    # flags that wake up the threads waiting for a drone state
+    _WAKE_MASK = NavData.FLY_MASK | NavData.EMERGENCY_MASK
+
+    def __init__(self, addresses, debug, navdataCallback=None,
+                 basePort=NavData.NAVDATA_PORT, pcmdPeriod=PCMD_PERIOD):
+        """Constructor
+
+        Args:
+            addresses: list of drone addresses/hostnames
+            debug: Debug object
+            navdataCallback: Method to call with the navdata, in the reactor
+                      thread (must not block)
+                      def navdataCallback(index, droneState, options):
+                         ... index in addresses
+            basePort: local navdata port of the first drone, the next ones
+                      use the following ports
+            pcmdPeriod: seconds between the movement commands sent to the
+                      flying drones. 0 sends them only on Move/Broadcast
+
+        Throws:
+            Exception if a drone doesn't send navdata, or any exception
+            throws by the sockets
+        """
+        self._debug = debug
+        self._navdataCallback = navdataCallback
+        self._pcmdPeriod = pcmdPeriod
+        self._stateCond = threading.Condition()
+        self._drones = []
+        self._loops = 0
+        self._ticks = 0
+        self._missed = 0
+        self._busy = 0.0
+        self._started = None
+        self._running = False
+        self._treactor = None
+        try:
+            for idx in range(len(addresses)):
+                drone = FleetDrone(idx, UDPTransport.Resolve(addresses[idx]), basePort + idx)
+                self._drones.append(drone)
+                drone.atCommand = ATCommand(drone.address, debug, blocking=False)
+                drone.navData = NavData(drone.address,
+                                        lambda droneState, options, drone=drone: self._DoNavData(drone, droneState, options),
+                                        debug, localPort=drone.localPort, threaded=False)
+                debug.Print("[Fleet]: Drone %d (%s) OK" % (idx, drone.address))
+        except Exception as e:
+            debug.Print("[Fleet]: %s" % e)
+            self.Stop()
+            raise
+        self._treactor = threading.Thread(target=self._TReactor, args=(), name="TFleet")
+        self._running = True
+        self._treactor.start()
+        if(not self._WaitAll(0, False, Fleet.NAVDATA_TIMEOUT)):
+            missing = [drone.address for drone in self._drones if drone.droneState == None]
+            self.Stop()
+            msg = "No navdata from %s" % ", ".join(missing)
+            debug.Print("[Fleet]: %s" % msg)
+            raise Exception(msg)
+
+    def _DoNavData(self, drone, droneState, options):
+        """Method to receive the navdata of a drone (reactor thread)
+        """
+        previous = drone.droneState
+        drone.droneState = droneState
+        drone.options = options
+        if(previous == None or ((droneState ^ previous) & Fleet._WAKE_MASK)):
+            self._stateCond.acquire()
+            self._stateCond.notify_all()
+            self._stateCond.release()
+
+        # prevents disconnection: at once on the rising edge, then at most
+        # every COMMAND_DELAY while the flag stays set
+        if(droneState & NavData.COM_WATCHDOG_MASK):
+            now = _Now()
+            if(drone.lastWatchDog == None or previous == None or
+               not (previous & NavData.COM_WATCHDOG_MASK) or
+               now - drone.lastWatchDog >= Fleet.COMMAND_DELAY):
+                drone.lastWatchDog = now
+                try:
+                    drone.atCommand.WatchDog()
+                except Exception as e:
+                    # no cleanup code required
+                    self._debug.Print("[Fleet]: WatchDog %d - %s" % (drone.index, e))
+
+        if(self._navdataCallback != None):
+            self._navdataCallback(drone.index, droneState, options)
+
+    def _TReactor(self):
+        """Thread to receive the navdata of all the drones and send the
+        setpoints of the flying ones every pcmdPeriod seconds
+        """
+        owners = {}
+        for drone in self._drones:
+            owners[drone.navData.GetSocket()] = drone
+        sockets = list(owners.keys())
+        period = self._pcmdPeriod
+        self._started = _Now()
+        tick = self._started
+        while(self._running):
+            timeout = 1.0
+            if(period > 0):
+                timeout = min(max(tick - _Now(), 0.0), timeout)
+            try:
+                readable = select.select(sockets, [], [], timeout)[0]
+            except Exception as e:
+                self._debug.Print("[TFleet]: %s" % e)
+                break
+            t0 = _Now()
+            for sock in readable:
+                drone = owners[sock]
+                t = _Now()
+                try:
+                    if(drone.navData.Receive()):
+                        drone.packets = drone.packets + 1
+                except Exception as e:
+                    self._debug.Print("[TFleet]: NavData %d - %s" % (drone.index, e))
+                drone.navdataTime = drone.navdataTime + (_Now() - t)
+            if(period > 0 and _Now() >= tick):
+                for drone in self._drones:
+                    if(not drone.IsSet(NavData.FLY_MASK)):
+                        continue
+                    t = _Now()
+                    try:
+                        drone.atCommand.Send(drone.setpoint)
+                    except Exception as e:
+                        self._debug.Print("[TFleet]: PCMD %d - %s" % (drone.index, e))
+                    drone.pcmdTime = drone.pcmdTime + (_Now() - t)
+                self._ticks = self._ticks + 1
+                tick = tick + period
+                late = _Now() - tick
+                if(late > period):
+                    missed = int(late / period)
+                    self._missed = self._missed + missed
+                    tick = tick + missed * period
+            self._busy = self._busy + (_Now() - t0)
+            self._loops = self._loops + 1
+        self._debug.Print("[TFleet]: Aborting the thread")
+
+    def _WaitAll(self, mask, isSet, timeout):
+        """Wait for the flags in mask (one of _WAKE_MASK) to be set/clear in
+        all the drones. With mask 0 it waits only for their first navdata
+
+        Returns:
+            False on timeout
+        """
+        deadline = _Now() + timeout
+        try:
+            self._stateCond.acquire()
+            while(self._Pending(mask, isSet)):
+                remaining = deadline - _Now()
+                if(remaining <= 0):
+                    return False
+                # notify() wakes us at once on every change of the flags
+                self._stateCond.wait(remaining)
+            return True
+        finally:
+            self._stateCond.release()
+
+    def _Pending(self, mask, isSet):
+        """Drones whose flags in mask are not yet set/clear
+        """
+        return [drone for drone in self._drones
+                if drone.droneState == None or drone.IsSet(mask) != isSet]
+
+    def _Repeat(self, template, mask, isSet, timeout):
+        """Send a command to the drones until their flags in mask are
+        set/clear
+
+        Returns:
+            True if all the drones reached the state within timeout seconds
+        """
+        for drone in self._drones:
+            drone.setpoint = ATEncoder.HOVER
+        deadline = _Now() + timeout
+        while(True):
+            pending = self._Pending(mask, isSet)
+            if(not pending):
+                return True
+            remaining = deadline - _Now()
+            if(remaining <= 0):
+                self._debug.Print("[Fleet]: Timeout for drones %s" % [drone.index for drone in pending])
+                return False
+            for drone in pending:
+                drone.atCommand.Send(template)
+            # the command is resent every COMMAND_DELAY; a change of the
+            # flags ends the wait at once
+            self._WaitAll(mask, isSet, min(remaining, Fleet.COMMAND_DELAY))
+
+    def __len__(self):
+        return len(self._drones)
+
+    def GetDrone(self, index):
+        """Get the FleetDrone object of a drone
+        """
+        return self._drones[index]
+
+    def GetDroneState(self, index):
+        """Get the drone state of a drone
+        """
+        return self._drones[index].droneState
+
+    def TakeOffAll(self, timeout=MANEUVER_TIMEOUT):
+        """Take off all the drones
+
+        Returns:
+            True if all of them are flying within timeout seconds
+        """
+        return self._Repeat(ATEncoder.REF_TAKEOFF, NavData.FLY_MASK, True, timeout)
+
+    def LandAll(self, timeout=MANEUVER_TIMEOUT):
+        """Land all the drones
+
+        Returns:
+            True if all of them landed within timeout seconds
+        """
+        return self._Repeat(ATEncoder.REF_LAND, NavData.FLY_MASK, False, timeout)
+
+    def EmergencyAll(self):
+        """Send the emergency command to all the drones not in emergency
+        """
+        for drone in self._drones:
+            if(not drone.IsSet(NavData.EMERGENCY_MASK)):
+                drone.atCommand.Send(ATEncoder.REF_EMERGENCY)
+
+    def Move(self, index, roll, pitch, gaz, yaw):
+        """Set the movement of one drone (see ARDrone2.Move)
+        """
+        self._SetPoint([self._drones[index]], ATEncoder.Move(roll, pitch, gaz, yaw))
+
+    def Hover(self, index):
+        """Stay in the air in a fixed position (see Move)
+        """
+        self._SetPoint([self._drones[index]], ATEncoder.HOVER)
+
+    def Broadcast(self, roll, pitch, gaz, yaw):
+        """Set the same movement to all the drones (encoded once)
+        """
+        self._SetPoint(self._drones, ATEncoder.Move(roll, pitch, gaz, yaw))
+
+    def HoverAll(self):
+        """All the drones stay in the air in a fixed position
+        """
+        self._SetPoint(self._drones, ATEncoder.HOVER)
+
+    def _SetPoint(self, drones, template):
+        """Set the setpoint of the flying drones; without the scheduler
+        (pcmdPeriod 0) it is sent at once
+        """
+        for drone in drones:
+            if(not drone.IsSet(NavData.FLY_MASK)):
+                continue
+            drone.setpoint = template
+            if(self._pcmdPeriod <= 0):
+                drone.atCommand.Send(template)
+
+    def GetStats(self):
+        """Get the load of the reactor and the overhead of every drone
+
+        Returns:
+            dict with elapsed (seconds), loops, ticks, missed (ticks
+            skipped for falling behind), busy (seconds working),
+            utilization (busy / elapsed) and drones, a list with a dict per
+            drone: address, localPort, packets, navdata_time, pcmd_time,
+            us_per_packet and load (fraction of the reactor time)
+        """
+        elapsed = 0.0
+        if(self._started != None):
+            elapsed = _Now() - self._started
+        drones = []
+        for drone in self._drones:
+            busy = drone.navdataTime + drone.pcmdTime
+            perPacket = 0.0
+            if(drone.packets > 0):
+                perPacket = drone.navdataTime * 1e6 / drone.packets
+            load = 0.0
+            if(elapsed > 0):
+                load = busy / elapsed
+            drones.append({
+                "address": drone.address,
+                "localPort": drone.localPort,
+                "packets": drone.packets,
+                "navdata_time": drone.navdataTime,
+                "pcmd_time": drone.pcmdTime,
+                "us_per_packet": perPacket,
+                "load": load,
+            })
+        utilization = 0.0
+        if(elapsed > 0):
+            utilization = self._busy / elapsed
+        return {
+            "elapsed": elapsed,
+            "loops": self._loops,
+            "ticks": self._ticks,
+            "missed": self._missed,
+            "busy": self._busy,
+            "utilization": utilization,
+            "drones": drones,
+        }
+
+    def Stop(self):
+        """Stop the reactor and close all the channels
+        """
+        self._debug.Print("[Fleet]: Stopping...")
+        self._running = False
+        if(self._treactor != None):
+            self._treactor.join()
+        for drone in self._drones:
+            if(drone.navData != None):
+                drone.navData.Stop()
+            if(drone.atCommand != None):
+                drone.atCommand.Stop()
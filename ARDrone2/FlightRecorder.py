@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+
+from NavData import NavData
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
+class FlightRecorder:
+    """Append only binary log of the navdata packets and AT commands
+
+    Every record is written to 'path' and a fixed size entry for it to
+    'path.idx' (the seek index used by FlightReplay).
+
+    Record:  kind (u8), time (f64), sequence (u32), size (u32), payload
+    Index:   offset (u64), time (f64), kind (u8), sequence (u32)
+
+    Usage:
+        recorder = FlightRecorder("flight.rec")
+        drone = ARDrone2("192.168.1.1", debug, recorder=recorder)
+        ...
+        drone.Stop()
+        recorder.Close()
+    """
+    MAGIC = b"ARDREC01"
+    NAVDATA = 1
+    ATCOMMAND = 2
+
+    _RECORD = struct.Struct("<BdII")
+    _INDEX = struct.Struct("<QdBI")
+
+    def __init__(self, path):
+        """Constructor
+
+        Args:
+            path: log file to create (overwritten if exists)
+        """
+        self._lock = threading.Lock()
+        self._path = path
+        self._file = open(path, "wb")
+        self._index = open(path + ".idx", "wb")
+        self._file.write(FlightRecorder.MAGIC)
+        self._offset = len(FlightRecorder.MAGIC)
+        self._count = 0
+
+    def _Lock(self):
+        """Acquire the lock
+        """
+        self._lock.acquire()
+
+    def _Unlock(self):
+        """Release the lock
+        """
+        self._lock.release()
+
+    def Record(self, kind, sequence, payload):
+        """Append a record
+
+        Args:
+            kind: NAVDATA or ATCOMMAND
+            sequence: packet/command sequence number
+            payload: the raw bytes
+        """
+        t = _Now()
+        try:
+            self._Lock()
+            if(self._file is None):
+                return
+            header = FlightRecorder._RECORD.pack(kind, t, sequence & 0xFFFFFFFF, len(payload))
+            self._file.write(header)
+            self._file.write(payload)
+            self._index.write(FlightRecorder._INDEX.pack(self._offset, t, kind, sequence & 0xFFFFFFFF))
+            self._offset = self._offset + len(header) + len(payload)
+            self._count = self._count + 1
+        finally:
+            self._Unlock()
+
+    def RecordNavData(self, packet):
+        """Append a navdata packet as received from the drone
+        """
+        self.Record(FlightRecorder.NAVDATA, max(NavData._Sequence(packet), 0), packet)
+
+    def RecordATCommand(self, sequence, cmd):
+        """Append an AT command as sent to the drone
+        """
+        self.Record(FlightRecorder.ATCOMMAND, sequence, cmd)
+
+    def GetCount(self):
+        """Get the number of records written
+        """
+        return self._count
+
+    def Close(self):
+        """Flush and close the log
+        """
+        try:
+            self._Lock()
+            if(self._file is not None):
+                self._file.close()
+                self._index.close()
+                self._file = None
+                self._index = None
+        finally:
+            self._Unlock()
+
+
+class FlightReplay:
+    """Replay of a FlightRecorder log
+
+    The log is memory mapped and the payloads are handed out without
+    copying them. The navdata packets go through NavData.Decode and the
+    same callback signature used by NavData.
+
+    Usage:
+        def callback(droneState, options):
+            ...
+
+        replay = FlightReplay("flight.rec")
+        replay.SeekTime(30.0)              # seconds from the start
+        replay.Play(callback, speed=2.0)   # 2x; speed=None for max speed
+        replay.Close()
+    """
+
+    def __init__(self, path):
+        """Constructor
+
+        Args:
+            path: log written by FlightRecorder. If 'path.idx' is missing
+                  or incomplete the index is rebuilt scanning the log
+
+        Throws:
+            Exception if the file is not a flight log
+        """
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if(self._map[:len(FlightRecorder.MAGIC)] != FlightRecorder.MAGIC):
+            self.Close()
+            raise Exception("Not a flight log: %s" % path)
+        try:
+            self._view = memoryview(self._map)
+        except TypeError:
+            # no buffer interface (python 2): slices are copies
+            self._view = self._map
+        self._offsets = []
+        self._times = []
+        self._kinds = []
+        self._sequences = []
+        if(not self._LoadIndex(path + ".idx")):
+            self._Scan()
+        # navdata only, for the seeks by sequence number
+        self._navPositions = [i for i in range(len(self._kinds)) if self._kinds[i] == FlightRecorder.NAVDATA]
+        self._navSequences = [self._sequences[i] for i in self._navPositions]
+        self._position = 0
+
+    def _LoadIndex(self, path):
+        """Load the index file
+
+        Returns:
+            False if the index is missing or doesn't cover the log
+        """
+        if(not os.path.exists(path)):
+            return False
+        entry = FlightRecorder._INDEX
+        with open(path, "rb") as f:
+            data = f.read()
+        for idx in range(0, len(data) - entry.size + 1, entry.size):
+            offset, t, kind, sequence = entry.unpack_from(data, idx)
+            self._offsets.append(offset)
+            self._times.append(t)
+            self._kinds.append(kind)
+            self._sequences.append(sequence)
+        if(self._offsets):
+            offset = self._offsets[-1]
+            size = FlightRecorder._RECORD.unpack_from(self._map, offset)[3]
+            end = offset + FlightRecorder._RECORD.size + size
+        else:
+            end = len(FlightRecorder.MAGIC)
+        if(end != len(self._map)):
+            self._offsets, self._times, self._kinds, self._sequences = [], [], [], []
+            return False
+        return True
+
+    def _Scan(self):
+        """Rebuild the index scanning the log
+        """
+        record = FlightRecorder._RECORD
+        offset = len(FlightRecorder.MAGIC)
+        end = len(self._map)
+        while(offset + record.size <= end):
+            kind, t, sequence, size = record.unpack_from(self._map, offset)
+            if(offset + record.size + size > end):
+                break
+            self._offsets.append(offset)
+            self._times.append(t)
+            self._kinds.append(kind)
+            self._sequences.append(sequence)
+            offset = offset + record.size + size
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def GetDuration(self):
+        """Get the seconds between the first and last records
+        """
+        if(not self._times):
+            return 0.0
+        return self._times[-1] - self._times[0]
+
+    def Read(self, position):
+        """Read a record
+
+        Returns:
+            (kind, time, sequence, payload); the payload is a view over the
+            mapped file when possible
+        """
+        offset = self._offsets[position]
+        kind, t, sequence, size = FlightRecorder._RECORD.unpack_from(self._map, offset)
+        start = offset + FlightRecorder._RECORD.size
+        return (kind, t, sequence, self._view[start:start+size])
+
+    def Seek(self, position):
+        """Set the next record to play
+        """
+        self._position = min(max(position, 0), len(self._offsets))
+
+    def SeekTime(self, seconds):
+        """Set the next record to play to the first one at or after 'seconds'
+        from the start of the log
+        """
+        if(self._times):
+            self.Seek(bisect.bisect_left(self._times, self._times[0] + seconds))
+
+    def SeekSequence(self, sequence):
+        """Set the next record to play to the first navdata packet with a
+        sequence number equal or greater than 'sequence'
+        """
+        idx = bisect.bisect_left(self._navSequences, sequence)
+        if(idx < len(self._navPositions)):
+            self.Seek(self._navPositions[idx])
+        else:
+            self.Seek(len(self._offsets))
+
+    def Play(self, navdataCallback=None, atCallback=None, speed=1.0, count=None):
+        """Play the records from the current position
+
+        Args:
+            navdataCallback: def navdataCallback(droneState, options)
+            atCallback: def atCallback(sequence, command)
+            speed: 1.0 original speed, N for N times faster, None or 0 as
+                   fast as possible
+            count: maximum number of records to play
+
+        Returns:
+            The number of records played
+        """
+        played = 0
+        end = len(self._offsets)
+        if(count is not None):
+            end = min(end, self._position + count)
+        t0 = None
+        while(self._position < end):
+            kind, t, sequence, payload = self.Read(self._position)
+            self._position = self._position + 1
+            if(speed):
+                if(t0 is None):
+                    t0 = t
+                    wall0 = _Now()
+                delay = wall0 + (t - t0) / speed - _Now()
+                if(delay > 0):
+                    time.sleep(delay)
+            if(kind == FlightRecorder.NAVDATA):
+                if(navdataCallback is not None):
+                    err, droneState, sequenceNumber, options = NavData.Decode(payload)
+                    if(err == 0 or err == NavData.ERR_BAD_OPTIONS):
+                        navdataCallback(droneState, options)
+            elif(kind == FlightRecorder.ATCOMMAND):
+                if(atCallback is not None):
+                    atCallback(sequence, payload)
+            played = played + 1
+        return played
+
+    def Close(self):
+        """Release the mapped file
+        """
+        self._view = None
+        try:
+            self._map.close()
+        except BufferError:
+            # views still in use, released with them
+            pass
+        self._file.close()
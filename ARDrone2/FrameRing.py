@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
+class FrameRing:
+    """Ring of video frames in shared memory (multiprocessing.shared_memory)
+
+    One process (Video, through SharedMemorySink) writes the frames into
+    a fixed number of preallocated slots; any number of processes attach
+    to the ring by its name and read them as numpy arrays over the shared
+    buffer, without copies. The writer never waits for the readers: every
+    frame gets a sequence number (1, 2, ...) and each slot keeps the
+    number of the frame it holds (0 while it is being written), so a
+    reader detects the frames overwritten before or while it used them.
+    The readers don't lock anything: each one keeps its own cursor (see
+    FrameRingReader).
+
+    Layout: control block (int64), sequence number of every slot (int64),
+    frame number and capture time of every slot (float64) and the images
+
+    Usage:
+        # process with the video
+        video = Video(address, None, debug, decoder, sinks=[SharedMemorySink("ardrone2")])
+
+        # worker process
+        ring = FrameRing("ardrone2")
+        reader = ring.Reader()
+        while(True):
+            frame = reader.Read(1.0)
+            if(frame != None):
+                seq, number, captured, image = frame
+                ... process image (a view of the slot)
+                if(not reader.IsValid(seq)):
+                    ... the writer reused the slot meanwhile
+        ring.Close()
+    """
+    SLOTS = 8
+
+    # control block
+    _MAGIC = 0x41524432     # "ARD2"
+    _CTL_MAGIC = 0
+    _CTL_SLOTS = 1
+    _CTL_HEIGHT = 2
+    _CTL_WIDTH = 3
+    _CTL_CHANNELS = 4       # 0 for images with 2 dimensions (gray)
+    _CTL_SEQ = 5            # sequence number of the last frame written
+    _CTL_CLOSED = 6
+    _CTL_SIZE = 8
+
+    def __init__(self, name, shape=None, slots=SLOTS):
+        """Constructor
+
+        Args:
+            name: name of the shared memory block
+            shape: shape of the images (height, width[, channels]) to
+                   create the ring, None to attach to an existing one
+            slots: number of frames in the ring (create only)
+
+        Throws:
+            Exception if multiprocessing.shared_memory is not available or
+            the block is not a FrameRing, or any exception throws by
+            SharedMemory (e.g. the ring doesn't exist)
+        """
+        if(shared_memory == None):
+            raise Exception("FrameRing requires multiprocessing.shared_memory (Python 3.8+)")
+        self._owner = shape != None
+        if(self._owner):
+            height, width = shape[0], shape[1]
+            channels = 0
+            if(len(shape) > 2):
+                channels = shape[2]
+            size = FrameRing._Size(slots, height, width, channels)
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            FrameRing._Untrack(self._shm)
+        buf = self._shm.buf
+        self._control = numpy.ndarray((FrameRing._CTL_SIZE,), numpy.int64, buf, 0)
+        if(self._owner):
+            self._control[:] = 0
+            self._control[FrameRing._CTL_SLOTS] = slots
+            self._control[FrameRing._CTL_HEIGHT] = height
+            self._control[FrameRing._CTL_WIDTH] = width
+            self._control[FrameRing._CTL_CHANNELS] = channels
+        elif(self._control[FrameRing._CTL_MAGIC] != FrameRing._MAGIC):
+            self._control = None
+            self._shm.close()
+            raise Exception("%s is not a FrameRing" % name)
+        slots = int(self._control[FrameRing._CTL_SLOTS])
+        height = int(self._control[FrameRing._CTL_HEIGHT])
+        width = int(self._control[FrameRing._CTL_WIDTH])
+        channels = int(self._control[FrameRing._CTL_CHANNELS])
+        shape = (slots, height, width)
+        if(channels > 0):
+            shape = shape + (channels,)
+        offset = FrameRing._CTL_SIZE * 8
+        self._seqs = numpy.ndarray((slots,), numpy.int64, buf, offset)
+        offset = offset + slots * 8
+        self._meta = numpy.ndarray((slots, 2), numpy.float64, buf, offset)
+        offset = offset + slots * 16
+        self._images = numpy.ndarray(shape, numpy.uint8, buf, offset)
+        self._slots = slots
+        self._name = name
+        if(self._owner):
+            self._seqs[:] = 0
+            # readers attaching from now on see a complete ring
+            self._control[FrameRing._CTL_MAGIC] = FrameRing._MAGIC
+
+    @staticmethod
+    def _Size(slots, height, width, channels):
+        """Bytes of the shared memory block
+        """
+        return FrameRing._CTL_SIZE * 8 + slots * 24 + slots * height * width * max(channels, 1)
+
+    @staticmethod
+    def _Untrack(shm):
+        """Prevent the resource tracker of a reader process from unlinking
+        the block of the writer when the reader ends (Python < 3.13)
+        """
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            # no cleanup code required
+            pass
+
+    def GetName(self):
+        """Get the name of the shared memory block
+        """
+        return self._name
+
+    def GetShape(self):
+        """Get the shape of the images
+        """
+        return self._images.shape[1:]
+
+    def GetSlots(self):
+        """Get the number of slots
+        """
+        return self._slots
+
+    def GetLast(self):
+        """Get the sequence number of the last frame written (0 if none)
+        """
+        return int(self._control[FrameRing._CTL_SEQ])
+
+    def IsClosed(self):
+        """True when the writer closed the ring
+        """
+        return self._control[FrameRing._CTL_CLOSED] != 0
+
+    def Write(self, image, number=0, captured=0.0):
+        """Copy a frame into the next slot (writer only)
+
+        Args:
+            image: numpy uint8 array with the shape of the ring
+            number: frame number (see VideoFrame)
+            captured: capture time (see VideoFrame)
+
+        Returns:
+            The sequence number of the frame
+        """
+        seq = int(self._control[FrameRing._CTL_SEQ]) + 1
+        slot = seq % self._slots
+        # readers of the old frame see it is gone
+        self._seqs[slot] = 0
+        self._images[slot][...] = image
+        self._meta[slot, 0] = number
+        self._meta[slot, 1] = captured
+        self._seqs[slot] = seq
+        self._control[FrameRing._CTL_SEQ] = seq
+        return seq
+
+    def Get(self, seq):
+        """Get a frame by its sequence number, without copying it
+
+        Returns:
+            (number, captured, image) or None if the slot no longer (or not
+            yet) holds that frame. image is a view of the slot: check it
+            with IsValid(seq) after using it
+        """
+        slot = seq % self._slots
+        if(self._seqs[slot] != seq):
+            return None
+        number = int(self._meta[slot, 0])
+        captured = float(self._meta[slot, 1])
+        if(self._seqs[slot] != seq):
+            return None
+        return (number, captured, self._images[slot])
+
+    def IsValid(self, seq):
+        """True if the frame seq is still in its slot
+        """
+        return self._seqs[seq % self._slots] == seq
+
+    def Reader(self, latest=True):
+        """Create a reader with its own cursor (see FrameRingReader)
+        """
+        return FrameRingReader(self, latest)
+
+    def Close(self):
+        """Detach from the ring; the writer also destroys it
+        """
+        if(self._control is None):
+            return
+        if(self._owner):
+            self._control[FrameRing._CTL_CLOSED] = 1
+        # the views must be released before closing the block
+        self._control = None
+        self._seqs = None
+        self._meta = None
+        self._images = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # images still referenced by the caller: the block is unmapped
+            # when they are released
+            pass
+        if(self._owner):
+            self._shm.unlink()
+
+
+class FrameRingReader:
+    """Cursor of one reader of a FrameRing
+
+    It only lives in the process of the reader, so the readers never
+    block each other nor the writer. A reader that falls behind more
+    than the size of the ring loses the overwritten frames (counted).
+    """
+    POLL = 0.002    # seconds between checks while waiting a frame
+
+    def __init__(self, ring, latest=True):
+        """Constructor
+
+        Args:
+            ring: FrameRing object
+            latest: If true, Read() returns always the newest frame (the
+                    older ones are skipped); else the frames in order
+        """
+        self._ring = ring
+        self._latest = latest
+        self._cursor = ring.GetLast()
+        self._read = 0
+        self._lost = 0
+
+    def Read(self, timeout=0):
+        """Get the next frame
+
+        Args:
+            timeout: max seconds to wait for a new frame, None to wait
+                     until the ring is closed
+
+        Returns:
+            (seq, number, captured, image) or None. image is a view of
+            the slot (see FrameRing.Get)
+        """
+        ring = self._ring
+        deadline = None
+        if(timeout != None):
+            deadline = _Now() + timeout
+        while(True):
+            last = ring.GetLast()
+            while(last > self._cursor):
+                if(self._latest):
+                    seq = last
+                else:
+                    # the slots older than the ring size were reused
+                    seq = max(self._cursor + 1, last - ring.GetSlots() + 1)
+                frame = ring.Get(seq)
+                self._lost = self._lost + (seq - self._cursor - 1)
+                self._cursor = seq
+                if(frame != None):
+                    self._read = self._read + 1
+                    return (seq,) + frame
+                self._lost = self._lost + 1
+                last = ring.GetLast()
+            if(ring.IsClosed()):
+                return None
+            if(deadline != None and _Now() >= deadline):
+                return None
+            time.sleep(FrameRingReader.POLL)
+
+    def IsValid(self, seq):
+        """True if the frame seq was not overwritten (see FrameRing.IsValid)
+        """
+        return self._ring.IsValid(seq)
+
+    def GetStats(self):
+        """Get the counters of the reader
+
+        Returns:
+            (read, lost): frames read and frames skipped or overwritten
+            before being read
+        """
+        return (self._read, self._lost)
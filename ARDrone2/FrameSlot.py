@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
+class FrameSlot:
+    """Single slot exchange of the latest video frame
+
+    The producer always replaces the frame in the slot (it never waits);
+    a frame replaced before any consumer took it is counted as skipped.
+    Every consumer keeps the number of the last frame it got and asks
+    for a newer one, so several consumers can pull from the same slot.
+
+    Usage:
+        slot = FrameSlot()
+        slot.Put(frame)                     # producer thread
+
+        frame = slot.Get(last, 1.0)         # consumer thread
+        if(frame != None):
+            last = frame.number
+    """
+
+    def __init__(self):
+        """Constructor
+        """
+        self._cond = threading.Condition()
+        self._frame = None
+        self._taken = True
+        self._closed = False
+        self._put = 0
+        self._skipped = 0
+
+    def Put(self, frame):
+        """Leave a frame in the slot, replacing the previous one
+
+        Args:
+            frame: VideoFrame (or any object with a growing 'number')
+        """
+        self._cond.acquire()
+        try:
+            if(not self._taken):
+                self._skipped = self._skipped + 1
+            self._frame = frame
+            self._taken = False
+            self._put = self._put + 1
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def Get(self, after=0, timeout=None):
+        """Get the latest frame, waiting for one newer than 'after'
+
+        Args:
+            after: number of the last frame the consumer got
+            timeout: max seconds to wait, None to wait forever
+
+        Returns:
+            The frame or None on timeout or if the slot is closed
+        """
+        deadline = None
+        if(timeout != None):
+            deadline = _Now() + timeout
+        self._cond.acquire()
+        try:
+            while(not self._closed and (self._frame == None or self._frame.number <= after)):
+                if(deadline == None):
+                    self._cond.wait(1.0)
+                    continue
+                remaining = deadline - _Now()
+                if(remaining <= 0):
+                    return None
+                self._cond.wait(remaining)
+            if(self._closed):
+                return None
+            self._taken = True
+            return self._frame
+        finally:
+            self._cond.release()
+
+    def Peek(self):
+        """Get the latest frame without waiting (None if there is none)
+        """
+        return self._frame
+
+    def Close(self):
+        """Wake up the consumers; Get() returns None from now on
+        """
+        self._cond.acquire()
+        try:
+            self._closed = True
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def IsClosed(self):
+        """True after Close()
+        """
+        return self._closed
+
+    def GetStats(self):
+        """Get the slot counters
+
+        Returns:
+            (put, skipped): frames left in the slot and frames replaced
+            before any consumer got them
+        """
+        return (self._put, self._skipped)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import bisect
+
+class Histogram:
+    """Counts of durations in buckets given by their upper bounds in
+    milliseconds, plus an overflow bucket (shared by NavDataStats and
+    VideoLatency)
+
+    A duration equal to a bound is counted in that bucket.
+
+    Usage:
+        histogram = Histogram((1, 2, 5, 10))
+        histogram.Add(0.003)                # seconds
+        histogram.Get()                     # [(1, 0), (2, 0), (5, 1), (10, 0), (None, 0)]
+    """
+
+    def __init__(self, boundsMs):
+        """Constructor
+
+        Args:
+            boundsMs: ascending upper bounds (ms) of the buckets
+        """
+        self._bounds = list(boundsMs) + [None]
+        self._edges = [ms / 1000.0 for ms in boundsMs]
+        self.Reset()
+
+    def Reset(self):
+        """Set all the counts to 0
+        """
+        self._counts = [0] * len(self._bounds)
+
+    def Add(self, seconds):
+        """Count a duration
+
+        Args:
+            seconds: the duration
+        """
+        self._counts[bisect.bisect_left(self._edges, seconds)] += 1
+
+    def Get(self):
+        """Get the counts
+
+        Returns:
+            list of (upper bound ms or None for the overflow, count)
+        """
+        return list(zip(self._bounds, self._counts))
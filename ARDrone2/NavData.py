@@ -1,8 +1,22 @@
 # -*- coding: utf-8 -*-
+import select
 import socket
+import struct
 import threading
 import time
 
+from NavDataOptions import NavDataOptions
+from NavDataStats import NavDataStats
+from UDPTransport import UDPTransport, WOULDBLOCK
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
 class NavData:
     """Class to receive NavData from port 5554
 
@@ -16,6 +30,13 @@ class NavData:
         navdata.Stop()
     """
     NAVDATA_PORT = 5554
+    MAX_PACKET = 4096
+    CKS_TAG = 0xFFFF
+
+    # Precompiled packet layouts (little endian)
+    _HEADER = struct.Struct("<IIII")    # header, drone state, sequence, vision flag
+    _OPTION = struct.Struct("<HH")      # option id, option size
+    _CKS = struct.Struct("<HHI")        # checksum tag, size and data
 
     # Class errors
     ERR_UNEXPECTED_EXCEPTION = 1
@@ -71,7 +92,8 @@ class NavData:
     COM_WATCHDOG_MASK   = 1 << 30 #Communication Watchdog : (1) com problem, (0) Com is ok */
     EMERGENCY_MASK      = 1 << 31  #Emergency landing : (0) no emergency, (1) emergency */
 
-    def __init__(self, address, callback, debug):
+    def __init__(self, address, callback, debug, drain=False, recorder=None,
+                 localPort=NAVDATA_PORT, threaded=True):
         """Constructor
 
         Send "\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00" for
@@ -80,123 +102,290 @@ class NavData:
         Args:
             adress: Drone's address/hostname
             callback: Method to call when receive NavData.
-                      def callback(droneState):
+                      def callback(droneState, options):
                          ...
             debug: Debug object
+            drain: If true, all the pending packets are read at once and only
+                   the newest one is passed to the callback, which runs in
+                   its own thread (latest packet wins)
+            recorder: FlightRecorder to log every packet received
+            localPort: local port to receive the navdata (one per drone
+                   when controlling several drones)
+            threaded: If false, no thread is started and the owner must call
+                   Receive() when the socket (GetSocket) is readable
 
         Throws:
-            Any exception throws by socket.sendto()
+            Any exception throws by UDPTransport
         """
         self._address = address
         self._callback = callback
         self._debug = debug
         self._sequenceNumber = 0
-        self._socket = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        self._socket.bind(('', NavData.NAVDATA_PORT))
-        self._socket.settimeout(1.0)
+        self._drain = drain
+        self._recorder = recorder
+        self._stats = NavDataStats()
+        self._skipped = 0
+        self._pending = None
+        self._pendingCond = threading.Condition()
         try:
-            self._socket.sendto(
-                "\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00",
-                (self._address, NavData.NAVDATA_PORT))
+            self._transport = UDPTransport(address, NavData.NAVDATA_PORT,
+                                           localPort, threaded and not drain)
         except Exception as e:
             # no cleanup code required
             self._debug.Print("[NavData]: %s" % e)
             raise
+        self._socket = self._transport.GetSocket()
+        try:
+            self._transport.Send(
+                b"\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+        except Exception as e:
+            self._transport.Close()
+            self._debug.Print("[NavData]: %s" % e)
+            raise
         self._running = False
-        self._tnavdata = threading.Thread(target=self._TNavData, args=(), name="TNavData")
+        self._tnavdata = None
+        self._tcallback = None
+        if(not threaded):
+            return
+        if(drain):
+            self._tnavdata = threading.Thread(target=self._TNavDataDrain, args=(), name="TNavData")
+        else:
+            self._tnavdata = threading.Thread(target=self._TNavData, args=(), name="TNavData")
+        self._running = True
         self._tnavdata.start()
-        while(not self._running):
-            time.sleep(0.01)
+        if(drain):
+            self._tcallback = threading.Thread(target=self._TCallback, args=(), name="TNavDataCallback")
+            self._tcallback.start()
 
-    def _Unpack32(self, s):
-        """Convert 32bit drone integer to normal 32bit integer
+    @staticmethod
+    def _Checksum(packet, n):
+        """Sum of the first n bytes of the packet
         """
-        return (ord(s[3])<<24) + (ord(s[2])<<16) + (ord(s[1])<<8) + (ord(s[0])<<0)
+        if(numpy is not None):
+            return int(numpy.frombuffer(packet, numpy.uint8, n).sum())
+        return sum(bytearray(packet[:n]))
+
+    @staticmethod
+    def Decode(packet):
+        """Decode a navdata packet
 
-    def _Unpack16(self, s):
-        """Convert 16bit drone's integer to norma 16bit integer
+        All the fields are read in place with precompiled structs; the
+        options blocks are decoded lazily over the packet, no data is copied
+
+        Args:
+            packet: the packet as received from the drone (bytes)
+
+        Returns:
+            (error, droneState, sequenceNumber, options) where error is 0 or
+            one of the ERR_* codes and options is a NavDataOptions object.
+            With ERR_BAD_OPTIONS the other fields are valid but some options
+            blocks could be missing
         """
-        return (ord(s[1])<<8) + (ord(s[0])<<0)
+        plen = len(packet)
+        if(plen<24):
+            return (NavData.ERR_SMALL_PACKET, None, None, None)
+        view = memoryview(packet)
+        lastb = plen - 8
+        header, droneState, sequenceNumber, visionFlag = NavData._HEADER.unpack_from(view, 0)
+        cksId, cksSize, cksData = NavData._CKS.unpack_from(view, lastb)
+
+        if(cksId != NavData.CKS_TAG):
+            return (NavData.ERR_BAD_CKS_TAG, None, None, None)
+        if(cksData != NavData._Checksum(packet, lastb)):
+            return (NavData.ERR_CHECKSUM, None, None, None)
+        if(header != 0x55667788 and header != 0x55667789):
+            return (NavData.ERR_BAD_HEADER, None, None, None)
+
+        options = NavDataOptions(view)
+        unpackOption = NavData._OPTION.unpack_from
+        idx = 16
+        while(idx < lastb):
+            opt_id, opt_size = unpackOption(view, idx)
+            if(opt_size < 4):
+                break
+            options._Add(opt_id, idx+4, idx+opt_size)
+            idx = idx + opt_size
+        if(idx!=lastb):
+            return (NavData.ERR_BAD_OPTIONS, droneState, sequenceNumber, options)
+        return (0, droneState, sequenceNumber, options)
+
+    def _Received(self, packet):
+        """Log and account a received packet
+        """
+        self._stats.Packet(_Now(), packet)
+        if(self._recorder != None):
+            self._recorder.RecordNavData(packet)
+
+    def _Error(self, code):
+        """Report and account an error
+        """
+        self._stats.Error(code)
+        self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[code])
 
     def _TNavData(self, *args):
         """Thread to receive the NavData from the drone
         """
-        self._running = True
+        recv = self._socket.recv
         while(self._running):
             try:
-                packet, addr = self._socket.recvfrom(65535)
-                plen = len(packet)
-                if(plen<24):
-                    self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_SMALL_PACKET])
+                packet = recv(NavData.MAX_PACKET)
+                self._Received(packet)
+                err, droneState, sequenceNumber, options = NavData.Decode(packet)
+                if(err):
+                    self._Error(err)
+                    if(err != NavData.ERR_BAD_OPTIONS):
+                        continue
+                if(sequenceNumber<self._sequenceNumber):
+                    self._Error(NavData.ERR_BAD_SEQUENCE)
                     continue
-                header = self._Unpack32(packet[0:4])
-                droneState = self._Unpack32(packet[4:8])
-                sequenceNumber = self._Unpack32(packet[8:12])
-                visionFlag = self._Unpack32(packet[12:16])
-                cksId = self._Unpack16(packet[plen-8:plen-6])
-                size = self._Unpack16(packet[plen-6:plen-4])
-                cksData = self._Unpack16(packet[plen-4:plen])
-
-                if(cksId != 0xFFFF):
-                    self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_BAD_CKS_TAG])
-                elif(cksData != sum(map(ord, packet[:plen-8]))):
-                    self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_CHECKSUM])
-                elif(header != 0x55667788 and header != 0x55667789):
-                    self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_BAD_HEADER])
-                elif(sequenceNumber<self._sequenceNumber):
-                    self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_BAD_SEQUENCE])
-                else:
-                    options = []
-                    idx = 16
-                    lastb = plen - 8
-                    while(idx < lastb):
-                        opt_id = self._Unpack16(packet[idx:idx+2])
-                        opt_size = self._Unpack16(packet[idx+2:idx+4])
-                        opt_data = packet[idx+4:idx+(opt_size-4)]
-                        idx = idx + opt_size
-                        # Needs to parse opt_data. See navdata_demo.h in API
-                        #    navdata_demo_t
-                        #    navdata_cks_t
-                        #    navdata_time_t
-                        #    navdata_raw_measures:t
-                        #    navdata_magneto_t
-                        #    navdata_wind_speed_t
-                        #    navdata_kalman_pressure_t
-                        #    navdata_zimmu_3000_t
-                        #    navdata_phys_measures_t
-                        #    navdata_gyros_offsets_t
-                        #    navdata_euler_angles_t
-                        #    navdata_references_t
-                        #    navdata_trims_t
-                        #    navdata_rc_references_t
-                        #    navdata_pwm_t
-                        #    navdata_altitude_t
-                        #    navdata_vision_raw_t
-                        #    navdata_vision_t
-                        #    navdata_vision_perf_t
-                        #    navdata_trackers_send_t
-                        #    navdata_vision_detect_t
-                        #    navdata_vision_of_t
-                        #    navdata_watchdog_t
-                        #    navdata_adc_data_frame_t
-                        #    navdata_video_stream_t
-                        #    navdata_hdvideo_stream_t
-                        #    navdata_games_t
-                        #    navdata_wifi_t
-                        options.append(opt_data)
-                    if(idx!=lastb):
-                        self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_BAD_OPTIONS])
-                    self._sequenceNumber = sequenceNumber
-                    self._callback(droneState, options)
+                self._sequenceNumber = sequenceNumber
+                self._callback(droneState, options)
             except socket.timeout :
-                self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_SOCKET_TIMEOUT])
+                self._Error(NavData.ERR_SOCKET_TIMEOUT)
+            except Exception as e:
+                self._debug.Print("[TNavData]: %s" % e)
+                self._Error(NavData.ERR_UNEXPECTED_EXCEPTION)
+        self._debug.Print("[TNavData]: Aborting the thread")
+
+    @staticmethod
+    def _Sequence(packet):
+        """Sequence number of a raw packet (-1 if too small)
+        """
+        if(len(packet) < 16):
+            return -1
+        return NavData._HEADER.unpack_from(packet, 0)[2]
+
+    def _TNavDataDrain(self, *args):
+        """Thread to receive the NavData from the drone, draining the socket
+
+        Every pending packet is read in one pass without blocking and only
+        the newest valid one is posted to the callback thread
+        """
+        sock = self._socket
+        while(self._running):
+            try:
+                if(not select.select([sock], [], [], 1.0)[0]):
+                    self._Error(NavData.ERR_SOCKET_TIMEOUT)
+                    continue
+                navdata = self._Drain()
+                if(navdata is not None):
+                    self._Post(navdata[0], navdata[1])
             except Exception as e:
                 self._debug.Print("[TNavData]: %s" % e)
-                self._debug.Print("[TNavData]: Error - %s" % NavData.ERR_MESSAGE[NavData.ERR_UNEXPECTED_EXCEPTION])
+                self._Error(NavData.ERR_UNEXPECTED_EXCEPTION)
         self._debug.Print("[TNavData]: Aborting the thread")
 
+    def _Drain(self):
+        """Read all the pending packets without blocking
+
+        Returns:
+            (droneState, options) of the newest valid packet or None
+        """
+        recv = self._socket.recv
+        packets = []
+        while(True):
+            try:
+                packet = recv(NavData.MAX_PACKET)
+            except socket.error as e:
+                if(e.errno not in WOULDBLOCK):
+                    raise
+                break
+            self._Received(packet)
+            packets.append(packet)
+        packets.sort(key=NavData._Sequence, reverse=True)
+        for idx in range(len(packets)):
+            err, droneState, sequenceNumber, options = NavData.Decode(packets[idx])
+            if(err):
+                self._Error(err)
+                if(err != NavData.ERR_BAD_OPTIONS):
+                    continue
+            if(sequenceNumber<self._sequenceNumber):
+                self._Error(NavData.ERR_BAD_SEQUENCE)
+                continue
+            self._sequenceNumber = sequenceNumber
+            self._skipped = self._skipped + len(packets) - idx - 1
+            return (droneState, options)
+        return None
+
+    def Receive(self):
+        """Read the pending packets and call the callback with the newest
+        valid one (threaded=False only; call it when GetSocket() is
+        readable, the callback runs in the caller's thread)
+
+        Returns:
+            True if the callback was called
+        """
+        try:
+            navdata = self._Drain()
+        except Exception as e:
+            self._debug.Print("[NavData]: %s" % e)
+            self._Error(NavData.ERR_UNEXPECTED_EXCEPTION)
+            return False
+        if(navdata is None):
+            return False
+        self._callback(navdata[0], navdata[1])
+        return True
+
+    def GetSocket(self):
+        """Get the navdata socket (to select on it, threaded=False)
+        """
+        return self._socket
+
+    def _Post(self, droneState, options):
+        """Leave the navdata for the callback thread, replacing any navdata
+        not yet consumed
+        """
+        with self._pendingCond:
+            if(self._pending is not None):
+                self._skipped = self._skipped + 1
+            self._pending = (droneState, options)
+            self._pendingCond.notify()
+
+    def _TCallback(self, *args):
+        """Thread to run the callback with the latest navdata (drain mode)
+        """
+        while(self._running):
+            with self._pendingCond:
+                while(self._pending is None and self._running):
+                    self._pendingCond.wait(1.0)
+                pending = self._pending
+                self._pending = None
+            if(pending is None):
+                continue
+            try:
+                self._callback(pending[0], pending[1])
+            except Exception as e:
+                self._debug.Print("[TNavDataCallback]: %s" % e)
+        self._debug.Print("[TNavDataCallback]: Aborting the thread")
+
+    def GetSkipped(self):
+        """Get the number of valid packets skipped in drain mode because a
+        newer one was available
+        """
+        return self._skipped
+
+    def GetStats(self):
+        """Get the quality statistics of the navdata stream
+
+        Returns:
+            dict, see NavDataStats.GetSnapshot()
+        """
+        return self._stats.GetSnapshot(
+            (NavData.ERR_BAD_CKS_TAG, NavData.ERR_CHECKSUM), NavData.ERR_SOCKET_TIMEOUT)
+
+    def ResetStats(self):
+        """Reset the quality statistics of the navdata stream
+        """
+        self._stats.Reset()
+
     def Stop(self):
         """Stop NavData thread
         """
         self._running = False
-        self._tnavdata.join()
+        with self._pendingCond:
+            self._pendingCond.notify()
+        if(self._tnavdata != None):
+            self._tnavdata.join()
+        if(self._tcallback != None):
+            self._tcallback.join()
+        self._transport.Close()
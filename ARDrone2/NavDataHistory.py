@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import numpy
+
+class NavDataHistory:
+    """Fixed size history of the navdata demo values
+
+    A preallocated numpy structured array used as a ring buffer. Only the
+    navdata thread appends; the queries don't use any lock: they work over
+    views of the requested window and retry if the writer overwrote it
+    while they were reading.
+
+    Usage:
+        history = drone.GetHistory()
+        history.Mean("altitude", 2.0)      # last 2 seconds
+        history.Rate("vbat_flying_percentage")
+        history.Window(5.0)["theta"]
+    """
+    DTYPE = numpy.dtype([
+        ("time", numpy.float64),
+        ("state", numpy.uint32),
+        ("ctrl_state", numpy.uint32),
+        ("vbat_flying_percentage", numpy.float32),
+        ("theta", numpy.float32),
+        ("phi", numpy.float32),
+        ("psi", numpy.float32),
+        ("altitude", numpy.float32),
+        ("vx", numpy.float32),
+        ("vy", numpy.float32),
+        ("vz", numpy.float32),
+    ])
+    _NAN = float("nan")
+
+    def __init__(self, size):
+        """Constructor
+
+        Args:
+            size: number of samples to keep (one slot is reserved for the
+                  writer, so up to size-1 samples are returned)
+        """
+        self._size = max(int(size), 2)
+        self._data = numpy.zeros(self._size, NavDataHistory.DTYPE)
+        self._count = 0
+
+    def Append(self, t, droneState, demo):
+        """Add a sample (called from the navdata thread)
+
+        Args:
+            t: timestamp of the sample
+            droneState: drone state mask
+            demo: NavDataDemo record or None
+        """
+        nan = NavDataHistory._NAN
+        if(demo is None):
+            row = (t, droneState, 0, nan, nan, nan, nan, nan, nan, nan, nan)
+        else:
+            row = (t, droneState, demo.ctrl_state, demo.vbat_flying_percentage,
+                   demo.theta, demo.phi, demo.psi, demo.altitude,
+                   demo.vx, demo.vy, demo.vz)
+        self._data[self._count % self._size] = row
+        # publish the sample only when it is complete
+        self._count = self._count + 1
+
+    def _Parts(self, total, seconds, count):
+        """Views of the selected window, in chronological order
+        """
+        size = self._size
+        n = min(total, size - 1)
+        if(count is not None):
+            n = min(n, count)
+        if(n <= 0):
+            return []
+        end = total % size
+        start = end - n
+        if(start >= 0):
+            parts = [self._data[start:end]]
+        else:
+            parts = [self._data[start+size:], self._data[:end]]
+        if(seconds is not None):
+            cutoff = parts[-1]["time"][-1] - seconds
+            selected = []
+            for part in parts:
+                idx = numpy.searchsorted(part["time"], cutoff, "left")
+                if(idx < len(part)):
+                    selected.append(part[idx:])
+            parts = selected
+        return parts
+
+    def _Query(self, fields, seconds, count, func):
+        """Apply func to the columns of the window, retrying on overwrites
+
+        Only the window columns are copied, and only when the window wraps
+        around the end of the ring
+        """
+        while(True):
+            total = self._count
+            parts = self._Parts(total, seconds, count)
+            n = 0
+            for part in parts:
+                n = n + len(part)
+            if(n == 0):
+                return None
+            columns = []
+            for field in fields:
+                if(len(parts) == 1):
+                    columns.append(parts[0][field])
+                else:
+                    columns.append(numpy.concatenate([part[field] for part in parts]))
+            result = func(*columns)
+            if(self._count - total < self._size - n):
+                return result
+
+    def __len__(self):
+        return min(self._count, self._size - 1)
+
+    def GetCount(self):
+        """Get the number of samples appended since the creation
+        """
+        return self._count
+
+    def Window(self, seconds=None, count=None):
+        """Get a copy of the samples of a window
+
+        Args:
+            seconds: only the samples of the last 'seconds' seconds
+            count: only the last 'count' samples
+
+        Returns:
+            A structured numpy array (DTYPE) with the samples, possibly empty
+        """
+        while(True):
+            total = self._count
+            parts = self._Parts(total, seconds, count)
+            if(len(parts) == 0):
+                return numpy.zeros(0, NavDataHistory.DTYPE)
+            result = numpy.concatenate(parts)
+            if(self._count - total < self._size - len(result)):
+                return result
+
+    def Last(self):
+        """Get the last sample or None
+        """
+        window = self.Window(count=1)
+        if(len(window) == 0):
+            return None
+        return window[0]
+
+    def Mean(self, field, seconds=None, count=None):
+        """Mean of a field over a window (NaN samples are ignored)
+        """
+        return self._Query((field,), seconds, count,
+                           lambda v: float(numpy.nanmean(v)) if numpy.isfinite(v).any() else None)
+
+    def Min(self, field, seconds=None, count=None):
+        """Minimum of a field over a window (NaN samples are ignored)
+        """
+        return self._Query((field,), seconds, count,
+                           lambda v: float(numpy.nanmin(v)) if numpy.isfinite(v).any() else None)
+
+    def Max(self, field, seconds=None, count=None):
+        """Maximum of a field over a window (NaN samples are ignored)
+        """
+        return self._Query((field,), seconds, count,
+                           lambda v: float(numpy.nanmax(v)) if numpy.isfinite(v).any() else None)
+
+    def Rate(self, field, seconds=None, count=None):
+        """Rate of change of a field over a window
+
+        Least squares slope of the field against time, in units per second
+
+        Returns:
+            The slope or None if there are not enough samples
+        """
+        return self._Query(("time", field), seconds, count, NavDataHistory._Slope)
+
+    @staticmethod
+    def _Slope(t, v):
+        """Least squares slope of v(t)
+        """
+        valid = numpy.isfinite(v)
+        if(valid.sum() < 2):
+            return None
+        t = t[valid] - t[valid][0]
+        v = v[valid].astype(numpy.float64)
+        dt = t - t.mean()
+        den = (dt * dt).sum()
+        if(den == 0):
+            return None
+        return float((dt * (v - v.mean())).sum() / den)
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+import struct
+
+class NavDataOptions(object):
+    """Options blocks of a navdata packet
+
+    NavData only records where every block starts and ends; the typed
+    record for a block is built the first time it is requested and its
+    fields are decoded the first time one of them is read.
+
+    Usage:
+        def callback(droneState, options):
+            demo = options.Get(NavDataOptions.DEMO)
+            if(demo != None):
+                print(demo.altitude, demo.vbat_flying_percentage)
+    """
+    # Options tags. See navdata_common.h in API
+    DEMO            = 0
+    TIME            = 1
+    RAW_MEASURES    = 2
+    PHYS_MEASURES   = 3
+    GYROS_OFFSETS   = 4
+    EULER_ANGLES    = 5
+    REFERENCES      = 6
+    TRIMS           = 7
+    RC_REFERENCES   = 8
+    PWM             = 9
+    ALTITUDE        = 10
+    VISION_RAW      = 11
+    VISION_OF       = 12
+    VISION          = 13
+    VISION_PERF     = 14
+    TRACKERS_SEND   = 15
+    VISION_DETECT   = 16
+    WATCHDOG        = 17
+    ADC_DATA_FRAME  = 18
+    VIDEO_STREAM    = 19
+    GAMES           = 20
+    PRESSURE_RAW    = 21
+    MAGNETO         = 22
+    WIND_SPEED      = 23
+    KALMAN_PRESSURE = 24
+    HDVIDEO_STREAM  = 25
+    WIFI            = 26
+    ZIMMU_3000      = 27
+    CKS             = 0xFFFF
+
+    # tag -> record class
+    DECODERS = {}
+
+    __slots__ = ('_view', '_blocks', '_records')
+
+    def __init__(self, view):
+        """Constructor
+
+        Args:
+            view: memoryview of the whole packet
+        """
+        self._view = view
+        self._blocks = {}
+        self._records = {}
+
+    @staticmethod
+    def Register(decoder):
+        """Register the record class used to decode the blocks of decoder.TAG
+
+        Args:
+            decoder: NavDataOption subclass
+        """
+        NavDataOptions.DECODERS[decoder.TAG] = decoder
+        return decoder
+
+    def _Add(self, tag, start, end):
+        """Record the payload bounds of a block (called by NavData.Decode)
+        """
+        self._blocks[tag] = (start, end)
+
+    def Get(self, tag):
+        """Get the typed record of a block
+
+        Args:
+            tag: one of the tags defined in this class
+
+        Returns:
+            A NavDataOption (subclass) or None if the block is not present
+        """
+        record = self._records.get(tag)
+        if(record is None):
+            bounds = self._blocks.get(tag)
+            if(bounds is None):
+                return None
+            decoder = NavDataOptions.DECODERS.get(tag, NavDataOption)
+            record = decoder(self._view[bounds[0]:bounds[1]])
+            self._records[tag] = record
+        return record
+
+    def Raw(self, tag):
+        """Get the payload of a block without decoding it
+
+        Returns:
+            A memoryview of the payload or None if the block is not present
+        """
+        bounds = self._blocks.get(tag)
+        if(bounds is None):
+            return None
+        return self._view[bounds[0]:bounds[1]]
+
+    def Tags(self):
+        """Get the tags of the blocks present in the packet
+        """
+        return list(self._blocks.keys())
+
+    def __contains__(self, tag):
+        return tag in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __iter__(self):
+        for tag in self._blocks:
+            yield self.Get(tag)
+
+
+class NavDataOption(object):
+    """Base class of the typed options blocks
+
+    Every field is a slot that stays unset until one of them is read; then
+    the whole block is unpacked at once with a precompiled struct.
+    Unknown blocks use this class directly and only expose the payload.
+    """
+    __slots__ = ('_data',)
+    TAG = None
+    NAME = "navdata_unknown_t"
+    FIELDS = ()                 # (name, count) tuples
+    _NAMES = frozenset()
+    _STRUCT = None
+
+    def __init__(self, data):
+        """Constructor
+
+        Args:
+            data: memoryview of the block payload (tag and size excluded)
+        """
+        self._data = data
+
+    def __getattr__(self, name):
+        # only reached while the field slots are still unset
+        if(name not in self._NAMES):
+            raise AttributeError(name)
+        self._Decode()
+        return object.__getattribute__(self, name)
+
+    def _Decode(self):
+        """Unpack all the fields of the block
+
+        Throws:
+            struct.error if the payload is shorter than the block
+        """
+        values = self._STRUCT.unpack_from(self._data, 0)
+        idx = 0
+        for name, count in self.FIELDS:
+            if(count == 1):
+                object.__setattr__(self, name, values[idx])
+            else:
+                object.__setattr__(self, name, values[idx:idx+count])
+            idx = idx + count
+
+    def IsComplete(self):
+        """True if the payload holds all the fields (reading the fields of
+        an incomplete block throws struct.error)
+        """
+        return self._STRUCT is None or len(self._data) >= self._STRUCT.size
+
+    def GetData(self):
+        """Get the raw payload of the block
+        """
+        return self._data
+
+    def AsDict(self):
+        """Get all the fields of the block as a dict
+        """
+        return dict((name, getattr(self, name)) for name, count in self.FIELDS)
+
+    def __repr__(self):
+        return "<%s %d bytes>" % (self.NAME, len(self._data))
+
+
+def _Option(tag, name, fields):
+    """Build and register the record class for an options block
+
+    Args:
+        tag: block tag
+        name: C structure name in the API
+        fields: (name, format) tuples; format is a struct code with an
+                optional count ("I", "3f") and counted fields are
+                returned as tuples
+    """
+    layout = []
+    fmt = "<"
+    for fieldName, fieldFmt in fields:
+        count = 1
+        if(len(fieldFmt) > 1):
+            count = int(fieldFmt[:-1])
+        layout.append((fieldName, count))
+        fmt = fmt + fieldFmt
+    names = tuple(fieldName for fieldName, count in layout)
+    decoder = type(str(name), (NavDataOption,), {
+        "__slots__": names,
+        "TAG": tag,
+        "NAME": name,
+        "FIELDS": tuple(layout),
+        "_NAMES": frozenset(names),
+        "_STRUCT": struct.Struct(fmt),
+    })
+    return NavDataOptions.Register(decoder)
+
+
+NavDataDemo = _Option(NavDataOptions.DEMO, "navdata_demo_t", (
+    ("ctrl_state", "I"), ("vbat_flying_percentage", "I"),
+    ("theta", "f"), ("phi", "f"), ("psi", "f"), ("altitude", "i"),
+    ("vx", "f"), ("vy", "f"), ("vz", "f"), ("num_frames", "I"),
+    ("detection_camera_rot", "9f"), ("detection_camera_trans", "3f"),
+    ("detection_tag_index", "I"), ("detection_camera_type", "I"),
+    ("drone_camera_rot", "9f"), ("drone_camera_trans", "3f")))
+
+NavDataTime = _Option(NavDataOptions.TIME, "navdata_time_t", (
+    ("time", "I"),))
+
+NavDataRawMeasures = _Option(NavDataOptions.RAW_MEASURES, "navdata_raw_measures_t", (
+    ("raw_accs", "3H"), ("raw_gyros", "3h"), ("raw_gyros_110", "2h"),
+    ("vbat_raw", "I"), ("us_debut_echo", "H"), ("us_fin_echo", "H"),
+    ("us_association_echo", "H"), ("us_distance_echo", "H"),
+    ("us_courbe_temps", "H"), ("us_courbe_valeur", "H"),
+    ("us_courbe_ref", "H"), ("flag_echo_ini", "H"), ("nb_echo", "H"),
+    ("sum_echo", "I"), ("alt_temp_raw", "i"), ("gradient", "h")))
+
+NavDataPhysMeasures = _Option(NavDataOptions.PHYS_MEASURES, "navdata_phys_measures_t", (
+    ("accs_temp", "f"), ("gyro_temp", "H"), ("phys_accs", "3f"),
+    ("phys_gyros", "3f"), ("alim3V3", "I"), ("vrefEpson", "I"),
+    ("vrefIDG", "I")))
+
+NavDataGyrosOffsets = _Option(NavDataOptions.GYROS_OFFSETS, "navdata_gyros_offsets_t", (
+    ("offset_g", "3f"),))
+
+NavDataEulerAngles = _Option(NavDataOptions.EULER_ANGLES, "navdata_euler_angles_t", (
+    ("theta_a", "f"), ("phi_a", "f")))
+
+NavDataReferences = _Option(NavDataOptions.REFERENCES, "navdata_references_t", (
+    ("ref_theta", "i"), ("ref_phi", "i"), ("ref_theta_I", "i"),
+    ("ref_phi_I", "i"), ("ref_pitch", "i"), ("ref_roll", "i"),
+    ("ref_yaw", "i"), ("ref_psi", "i"), ("vx_ref", "f"), ("vy_ref", "f"),
+    ("theta_mod", "f"), ("phi_mod", "f"), ("k_v_x", "f"), ("k_v_y", "f"),
+    ("k_mode", "I"), ("ui_time", "f"), ("ui_theta", "f"), ("ui_phi", "f"),
+    ("ui_psi", "f"), ("ui_psi_accuracy", "f"), ("ui_seq", "i")))
+
+NavDataTrims = _Option(NavDataOptions.TRIMS, "navdata_trims_t", (
+    ("angular_rates_trim_r", "f"), ("euler_angles_trim_theta", "f"),
+    ("euler_angles_trim_phi", "f")))
+
+NavDataRcReferences = _Option(NavDataOptions.RC_REFERENCES, "navdata_rc_references_t", (
+    ("rc_ref_pitch", "i"), ("rc_ref_roll", "i"), ("rc_ref_yaw", "i"),
+    ("rc_ref_gaz", "i"), ("rc_ref_ag", "i")))
+
+NavDataPwm = _Option(NavDataOptions.PWM, "navdata_pwm_t", (
+    ("motor", "4B"), ("sat_motor", "4B"), ("gaz_feed_forward", "f"),
+    ("gaz_altitude", "f"), ("altitude_integral", "f"), ("vz_ref", "f"),
+    ("u_pitch", "i"), ("u_roll", "i"), ("u_yaw", "i"), ("yaw_u_I", "f"),
+    ("u_pitch_planif", "i"), ("u_roll_planif", "i"), ("u_yaw_planif", "i"),
+    ("u_gaz_planif", "f"), ("current_motor", "4H"), ("altitude_prop", "f"),
+    ("altitude_der", "f")))
+
+NavDataAltitude = _Option(NavDataOptions.ALTITUDE, "navdata_altitude_t", (
+    ("altitude_vision", "i"), ("altitude_vz", "f"), ("altitude_ref", "i"),
+    ("altitude_raw", "i"), ("obs_accZ", "f"), ("obs_alt", "f"),
+    ("obs_x", "3f"), ("obs_state", "I"), ("est_vb", "2f"),
+    ("est_state", "I")))
+
+NavDataVisionRaw = _Option(NavDataOptions.VISION_RAW, "navdata_vision_raw_t", (
+    ("vision_tx_raw", "f"), ("vision_ty_raw", "f"), ("vision_tz_raw", "f")))
+
+NavDataVisionOf = _Option(NavDataOptions.VISION_OF, "navdata_vision_of_t", (
+    ("of_dx", "5f"), ("of_dy", "5f")))
+
+NavDataVision = _Option(NavDataOptions.VISION, "navdata_vision_t", (
+    ("vision_state", "I"), ("vision_misc", "i"), ("vision_phi_trim", "f"),
+    ("vision_phi_ref_prop", "f"), ("vision_theta_trim", "f"),
+    ("vision_theta_ref_prop", "f"), ("new_raw_picture", "i"),
+    ("theta_capture", "f"), ("phi_capture", "f"), ("psi_capture", "f"),
+    ("altitude_capture", "i"), ("time_capture", "I"), ("body_v", "3f"),
+    ("delta_phi", "f"), ("delta_theta", "f"), ("delta_psi", "f"),
+    ("gold_defined", "I"), ("gold_reset", "I"), ("gold_x", "f"),
+    ("gold_y", "f")))
+
+NavDataVisionPerf = _Option(NavDataOptions.VISION_PERF, "navdata_vision_perf_t", (
+    ("time_szo", "f"), ("time_corners", "f"), ("time_compute", "f"),
+    ("time_tracking", "f"), ("time_trans", "f"), ("time_update", "f"),
+    ("time_custom", "20f")))
+
+NavDataTrackersSend = _Option(NavDataOptions.TRACKERS_SEND, "navdata_trackers_send_t", (
+    ("locked", "30i"), ("point", "60i")))
+
+NavDataVisionDetect = _Option(NavDataOptions.VISION_DETECT, "navdata_vision_detect_t", (
+    ("nb_detected", "I"), ("type", "4I"), ("xc", "4I"), ("yc", "4I"),
+    ("width", "4I"), ("height", "4I"), ("dist", "4I"),
+    ("orientation_angle", "4f"), ("rotation", "36f"),
+    ("translation", "12f"), ("camera_source", "4I")))
+
+NavDataWatchdog = _Option(NavDataOptions.WATCHDOG, "navdata_watchdog_t", (
+    ("watchdog", "i"),))
+
+NavDataAdcDataFrame = _Option(NavDataOptions.ADC_DATA_FRAME, "navdata_adc_data_frame_t", (
+    ("version", "I"), ("data_frame", "32B")))
+
+NavDataVideoStream = _Option(NavDataOptions.VIDEO_STREAM, "navdata_video_stream_t", (
+    ("quant", "B"), ("frame_size", "I"), ("frame_number", "I"),
+    ("atcmd_ref_seq", "I"), ("atcmd_mean_ref_gap", "I"),
+    ("atcmd_var_ref_gap", "f"), ("atcmd_ref_quality", "I"),
+    ("out_bitrate", "I"), ("desired_bitrate", "I"), ("data", "5i"),
+    ("tcp_queue_level", "I"), ("fifo_queue_level", "I")))
+
+NavDataGames = _Option(NavDataOptions.GAMES, "navdata_games_t", (
+    ("double_tap_counter", "I"), ("finish_line_counter", "I")))
+
+NavDataPressureRaw = _Option(NavDataOptions.PRESSURE_RAW, "navdata_pressure_raw_t", (
+    ("up", "i"), ("ut", "h"), ("temperature_meas", "i"),
+    ("pression_meas", "i")))
+
+NavDataMagneto = _Option(NavDataOptions.MAGNETO, "navdata_magneto_t", (
+    ("mx", "h"), ("my", "h"), ("mz", "h"), ("magneto_raw", "3f"),
+    ("magneto_rectified", "3f"), ("magneto_offset", "3f"),
+    ("heading_unwrapped", "f"), ("heading_gyro_unwrapped", "f"),
+    ("heading_fusion_unwrapped", "f"), ("magneto_calibration_ok", "B"),
+    ("magneto_state", "I"), ("magneto_radius", "f"), ("error_mean", "f"),
+    ("error_var", "f")))
+
+NavDataWindSpeed = _Option(NavDataOptions.WIND_SPEED, "navdata_wind_speed_t", (
+    ("wind_speed", "f"), ("wind_angle", "f"),
+    ("wind_compensation_theta", "f"), ("wind_compensation_phi", "f"),
+    ("state", "6f"), ("magneto_debug", "3f")))
+
+NavDataKalmanPressure = _Option(NavDataOptions.KALMAN_PRESSURE, "navdata_kalman_pressure_t", (
+    ("offset_pressure", "f"), ("est_z", "f"), ("est_zdot", "f"),
+    ("est_bias_PWM", "f"), ("est_biais_pression", "f"), ("offset_US", "f"),
+    ("prediction_US", "f"), ("cov_alt", "f"), ("cov_PWM", "f"),
+    ("cov_vitesse", "f"), ("bool_effet_sol", "i"), ("somme_inno", "f"),
+    ("flag_rejet_US", "i"), ("u_multisinus", "f"), ("gaz_altitude", "f"),
+    ("flag_multisinus", "i"), ("flag_multisinus_debut", "i")))
+
+NavDataHdVideoStream = _Option(NavDataOptions.HDVIDEO_STREAM, "navdata_hdvideo_stream_t", (
+    ("hdvideo_state", "I"), ("storage_fifo_nb_packets", "I"),
+    ("storage_fifo_size", "I"), ("usbkey_size", "I"),
+    ("usbkey_freespace", "I"), ("frame_number", "I"),
+    ("usbkey_remaining_time", "I")))
+
+NavDataWifi = _Option(NavDataOptions.WIFI, "navdata_wifi_t", (
+    ("link_quality", "I"),))
+
+NavDataZimmu3000 = _Option(NavDataOptions.ZIMMU_3000, "navdata_zimmu_3000_t", (
+    ("vzimmuLSB", "i"), ("vzfind", "f")))
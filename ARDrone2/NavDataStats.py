@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import struct
+import time
+
+from Histogram import Histogram
+
+# monotonic clock when available (the clock of the arrival times)
+_Now = getattr(time, "monotonic", time.time)
+
+class NavDataStats:
+    """Quality statistics of the navdata stream
+
+    Updated from the navdata thread only; the counters are plain integers
+    so reading them from other threads needs no lock.
+
+    Usage:
+        stats = drone.GetNavDataStats()
+        print(stats["lost"], stats["bytes_per_second"], stats["histogram"])
+    """
+    # upper bounds (ms) of the inter-arrival histogram buckets, plus overflow
+    HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    RATE_WINDOW = 1.0       # seconds of the bytes_per_second window
+    REORDER_WINDOW = 256    # lost sequence numbers a late packet can recover
+
+    _RATE_BINS = 10
+
+    _HEADER = struct.Struct("<III")     # header, drone state, sequence
+
+    def __init__(self):
+        """Constructor
+        """
+        self._histogram = Histogram(NavDataStats.HISTOGRAM_MS)
+        self.Reset()
+
+    def Reset(self):
+        """Reset all the counters
+        """
+        self._received = 0
+        self._bytes = 0
+        self._errors = {}
+        self._gaps = 0
+        self._lost = 0
+        self._reorders = 0
+        self._lastSequence = None
+        self._lastArrival = None
+        self._histogram.Reset()
+        self._missing = set()
+        self._firstArrival = None
+        self._rateBin = [None] * NavDataStats._RATE_BINS
+        self._rateBytes = [0] * NavDataStats._RATE_BINS
+
+    def Packet(self, t, packet):
+        """Account a received packet
+
+        The sequence number is only tracked for packets with a valid header
+
+        Args:
+            t: arrival time
+            packet: the raw packet
+        """
+        size = len(packet)
+        self._received = self._received + 1
+        self._bytes = self._bytes + size
+
+        if(self._lastArrival is not None):
+            self._histogram.Add(t - self._lastArrival)
+        self._lastArrival = t
+
+        # bytes per time bin; the rate is computed when it is read
+        if(self._firstArrival is None):
+            self._firstArrival = t
+        rateBin = int(t * NavDataStats._RATE_BINS / NavDataStats.RATE_WINDOW)
+        slot = rateBin % NavDataStats._RATE_BINS
+        if(self._rateBin[slot] != rateBin):
+            self._rateBin[slot] = rateBin
+            self._rateBytes[slot] = 0
+        self._rateBytes[slot] = self._rateBytes[slot] + size
+
+        if(size < 12):
+            return
+        header, droneState, sequence = NavDataStats._HEADER.unpack_from(packet, 0)
+        if(header != 0x55667788 and header != 0x55667789):
+            return
+        last = self._lastSequence
+        if(last is not None):
+            if(sequence < last):
+                self._reorders = self._reorders + 1
+                if(sequence in self._missing):
+                    # it was counted as lost when its gap was seen
+                    self._missing.discard(sequence)
+                    self._lost = self._lost - 1
+                return
+            if(sequence > last + 1):
+                self._gaps = self._gaps + 1
+                self._lost = self._lost + (sequence - last - 1)
+                oldest = sequence - NavDataStats.REORDER_WINDOW
+                self._missing = set(seq for seq in self._missing if seq >= oldest)
+                self._missing.update(range(max(last + 1, oldest), sequence))
+        self._lastSequence = sequence
+
+    def Error(self, code):
+        """Account an error
+
+        Args:
+            code: one of the NavData.ERR_* codes
+        """
+        self._errors[code] = self._errors.get(code, 0) + 1
+
+    def GetErrors(self, code):
+        """Get the number of errors of a given NavData.ERR_* code
+        """
+        return self._errors.get(code, 0)
+
+    def _BytesPerSecond(self, now):
+        """Bytes per second received during the last RATE_WINDOW seconds
+        (0 when the stream stopped)
+        """
+        if(self._firstArrival is None):
+            return 0.0
+        bins = NavDataStats._RATE_BINS
+        current = int(now * bins / NavDataStats.RATE_WINDOW)
+        total = 0
+        for rateBin, size in zip(list(self._rateBin), list(self._rateBytes)):
+            if(rateBin is not None and current - bins < rateBin <= current):
+                total = total + size
+        span = min(NavDataStats.RATE_WINDOW, now - self._firstArrival)
+        if(span <= 0):
+            return 0.0
+        return total / span
+
+    def GetSnapshot(self, checksumCodes=(), timeoutCode=None, now=None):
+        """Get a copy of the statistics
+
+        Args:
+            checksumCodes: error codes counted as checksum failures
+            timeoutCode: error code counted as timeout
+            now: current time in the clock of the arrival times, None for
+                 the monotonic clock
+
+        Returns:
+            dict with received, bytes, bytes_per_second (over the last
+            RATE_WINDOW seconds), checksum_errors, timeouts, gaps, lost (not
+            counting the late packets that arrived), reorders, errors
+            (code -> count) and histogram (list of (upper bound ms or None,
+            count))
+        """
+        if(now is None):
+            now = _Now()
+        return {
+            "received": self._received,
+            "bytes": self._bytes,
+            "bytes_per_second": self._BytesPerSecond(now),
+            "checksum_errors": sum(self._errors.get(code, 0) for code in checksumCodes),
+            "timeouts": self._errors.get(timeoutCode, 0),
+            "gaps": self._gaps,
+            "lost": self._lost,
+            "reorders": self._reorders,
+            "errors": dict(self._errors),
+            "histogram": self._histogram.Get(),
+        }
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import select
+import socket
+import struct
+import time
+
+# monotonic clock when available
+_Now = getattr(time, "monotonic", time.time)
+
+class PaVEHeader:
+    """Header of a PaVE (Parrot Video Encapsulation) frame
+    """
+    __slots__ = ("version", "codec", "header_size", "payload_size",
+                 "encoded_width", "encoded_height", "width", "height",
+                 "frame_number", "timestamp", "frame_type", "stream_position",
+                 "started", "received")
+
+    def IsKeyFrame(self):
+        """True for the IDR and I frames
+        """
+        return self.frame_type == PaVE.FRAME_TYPE_IDR or self.frame_type == PaVE.FRAME_TYPE_I
+
+
+class PaVE:
+    """Demultiplexer of the PaVE stream sent by the drone on port 5555
+
+    Every H.264 frame is preceded by a 64 bytes header with its number,
+    timestamp, type and dimensions. The header is read into a reusable
+    buffer and decoded with a precompiled struct; the payload is read
+    into another reusable buffer and handed out as a memoryview, valid
+    until the next Read().
+
+    Usage:
+        pave = PaVE(sock)
+        for header, payload in pave.Frames():
+            image = decoder.Decode(header, payload)
+    """
+    SIGNATURE = b"PaVE"
+
+    FRAME_TYPE_IDR = 1
+    FRAME_TYPE_I = 2
+    FRAME_TYPE_P = 3
+
+    # signature, version, codec, header size, payload size, encoded
+    # width/height, display width/height, frame number, timestamp (ms),
+    # total chunks, chunk index, frame type, control, stream byte position
+    # (low/high), stream id, total slices, slice index, header1 size,
+    # header2 size, reserved, advertised size, reserved
+    HEADER = struct.Struct("<4sBBHIHHHHIIBBBBIIHBBBB2sI12s")
+
+    PAYLOAD_SIZE = 65536    # initial payload buffer, grows with the frames
+
+    def __init__(self, sock, dropStale=False):
+        """Constructor
+
+        Args:
+            sock: connected TCP socket to the video port
+            dropStale: If true, when there is already more data waiting
+                       the P frames are dropped until the next key frame
+                       (the decoder is behind the stream)
+        """
+        self._socket = sock
+        self._dropStale = dropStale
+        self._header = bytearray(PaVE.HEADER.size)
+        self._headerView = memoryview(self._header)
+        self._payload = bytearray(PaVE.PAYLOAD_SIZE)
+        self._payloadView = memoryview(self._payload)
+        self._skipping = False
+        self._frames = 0
+        self._dropped = 0
+        self._resyncs = 0
+
+    def _ReadInto(self, view):
+        """Fill a view from the socket
+
+        Throws:
+            socket.error if the connection is closed
+        """
+        recv = self._socket.recv_into
+        got = 0
+        size = len(view)
+        while(got < size):
+            n = recv(view[got:])
+            if(not n):
+                raise socket.error("Video connection closed")
+            got = got + n
+
+    def _Sync(self):
+        """Read bytes until the header starts with the signature
+        """
+        view = self._headerView
+        sig = PaVE.SIGNATURE
+        while(True):
+            if(self._header.startswith(sig)):
+                return
+            self._resyncs = self._resyncs + 1
+            # keep the bytes after the first possible start of the signature
+            idx = self._header.find(sig[:1], 1)
+            if(idx < 0):
+                self._ReadInto(view)
+                continue
+            keep = len(self._header) - idx
+            self._header[:keep] = self._header[idx:]
+            self._ReadInto(view[keep:])
+
+    def _Pending(self):
+        """True if there is more data waiting in the socket
+        """
+        return len(select.select([self._socket], [], [], 0)[0]) > 0
+
+    def Read(self):
+        """Read the next frame
+
+        Returns:
+            (header, payload): PaVEHeader and a memoryview of the H.264
+            data, valid until the next call
+
+        Throws:
+            socket.error if the connection is closed
+        """
+        while(True):
+            self._ReadInto(self._headerView)
+            self._Sync()
+            started = _Now()
+            (sig, version, codec, headerSize, payloadSize, encodedWidth, encodedHeight,
+             width, height, frameNumber, timestamp, totalChunks, chunkIndex, frameType,
+             control, positionLow, positionHigh, streamId, totalSlices, sliceIndex,
+             header1Size, header2Size, reserved2, advertisedSize,
+             reserved3) = PaVE.HEADER.unpack_from(self._header, 0)
+            if(headerSize > PaVE.HEADER.size):
+                self._Skip(headerSize - PaVE.HEADER.size)
+            if(payloadSize > len(self._payload)):
+                self._payload = bytearray(payloadSize)
+                self._payloadView = memoryview(self._payload)
+            payload = self._payloadView[:payloadSize]
+            self._ReadInto(payload)
+            self._frames = self._frames + 1
+
+            keyFrame = frameType == PaVE.FRAME_TYPE_IDR or frameType == PaVE.FRAME_TYPE_I
+            if(keyFrame):
+                self._skipping = False
+            elif(self._dropStale and (self._skipping or self._Pending())):
+                # a P frame can't be decoded without the previous ones
+                self._skipping = True
+                self._dropped = self._dropped + 1
+                continue
+
+            header = PaVEHeader()
+            header.version = version
+            header.codec = codec
+            header.header_size = headerSize
+            header.payload_size = payloadSize
+            header.encoded_width = encodedWidth
+            header.encoded_height = encodedHeight
+            header.width = width
+            header.height = height
+            header.frame_number = frameNumber
+            header.timestamp = timestamp
+            header.frame_type = frameType
+            header.stream_position = positionLow | (positionHigh << 32)
+            header.started = started
+            header.received = _Now()
+            return (header, payload)
+
+    def _Skip(self, size):
+        """Discard bytes of the stream (header extensions)
+        """
+        while(size > 0):
+            n = min(size, len(self._payload))
+            self._ReadInto(self._payloadView[:n])
+            size = size - n
+
+    def Frames(self):
+        """Generator of (header, payload) until the connection is closed
+        """
+        while(True):
+            try:
+                frame = self.Read()
+            except socket.error:
+                return
+            yield frame
+
+    def GetStats(self):
+        """Get the demultiplexer counters
+
+        Returns:
+            (frames, dropped, resyncs): frames read, stale P frames
+            dropped and times the stream was out of sync (no signature
+            where a header was expected)
+        """
+        return (self._frames, self._dropped, self._resyncs)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import errno
+import socket
+
+# errno of a non blocking socket operation that would block
+WOULDBLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK))
+
+class UDPTransport:
+    """Connected UDP socket to one port of the drone
+
+    The address is resolved only once and the socket is connect()ed, so
+    every send is a plain send() without address handling. Incoming
+    datagrams are only accepted from that same endpoint.
+
+    In non blocking mode a send that would block is dropped and counted
+    instead of stalling the caller.
+
+    Usage:
+        transport = UDPTransport("192.168.1.1", 5556)
+        transport.Send(b"AT*COMWDG=1\\r")
+        ...
+        transport.Close()
+    """
+
+    def __init__(self, address, port, localPort=None, blocking=True, timeout=1.0):
+        """Constructor
+
+        Args:
+            address: Drone's address/hostname
+            port: drone's port
+            localPort: local port to bind or None for any
+            blocking: If false, sends never block (see Send)
+            timeout: seconds for the blocking operations
+
+        Throws:
+            Any exception throws by the resolution or the socket
+        """
+        self._endpoint = (UDPTransport.Resolve(address), port)
+        self._blocking = blocking
+        self._sent = 0
+        self._wouldBlock = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if(localPort is not None):
+                self._socket.bind(('', localPort))
+            if(blocking):
+                self._socket.settimeout(timeout)
+            else:
+                self._socket.settimeout(0.0)
+            self._socket.connect(self._endpoint)
+        except Exception:
+            self._socket.close()
+            raise
+
+    @staticmethod
+    def Resolve(address):
+        """Resolve a hostname to its IPv4 address (unchanged if already one)
+        """
+        return socket.gethostbyname(address)
+
+    def Send(self, data):
+        """Send a datagram
+
+        Args:
+            data: bytes-like object (bytes, bytearray, memoryview)
+
+        Returns:
+            False if the socket is non blocking and the datagram was dropped
+            because the send would block
+
+        Throws:
+            Any other exception throws by socket.send()
+        """
+        try:
+            self._socket.send(data)
+        except socket.error as e:
+            if(self._blocking or e.errno not in WOULDBLOCK):
+                raise
+            self._wouldBlock = self._wouldBlock + 1
+            return False
+        self._sent = self._sent + 1
+        return True
+
+    def GetSocket(self):
+        """Get the underlying socket (to receive or select on it)
+        """
+        return self._socket
+
+    def GetEndpoint(self):
+        """Get the resolved (address, port) of the drone
+        """
+        return self._endpoint
+
+    def GetStats(self):
+        """Get the number of datagrams sent and dropped
+
+        Returns:
+            (sent, wouldBlock)
+        """
+        return (self._sent, self._wouldBlock)
+
+    def Close(self):
+        """Close the socket
+        """
+        self._socket.close()
@@ -1,13 +1,41 @@
 # -*- coding: utf-8 -*-
+import socket
 import threading
 import time
-import cv2
-import numpy
+
+from FrameSlot import FrameSlot
+from PaVE import PaVE
+from VideoFrame import VideoFrame
+from VideoLatency import VideoLatency
+from VideoSink import DisplaySink
+from VideoTransform import VideoTransform
+
+# reloj monotónico si está disponible
+_Now = getattr(time, "monotonic", time.time)
+
+# OpenCV se importa sólo al crear el primer objeto Video
+cv2 = None
+
+def _ImportCV2():
+    """Importa OpenCV la primera vez que se necesita
+    """
+    global cv2
+    if(cv2 is None):
+        import cv2
 
 class Video:
     """Clase para recibir video desde la puerta 5555
 
-    Utiliza la librería OpenCV (cv2)
+    Utiliza la librería OpenCV (cv2). Con un decoder (ver VideoDecoder) el
+    stream PaVE se lee directamente desde el socket en vez de usar
+    cv2.VideoCapture, lo que da acceso a los headers de cada frame
+
+    Un hilo lee y decodifica los frames y los deja en un FrameSlot; otro
+    hilo toma siempre el último (los que no alcanza a procesar se cuentan
+    como saltados), invoca el callback y entrega la imagen a los sinks
+    (ver VideoSink): ventana, archivo, memoria compartida o ninguno para
+    trabajar sin interfaz gráfica. Con GetFrame() se puede tomar el último
+    frame (VideoFrame, con su hora de captura) desde cualquier otro hilo
 
     Uso:
         def callback(frame):
@@ -15,26 +43,46 @@ class Video:
 
         debug = Debug()
         video = Video("192.168.1.1", callback, debug)
+        # sin ventana, grabando a un archivo
+        video = Video("192.168.1.1", callback, debug, sinks=[FileSink("vuelo.avi")])
         ...
         video.Stop()
     """
     VIDEO_PORT = 5555
 
+    # cv2.VideoCapture no bloquea si falla la lectura (stream terminado)
+    READ_RETRY = 0.01       # segundos de espera tras una lectura fallida
+    MAX_READ_FAILURES = 300 # lecturas fallidas seguidas antes de detenerse
+
     # tipos de errores
     ERR_UNEXPECTED_EXCEPTION = 1
 
     ERR_MESSAGE = [0]*2
     ERR_MESSAGE[ERR_UNEXPECTED_EXCEPTION] = "Excepción no esperada"
 
-    def __init__(self, address, callback, debug):
+    def __init__(self, address, callback, debug, decoder=None, dropStale=False, sinks=None,
+                 transform=None):
         """Constructor
 
         Args:
             address: dirección/hostname del drone
-            callback: método a invocar cuando se recibe un frame
+            callback: método a invocar cuando se recibe un frame, o None
                       def callback(frame)
-                        ....
+                        .... frame es una vista de un buffer que se
+                        reutiliza (ver VideoTransform); retorna la imagen
+                        para los sinks
             debug: objeto de debug
+            decoder: objeto con el método Decode(header, payload) para
+                     decodificar los frames PaVE, o None para usar
+                     cv2.VideoCapture
+            dropStale: con decoder, descarta los frames P atrasados hasta
+                     el siguiente frame clave (ver PaVE)
+            sinks: lista de VideoSink que reciben cada imagen procesada.
+                     None muestra el video en una ventana con los FPS
+                     (DisplaySink); [] no muestra nada
+            transform: VideoTransform aplicado antes del callback (flip,
+                     región de interés, escala, gris). None invierte la
+                     imagen horizontalmente
 
         Throws:
             Exception si no puede leer el primer frame
@@ -42,59 +90,215 @@ class Video:
         self._address = address
         self._callback = callback
         self._debug = debug
+        self._decoder = decoder
+        self._cap = None
+        self._socket = None
+        self._pave = None
+        self._header = None
+        self._slot = FrameSlot()
+        self._number = 0
+        self._shown = 0
+        self._skipped = 0
+        self._fps = 0.0
+        self._latency = VideoLatency()
+        self._sinks = sinks
+        self._transform = transform
         try:
-            self._tps = cv2.getTickFrequency()
-            self._cap = cv2.VideoCapture("tcp://%s:%d" % (address, Video.VIDEO_PORT))
-            #self._cap.set(cv2.cv.CV_CAP_PROP_FRAME_HEIGHT, 720)
-            #self._cap.set(cv2.cv.CV_CAP_PROP_FRAME_WIDTH, 480)
-            ret, img = self._cap.read()
-            if(not ret):
-                msg = "No se puede leer el video desde el drone"
-                self._debug.Print("[Video]: %s" % msg)
-                raise Exception(msg)
-            self._winName = "ARDrone2 Video"
-            cv2.namedWindow(self._winName, cv2.CV_WINDOW_AUTOSIZE)
+            _ImportCV2()
+            if(self._transform == None):
+                self._transform = VideoTransform()
+            if(self._sinks == None):
+                self._sinks = [DisplaySink()]
+            if(decoder != None):
+                self._socket = socket.create_connection((address, Video.VIDEO_PORT), 5.0)
+                self._socket.settimeout(None)
+                self._pave = PaVE(self._socket, dropStale)
+            else:
+                self._cap = cv2.VideoCapture("tcp://%s:%d" % (address, Video.VIDEO_PORT))
+                #self._cap.set(cv2.cv.CV_CAP_PROP_FRAME_HEIGHT, 720)
+                #self._cap.set(cv2.cv.CV_CAP_PROP_FRAME_WIDTH, 480)
+                ret, img = self._cap.read()
+                if(not ret):
+                    msg = "No se puede leer el video desde el drone"
+                    self._debug.Print("[Video]: %s" % msg)
+                    raise Exception(msg)
         except NameError as e:
             # no se requiere código de limpieza
             self._debug.Print("[Video]: %s" % e)
             raise
         except Exception as e:
-            self._cap.release()
-            cv2.destroyAllWindows()
+            if(self._socket != None):
+                self._socket.close()
+            if(self._cap != None):
+                self._cap.release()
             self._debug.Print("[Video]: %s" % e)
             raise
-        self._running = False
+        self._tdecode = threading.Thread(target=self._TDecode, args=(), name="TVideoDecode")
         self._tvideo = threading.Thread(target=self._TVideo, args=(), name="TVideo")
+        self._running = True
+        self._tdecode.start()
         self._tvideo.start()
-        while(not self._running):
-            time.sleep(0.01)
+
+    def _TDecode(self, *args):
+        """Hilo para leer y decodificar el video del drone
+        """
+        failures = 0
+        while(self._running):
+            try:
+                frame = self._Read()
+                if(frame != None):
+                    failures = 0
+                    self._slot.Put(frame)
+                elif(self._cap != None):
+                    failures = failures + 1
+                    if(failures >= Video.MAX_READ_FAILURES):
+                        self._debug.Print("[TVideoDecode]: No se puede leer el video desde el drone")
+                        break
+                    time.sleep(Video.READ_RETRY)
+            except socket.error as e:
+                # el drone cerró la conexión o Stop()
+                if(self._running):
+                    self._debug.Print("[TVideoDecode]: %s" % e)
+                break
+            except Exception as e:
+                self._debug.Print("[TVideoDecode]: %s" % e)
+                self._debug.Print("[TVideoDecode]: Error - %s" % Video.ERR_MESSAGE[Video.ERR_UNEXPECTED_EXCEPTION])
+        # sin productor los consumidores no deben esperar
+        self._slot.Close()
+        self._debug.Print("[TVideoDecode]: Aborting the thread")
 
     def _TVideo(self, *args):
         """Hilo para procesar el video del drone
         """
-        self._running = True
-        t1=cv2.getTickCount()
+        t1 = _Now()
+        last = 0
         while(self._running):
             try:
-                ret, img = self._cap.read()
-                if(ret):
-                    frame = cv2.flip(img,1)
+                videoFrame = self._slot.Get(last, 1.0)
+                if(videoFrame == None):
+                    if(self._slot.IsClosed()):
+                        break
+                    continue
+                # los frames que no alcanzó a procesar
+                self._skipped = self._skipped + videoFrame.number - last - 1
+                self._shown = self._shown + 1
+                last = videoFrame.number
+                started = _Now()
+                frame = self._transform.Apply(videoFrame.image)
+                if(self._callback != None):
                     frame = self._callback(frame)
-                    imgH, imgW, depth = img.shape
-                    t2=cv2.getTickCount()
-                    cv2.putText(frame, "%04.2f FPS" % (1/((t2-t1)/self._tps)), (10, imgH-10), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255))
-                    cv2.imshow(self._winName, frame)
-                    cv2.waitKey(1)
-                    t1=t2
+                t2 = _Now()
+                if(t2 > t1):
+                    self._fps = 1/(t2-t1)
+                videoFrame.fps = self._fps
+                t1 = t2
+                for sink in self._sinks:
+                    sink.Write(videoFrame, frame)
+                self._latency.Frame(videoFrame, started, t2, _Now())
             except Exception as e:
                 self._debug.Print("[TVideo]: %s" % e)
                 self._debug.Print("[TVideo]: Error - %s" % Video.ERR_MESSAGE[Video.ERR_UNEXPECTED_EXCEPTION])
+        # los sinks se cierran en el mismo hilo que los usa (ventanas)
+        for sink in self._sinks:
+            try:
+                sink.Close()
+            except Exception as e:
+                self._debug.Print("[TVideo]: %s" % e)
         self._debug.Print("[TVideo]: Aborting the thread")
 
+    def _Read(self):
+        """Lee y decodifica el siguiente frame
+
+        Retorna:
+            VideoFrame o None si no hay imagen (frame no decodificable)
+        """
+        if(self._pave == None):
+            if(not self._cap.grab()):
+                return None
+            captured = _Now()
+            ret, img = self._cap.retrieve()
+            if(not ret):
+                return None
+            header = None
+        else:
+            header, payload = self._pave.Read()
+            captured = header.received
+            img = self._decoder.Decode(header, payload)
+            if(img is None):
+                return None
+            self._header = header
+        self._number = self._number + 1
+        return VideoFrame(img, self._number, captured, _Now(), header)
+
+    def GetFrame(self, after=0, timeout=1.0):
+        """Retorna el último frame decodificado
+
+        Args:
+            after: número del último frame que se obtuvo; espera uno más
+                   nuevo
+            timeout: segundos máximos de espera, None para esperar siempre
+
+        Retorna:
+            VideoFrame (la imagen sin invertir) o None si no llega un frame
+            nuevo en timeout segundos
+        """
+        return self._slot.Get(after, timeout)
+
+    def GetFrameStats(self):
+        """Retorna las estadísticas de los frames
+
+        Retorna:
+            dict con decoded (frames decodificados), processed (frames
+            entregados al callback), skipped (frames que el callback no
+            alcanzó a recibir) y unread (frames que ningún consumidor tomó
+            del FrameSlot)
+        """
+        decoded, unread = self._slot.GetStats()
+        return {
+            "decoded": decoded,
+            "processed": self._shown,
+            "skipped": self._skipped,
+            "unread": unread,
+        }
+
+    def GetLastHeader(self):
+        """Retorna el PaVEHeader del último frame decodificado (None sin decoder)
+        """
+        return self._header
+
+    def GetFPS(self):
+        """Retorna los frames por segundo procesados por el hilo TVideo
+        """
+        return self._fps
+
+    def GetLatency(self):
+        """Retorna la latencia de cada etapa del video: recepción,
+        decodificación, espera, callback y sinks (ver VideoLatency)
+        """
+        return self._latency.GetSnapshot()
+
+    def GetPaVEStats(self):
+        """Retorna (frames, dropped, resyncs) del demultiplexor PaVE (ver
+        PaVE.GetStats) o None sin decoder
+        """
+        if(self._pave == None):
+            return None
+        return self._pave.GetStats()
+
     def Stop(self):
         """Detiene el hilo del video
         """
         self._running = False
+        if(self._socket != None):
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except Exception as e:
+                # no se requiere código de limpieza
+                self._debug.Print("[Video]: %s" % e)
+        self._slot.Close()
+        self._tdecode.join()
         self._tvideo.join()
-        self._cap.release()
-        cv2.destroyAllWindows()
+        if(self._socket != None):
+            self._socket.close()
+        if(self._cap != None):
+            self._cap.release()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+try:
+    import av
+except ImportError:
+    av = None
+
+class VideoDecoder:
+    """H.264 decoder of the PaVE frames using PyAV (libav/ffmpeg)
+
+    Video accepts any object with the same Decode() method, so other
+    decoders (hardware, GStreamer, ...) can be plugged in.
+
+    Usage:
+        drone = ARDrone2("192.168.1.1", debug, videoCallback=callback,
+                         videoDecoder=VideoDecoder())
+    """
+
+    def __init__(self, pixelFormat="bgr24"):
+        """Constructor
+
+        Args:
+            pixelFormat: format of the decoded images (bgr24 is what OpenCV
+                         uses)
+
+        Throws:
+            Exception if PyAV is not installed
+        """
+        if(av is None):
+            raise Exception("PyAV (av) is required to decode the PaVE video")
+        self._codec = av.CodecContext.create("h264", "r")
+        self._pixelFormat = pixelFormat
+
+    def Decode(self, header, payload):
+        """Decode one frame
+
+        Args:
+            header: PaVEHeader of the frame
+            payload: H.264 data of the frame (bytes-like)
+
+        Returns:
+            The image as a numpy array (height, width, 3) or None if the
+            decoder has no image yet (or the data can't be decoded)
+        """
+        image = None
+        try:
+            for frame in self._codec.decode(av.Packet(payload)):
+                image = frame.to_ndarray(format=self._pixelFormat)
+        except Exception:
+            # missing references (e.g. after the stale frames dropped)
+            return None
+        return image
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+class VideoFrame:
+    """A decoded video frame and its metadata
+
+    Attributes:
+        image: the image (numpy array, BGR)
+        number: sequential number given by Video (1, 2, ...)
+        captured: time (monotonic) when the frame data was received
+        decoded: time (monotonic) when the frame was decoded
+        header: PaVEHeader of the frame or None (cv2.VideoCapture)
+        fps: frames per second processed by Video when the frame was
+             processed (0.0 before)
+    """
+    __slots__ = ("image", "number", "captured", "decoded", "header", "fps")
+
+    def __init__(self, image, number, captured, decoded, header=None):
+        self.image = image
+        self.number = number
+        self.captured = captured
+        self.decoded = decoded
+        self.header = header
+        self.fps = 0.0
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+
+from Histogram import Histogram
+
+class VideoLatency:
+    """Latency of every stage of the video pipeline
+
+    Video records the times of every processed frame; the last WINDOW
+    durations of every stage are kept, so the percentiles and the
+    histogram follow the recent behavior (e.g. after changing a filter).
+
+    Stages (seconds):
+        receive: reading the PaVE payload of the frame (decoder only)
+        decode: from the frame received to decoded
+        queue: from decoded to the callback (waiting in the FrameSlot)
+        callback: running the callback (including the VideoTransform)
+        sink: running the sinks
+        total: from the frame received to the last sink
+
+    Usage:
+        latency = drone.GetVideoLatency()
+        print(latency["callback"]["p95"], latency["total"]["p99"])
+    """
+    STAGES = ("receive", "decode", "queue", "callback", "sink", "total")
+
+    WINDOW = 300    # durations kept per stage (10 seconds at 30 fps)
+
+    # upper bounds (ms) of the histogram buckets, plus overflow
+    HISTOGRAM_MS = (1, 2, 5, 10, 20, 33, 50, 100, 200, 500)
+
+    def __init__(self, window=WINDOW):
+        """Constructor
+
+        Args:
+            window: durations kept per stage
+        """
+        self._lock = threading.Lock()
+        self._window = window
+        self.Reset()
+
+    def Reset(self):
+        """Discard all the durations
+        """
+        try:
+            self._lock.acquire()
+            self._samples = dict((stage, collections.deque(maxlen=self._window))
+                                 for stage in VideoLatency.STAGES)
+            self._frames = 0
+        finally:
+            self._lock.release()
+
+    def Frame(self, frame, started, ended, sunk):
+        """Account the times of a processed frame
+
+        Args:
+            frame: VideoFrame (captured and decoded times, header)
+            started: time the callback started
+            ended: time the callback ended
+            sunk: time the last sink ended
+        """
+        try:
+            self._lock.acquire()
+            samples = self._samples
+            header = frame.header
+            if(header != None):
+                samples["receive"].append(header.received - header.started)
+            samples["decode"].append(frame.decoded - frame.captured)
+            samples["queue"].append(started - frame.decoded)
+            samples["callback"].append(ended - started)
+            samples["sink"].append(sunk - ended)
+            samples["total"].append(sunk - frame.captured)
+            self._frames = self._frames + 1
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _Percentile(ordered, p):
+        """Value of the percentile p (0-100) of a sorted list (nearest rank)
+        """
+        idx = int(round(p / 100.0 * (len(ordered) - 1)))
+        return ordered[idx]
+
+    def GetSnapshot(self):
+        """Get the statistics of every stage
+
+        Returns:
+            dict with frames (total processed) and, per stage, a dict with
+            count, mean, max, p50, p95, p99 (seconds) and histogram (list
+            of (upper bound ms or None, count)) over the last durations.
+            The stages without durations have count 0 and the times None
+        """
+        try:
+            self._lock.acquire()
+            samples = dict((stage, list(values)) for stage, values in self._samples.items())
+            frames = self._frames
+        finally:
+            self._lock.release()
+        result = {"frames": frames}
+        histogram = Histogram(VideoLatency.HISTOGRAM_MS)
+        for stage in VideoLatency.STAGES:
+            ordered = sorted(samples[stage])
+            histogram.Reset()
+            for value in ordered:
+                histogram.Add(value)
+            stats = {
+                "count": len(ordered),
+                "mean": None,
+                "max": None,
+                "p50": None,
+                "p95": None,
+                "p99": None,
+                "histogram": histogram.Get(),
+            }
+            if(ordered):
+                stats["mean"] = sum(ordered) / len(ordered)
+                stats["max"] = ordered[-1]
+                stats["p50"] = VideoLatency._Percentile(ordered, 50)
+                stats["p95"] = VideoLatency._Percentile(ordered, 95)
+                stats["p99"] = VideoLatency._Percentile(ordered, 99)
+            result[stage] = stats
+        return result
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+# OpenCV is imported only by the sinks that need it
+cv2 = None
+
+def _ImportCV2():
+    """Import OpenCV the first time it is needed
+    """
+    global cv2
+    if(cv2 is None):
+        import cv2
+
+
+class VideoSink:
+    """Destination of the processed video frames (see DisplaySink, FileSink,
+    CallbackSink and SharedMemorySink)
+
+    Video calls Write() in its TVideo thread with every frame processed
+    by the callback and Close() when it stops. A sink must not keep the
+    image after Write() returns (the buffer can be reused).
+
+    Usage:
+        class MySink(VideoSink):
+            def Write(self, frame, image):
+                ... frame is a VideoFrame (number, captured, fps, ...)
+
+        video = Video("192.168.1.1", callback, debug, sinks=[MySink()])
+    """
+
+    def Write(self, frame, image):
+        """Receive a frame
+
+        Args:
+            frame: VideoFrame with the metadata of the frame
+            image: the image returned by the callback
+        """
+        pass
+
+    def Close(self):
+        """Release the resources of the sink
+        """
+        pass
+
+
+class DisplaySink(VideoSink):
+    """Show the frames in an OpenCV window
+
+    The window is created with the first frame, in the TVideo thread
+    """
+
+    def __init__(self, winName="ARDrone2 Video", overlay=True):
+        """Constructor
+
+        Args:
+            winName: name of the window
+            overlay: If true, the FPS are drawn into the shown image (a copy,
+                     the other sinks get the image without them)
+        """
+        _ImportCV2()
+        self._winName = winName
+        self._overlay = overlay
+        self._open = False
+
+    def Write(self, frame, image):
+        if(not self._open):
+            cv2.namedWindow(self._winName, cv2.CV_WINDOW_AUTOSIZE)
+            self._open = True
+        if(self._overlay):
+            image = image.copy()
+            imgH = image.shape[0]
+            cv2.putText(image, "%04.2f FPS" % frame.fps, (10, imgH-10), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255))
+        cv2.imshow(self._winName, image)
+        cv2.waitKey(1)
+
+    def Close(self):
+        if(self._open):
+            cv2.destroyWindow(self._winName)
+            self._open = False
+
+
+class FileSink(VideoSink):
+    """Record the frames in a video file with cv2.VideoWriter
+
+    The file is created with the size of the first frame
+    """
+
+    def __init__(self, fileName, fps=30.0, fourcc="XVID"):
+        """Constructor
+
+        Args:
+            fileName: name of the video file
+            fps: frame rate of the file
+            fourcc: code of the codec (4 characters)
+        """
+        _ImportCV2()
+        self._fileName = fileName
+        self._fps = fps
+        self._fourcc = fourcc
+        self._writer = None
+        self._frames = 0
+
+    def Write(self, frame, image):
+        if(self._writer == None):
+            imgH, imgW = image.shape[:2]
+            self._writer = cv2.VideoWriter(self._fileName, cv2.VideoWriter_fourcc(*self._fourcc),
+                                           self._fps, (imgW, imgH), len(image.shape) == 3)
+        self._writer.write(image)
+        self._frames = self._frames + 1
+
+    def GetFrames(self):
+        """Get the number of frames written
+        """
+        return self._frames
+
+    def Close(self):
+        if(self._writer != None):
+            self._writer.release()
+            self._writer = None
+
+
+class CallbackSink(VideoSink):
+    """Call a method with every frame and its metadata
+
+        def callback(frame, image):
+            ... frame is a VideoFrame
+    """
+
+    def __init__(self, callback):
+        """Constructor
+
+        Args:
+            callback: method to call with every frame
+        """
+        self._callback = callback
+
+    def Write(self, frame, image):
+        self._callback(frame, image)
+
+
+class SharedMemorySink(VideoSink):
+    """Publish the frames in a FrameRing for other processes
+
+    The ring is created with the shape of the first frame; the frames of
+    a different shape are discarded (counted). The ring is created only
+    once: if it fails (e.g. a block with that name exists), the first
+    Write() throws the error and the next frames are discarded
+    """
+
+    def __init__(self, name, slots=8, replace=False):
+        """Constructor
+
+        Args:
+            name: name of the FrameRing (shared memory block)
+            slots: number of frames in the ring
+            replace: If true, an existing block with that name (e.g. left
+                     by a writer that crashed) is unlinked and created
+                     again; else creating the ring fails
+
+        Throws:
+            Exception if multiprocessing.shared_memory is not available
+        """
+        from FrameRing import FrameRing, shared_memory
+        if(shared_memory == None):
+            raise Exception("SharedMemorySink requires multiprocessing.shared_memory (Python 3.8+)")
+        self._FrameRing = FrameRing
+        self._sharedMemory = shared_memory
+        self._name = name
+        self._slots = slots
+        self._replace = replace
+        self._ring = None
+        self._error = None
+        self._discarded = 0
+
+    def _Create(self, shape):
+        """Create the ring, unlinking a stale block if replace was given
+        """
+        try:
+            return self._FrameRing(self._name, shape, self._slots)
+        except FileExistsError:
+            if(not self._replace):
+                raise
+        stale = self._sharedMemory.SharedMemory(name=self._name)
+        stale.close()
+        stale.unlink()
+        return self._FrameRing(self._name, shape, self._slots)
+
+    def Write(self, frame, image):
+        if(self._ring == None):
+            if(self._error != None):
+                self._discarded = self._discarded + 1
+                return
+            try:
+                self._ring = self._Create(image.shape)
+            except Exception as e:
+                self._error = e
+                self._discarded = self._discarded + 1
+                raise
+        if(image.shape != self._ring.GetShape()):
+            self._discarded = self._discarded + 1
+            return
+        self._ring.Write(image, frame.number, frame.captured)
+
+    def GetRing(self):
+        """Get the FrameRing (None before the first frame or if it could not
+        be created)
+        """
+        return self._ring
+
+    def GetError(self):
+        """Get the exception that prevented creating the ring, or None
+        """
+        return self._error
+
+    def GetDiscarded(self):
+        """Get the number of frames discarded for their shape or because
+        the ring could not be created
+        """
+        return self._discarded
+
+    def Close(self):
+        if(self._ring != None):
+            self._ring.Close()
+            self._ring = None
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import numpy
+
+# OpenCV is imported with the first transform
+cv2 = None
+
+def _ImportCV2():
+    """Import OpenCV the first time it is needed
+    """
+    global cv2
+    if(cv2 is None):
+        import cv2
+
+
+class VideoTransform:
+    """Transforms applied by Video to every frame before the callback
+
+    The transforms are declared once; the output buffers are allocated
+    with the first frame (and again only if the size of the frames
+    changes) and every operation writes into its buffer (dst=), so no
+    image is allocated per frame. The region of interest is a view of the
+    decoded image, and only that region is scaled, converted and flipped.
+    Without other transforms the region is copied into its buffer: the
+    decoded image is shared with GetFrame() and is never given to the
+    callback.
+
+    The callback gets a view of a reused buffer: it can modify it in
+    place, but must copy it to keep it after returning.
+
+    Usage:
+        # right half of the mirrored image, at half size and in gray
+        transform = VideoTransform(flip=True, roi=(320, 0, 320, 360), scale=0.5, gray=True)
+        drone = ARDrone2("192.168.1.1", debug, videoCallback=callback, videoTransform=transform)
+    """
+
+    def __init__(self, flip=True, roi=None, size=None, scale=None, gray=False):
+        """Constructor
+
+        Args:
+            flip: If true, mirror the image horizontally (as shown by Video)
+            roi: (x, y, width, height) of the region to keep, in the
+                 coordinates of the output image (mirrored if flip), or None
+                 for the whole image. Clipped to the image
+            size: (width, height) of the output image, or None
+            scale: factor for the size of the output image (e.g. 0.5), when
+                 size is None
+            gray: If true, convert the image to gray (2 dimensions)
+        """
+        _ImportCV2()
+        self._flip = flip
+        self._roi = roi
+        self._size = size
+        self._scale = scale
+        self._gray = gray
+        self._shape = None
+        self._outShape = None
+        self._crop = None
+        self._steps = []
+
+    def _Plan(self, shape):
+        """Compute the region and allocate the buffers for an input shape
+        """
+        imgH, imgW = shape[0], shape[1]
+        x, y, w, h = 0, 0, imgW, imgH
+        if(self._roi != None):
+            x, y, w, h = self._roi
+            x = min(max(x, 0), imgW - 1)
+            y = min(max(y, 0), imgH - 1)
+            w = min(w, imgW - x)
+            h = min(h, imgH - y)
+            if(self._flip):
+                # the region is given over the mirrored image
+                x = imgW - x - w
+        self._crop = (slice(y, y + h), slice(x, x + w))
+
+        channels = shape[2:]
+        steps = []
+        if(self._size != None or self._scale != None):
+            if(self._size != None):
+                outW, outH = self._size
+            else:
+                outW = max(int(w * self._scale), 1)
+                outH = max(int(h * self._scale), 1)
+            if((outW, outH) != (w, h)):
+                w, h = outW, outH
+                steps.append(("resize", numpy.empty((h, w) + channels, numpy.uint8)))
+        if(self._gray and channels):
+            channels = ()
+            steps.append(("gray", numpy.empty((h, w), numpy.uint8)))
+        if(self._flip):
+            steps.append(("flip", numpy.empty((h, w) + channels, numpy.uint8)))
+        if(not steps):
+            steps.append(("copy", numpy.empty((h, w) + channels, numpy.uint8)))
+        self._steps = steps
+        self._outShape = (h, w) + channels
+        self._shape = shape
+
+    def Apply(self, image):
+        """Apply the transforms to a frame
+
+        Args:
+            image: decoded image (numpy array)
+
+        Returns:
+            The transformed image: a view of an output buffer, never of
+            the image itself
+        """
+        if(image.shape != self._shape):
+            self._Plan(image.shape)
+        out = image[self._crop]
+        for op, dst in self._steps:
+            if(op == "resize"):
+                out = cv2.resize(out, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+            elif(op == "gray"):
+                out = cv2.cvtColor(out, cv2.COLOR_BGR2GRAY, dst=dst)
+            elif(op == "copy"):
+                numpy.copyto(dst, out)
+                out = dst
+            else:
+                out = cv2.flip(out, 1, dst=dst)
+        return out
+
+    def GetShape(self):
+        """Get the shape of the output images (None before the first frame)
+        """
+        return self._outShape
@@ -36,21 +36,19 @@ class MyApp:
         drone.TakeOff()
         time.sleep(3)
 
-        # lo elevamos a una altura razonable
-        t = time() + 3
-        while(time() < t):
-            drone.Move(0, 0, 0.3, 0)
+        # lo elevamos a una altura razonable (el drone repite el movimiento
+        # cada 30ms hasta que se indique otro)
+        drone.Move(0, 0, 0.3, 0)
+        time.sleep(3)
 
         # un efecto de luces estando suspendido sin movimiento
+        drone.Hover()
         drone.LedsAnim(2, 10, 4)
-        t = time() + 4
-        while(time() < t):
-            drone.Hover()
+        time.sleep(4)
 
         # lo rotamos en su eje
-        t = time() + 3
-        while(time() < t):
-            drone.Move(0, 0, 0, 1)
+        drone.Move(0, 0, 0, 1)
+        time.sleep(3)
 
         # finalizamos el procesamiento
         drone.Land()
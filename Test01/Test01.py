@@ -89,12 +89,12 @@ class MyApp:
         pass
 
     # filtramos el video cuadro a cuadro aplicando Canny para la detección de bordes
+    # img es un buffer de Video que se reutiliza: se modifica en el lugar, sin copiarlo
     def VideoFilter(self, img):
         imgH, imgW, depth = img.shape
-        frame = img.copy()
 
-        # la mitad derecha
-        mitad = img[:,imgW/2:]
+        # la mitad derecha (una vista, sin copia)
+        mitad = img[:,imgW//2:]
 
         # necesario
         gray = cv2.cvtColor(mitad, cv2.COLOR_BGR2GRAY)
@@ -107,8 +107,8 @@ class MyApp:
         final = cv2.GaussianBlur(canny, (3,3), 0)
 
         # reemplazamos la mitad procesada
-        frame[:,imgW/2:]=cv2.cvtColor(~final, cv2.COLOR_GRAY2BGR)
-        return frame
+        mitad[:]=cv2.cvtColor(~final, cv2.COLOR_GRAY2BGR)
+        return img
 
 
 def main():